@@ -0,0 +1,148 @@
+"""
+Бенчмарк конвейера ИИ (диспетчер → get_ai_response → провайдер) без сети.
+
+По умолчанию поднимает fake-сервер (bench/fake_llm_server.py) в том же процессе,
+направляет на него клиентов Groq/Gemini и прогоняет запросы на нескольких
+уровнях параллелизма. Для каждого уровня выводит пропускную способность,
+p50/p95/p99 полной задержки (включая ожидание в очереди диспетчера),
+число сброшенных запросов и запросов, где упали все модели.
+
+Запуск из корня репозитория:
+    python -m bench.bench_ai
+    python -m bench.bench_ai --service gemini --levels 1,16,64 --requests 200
+    python -m bench.bench_ai --error-rate 0.1 --fail-models llama3-70b-8192
+    python -m bench.bench_ai --server-url http://127.0.0.1:8787   # внешний fake-сервер
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from typing import List
+
+from bench.fake_llm_server import add_config_arguments, config_from_args, start_server_in_thread
+
+QUESTIONS = [
+    "Не подключается VPN на телефоне, что делать?",
+    "Как продлить подписку?",
+    "Какой протокол выбрать для Windows?",
+    "Медленная скорость вечером",
+    "Где взять ссылку на подписку?",
+]
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль по отсортированному списку (ближайший ранг)."""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(q * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+async def run_level(concurrency: int, total: int, service: str, use_memory: bool) -> dict:
+    """Прогоняет total запросов при concurrency одновременных клиентах."""
+    from bot import ai_stats
+    from bot.ai_dispatcher import AIQueueTimeout, PRIORITY_PRIVATE, ai_dispatcher
+    from bot.ai_integration import get_ai_response
+
+    exhausted_before = _exhausted_count(ai_stats, service)
+    latencies: List[float] = []
+    shed = 0
+    counter = iter(range(total))
+
+    async def client(worker_id: int):
+        nonlocal shed
+        for i in counter:
+            # Разные user_id, чтобы не срабатывал штраф диспетчера за частые запросы
+            user_id = 10_000_000 + i if use_memory else None
+            question = QUESTIONS[i % len(QUESTIONS)]
+            started = time.perf_counter()
+            try:
+                await ai_dispatcher.submit(
+                    lambda: get_ai_response(question, service, user_id=user_id),
+                    user_id=user_id,
+                    priority=PRIORITY_PRIVATE,
+                )
+            except AIQueueTimeout:
+                shed += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(n) for n in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "elapsed": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "mean": statistics.fmean(latencies) if latencies else 0.0,
+        "shed": shed,
+        "failed": _exhausted_count(ai_stats, service) - exhausted_before,
+    }
+
+
+def _exhausted_count(ai_stats, service: str) -> int:
+    return ai_stats.get_failover_stats().get(service, {}).get("exhausted", 0)
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    stop = server = None
+    base_url = args.server_url
+    if not base_url:
+        # Отдельный поток: медленный клиент не должен задерживать ответы сервера
+        stop, server, base_url = start_server_in_thread(config_from_args(args))
+
+    # Клиенты ИИ читают адреса при импорте bot.config / bot.ai_integration
+    os.environ["GROQ_BASE_URL"] = base_url
+    os.environ["GEMINI_API_ENDPOINT"] = base_url
+    os.environ.setdefault("GROQ_API_KEY", "fake")
+    os.environ.setdefault("GEMINI_API_KEY", "fake")
+    os.environ.setdefault("BOT_TOKEN", "123456:bench")
+
+    from bot.ai_dispatcher import AIDispatcherConfig, ai_dispatcher
+
+    ai_dispatcher.configure(AIDispatcherConfig(
+        max_concurrency=args.ai_concurrency,
+        max_queue_wait=args.max_queue_wait,
+        max_queue_size=args.max_queue_size,
+    ))
+
+    levels = [int(x) for x in args.levels.split(",") if x.strip()]
+    print(f"Fake LLM: {base_url} | service={args.service} | latency={args.latency} | "
+          f"ai_max_concurrency={args.ai_concurrency}")
+    print(f"{'clients':>8} {'req':>6} {'rps':>8} {'p50':>7} {'p95':>7} {'p99':>7} {'mean':>7} {'shed':>5} {'failed':>6}")
+    try:
+        for level in levels:
+            r = await run_level(level, args.requests, args.service, args.memory)
+            print(f"{r['concurrency']:>8} {r['requests']:>6} {r['throughput']:>8.2f} "
+                  f"{r['p50']:>7.3f} {r['p95']:>7.3f} {r['p99']:>7.3f} {r['mean']:>7.3f} "
+                  f"{r['shed']:>5} {r['failed']:>6}")
+    finally:
+        if server is not None:
+            print(f"Fake server: {server.stats}")
+        if stop is not None:
+            stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="AI pipeline benchmark against a local fake LLM server")
+    parser.add_argument("--service", choices=("groq", "gemini"), default="groq")
+    parser.add_argument("--levels", default="1,8,32,128", help="Уровни параллелизма клиентов через запятую")
+    parser.add_argument("--requests", type=int, default=128, help="Запросов на каждом уровне")
+    parser.add_argument("--ai-concurrency", type=int, default=4, help="ai_max_concurrency диспетчера")
+    parser.add_argument("--max-queue-wait", type=float, default=20.0)
+    parser.add_argument("--max-queue-size", type=int, default=200)
+    parser.add_argument("--memory", action="store_true", help="Передавать user_id (история диалога)")
+    parser.add_argument("--server-url", default="", help="Использовать уже запущенный fake-сервер")
+    add_config_arguments(parser)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Бенчмарк аналитики пользователей: колоночный снимок (bot/user_columns.py)
+против прохода по словарям users.json с разбором ISO-дат.
+
+Считаются те же вопросы, что и на экране «📈 Аналитика»: давность активности,
+языки, перцентили сообщений, недельные когорты. Колоночный путь использует
+NumPy, если он установлен (иначе циклы по массивам `array`).
+
+Запуск из корня репозитория:
+    python -m bench.bench_user_analytics
+    python -m bench.bench_user_analytics --users 1000000 --repeat 3
+"""
+import argparse
+import random
+import time
+from datetime import datetime
+
+from bot import user_columns
+from bot.user_columns import ACTIVITY_BUCKETS, DAY, WEEK, UserColumns
+
+LANGUAGES = ["ru", "ru", "ru", "en", "en-US", "uk", "de", None]
+
+
+def generate(count: int, seed: int = 1) -> dict:
+    """Синтетические записи users.json."""
+    rnd = random.Random(seed)
+    now = int(time.time())
+    users = {}
+    for n in range(count):
+        uid = 100_000_000 + n
+        first = now - rnd.randrange(120 * DAY)
+        last = min(now, first + int(rnd.expovariate(1 / (10 * DAY))))
+        users[str(uid)] = {
+            "user_id": uid,
+            "first_seen": datetime.utcfromtimestamp(first).isoformat() + "+00:00",
+            "last_seen": datetime.utcfromtimestamp(last).isoformat() + "+00:00",
+            "message_count": int(rnd.paretovariate(1.3)),
+            "language_code": rnd.choice(LANGUAGES),
+            "blocked": rnd.random() < 0.01,
+        }
+    return users
+
+
+def _ts(value):
+    return int(datetime.fromisoformat(value).timestamp()) if value else 0
+
+
+def dict_analytics(users: dict, now: int) -> dict:
+    """Прежний путь: каждый запрос разбирает словари и строки."""
+    edges = [now - days * DAY for days in ACTIVITY_BUCKETS]
+    activity = [0] * (len(edges) + 1)
+    langs: dict = {}
+    counts = []
+    cohorts = [[0, 0, 0] for _ in range(8)]
+    for user in users.values():
+        last = _ts(user.get("last_seen"))
+        i = 0
+        while i < len(edges) and last < edges[i]:
+            i += 1
+        activity[i] += 1
+        lang = (user.get("language_code") or "unknown").split("-")[0]
+        langs[lang] = langs.get(lang, 0) + 1
+        counts.append(user.get("message_count", 0))
+        first = _ts(user.get("first_seen"))
+        if now - 8 * WEEK < first <= now:
+            cohort = cohorts[min(7, (now - first) // WEEK)]
+            cohort[0] += 1
+            cohort[1] += last >= first + WEEK
+            cohort[2] += last > now - WEEK
+    counts.sort()
+    percentiles = {p: counts[min(len(counts) - 1, max(0, -(-p * len(counts) // 100) - 1))] for p in (50, 90, 99)}
+    return {"activity": activity, "languages": langs, "percentiles": percentiles, "cohorts": cohorts}
+
+
+def column_analytics(columns: UserColumns, now: int) -> dict:
+    return {
+        "activity": columns.activity_distribution(now),
+        "languages": columns.language_split(),
+        "percentiles": columns.message_percentiles((50, 90, 99)),
+        "cohorts": columns.cohort_retention(now, weeks=8),
+    }
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="User analytics benchmark: columns vs dicts")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--batch", type=int, default=1000, help="Размер пачки обновлений снимка")
+    args = parser.parse_args()
+
+    users = generate(args.users)
+    now = int(time.time())
+    backend = "numpy" if user_columns.np is not None else "array"
+
+    columns = UserColumns()
+    build = timed(lambda: columns.load(users.values()), 1)
+    print(f"users={args.users} backend={backend} snapshot build={build:.2f}s")
+
+    dict_time = timed(lambda: dict_analytics(users, now), args.repeat)
+    column_time = timed(lambda: column_analytics(columns, now), args.repeat)
+    print(f"dict path    {dict_time * 1000:9.1f} ms")
+    print(f"columns      {column_time * 1000:9.1f} ms  (x{dict_time / column_time:.1f})")
+
+    batch = list(users.values())[:args.batch]
+    for user in batch:
+        user["message_count"] += 1
+    batch_time = timed(lambda: [columns.set_row(user) for user in batch], 1)
+    print(f"batch update {args.batch} rows: {batch_time * 1000:.1f} ms")
+
+    expected = dict_analytics(users, now)
+    got = column_analytics(columns, now)
+    assert expected["percentiles"] == got["percentiles"], (expected["percentiles"], got["percentiles"])
+    assert expected["activity"] == [count for _, count in got["activity"]]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Бенчмарк поиска пользователей админ-панели.
+
+Генерирует синтетическую базу (имена кириллицей и латиницей, username),
+строит UserIndex и сравнивает задержку поиска по индексу с прежним
+перебором всех пользователей (подстрока в ID / имени / username).
+
+Запуск из корня репозитория:
+    python -m bench.bench_user_search
+    python -m bench.bench_user_search --users 1000000 --repeat 20
+"""
+import argparse
+import random
+import resource
+import statistics
+import time
+from typing import Callable, List
+
+from bot.user_index import UserIndex
+
+FIRST_NAMES = [
+    "Иван", "Пётр", "Анна", "Мария", "Юрий", "Ольга", "Сергей", "Наталья", "Дмитрий", "Елена",
+    "Alex", "John", "Maria", "Kate", "Oleg", "Ivan", "Nikita", "Sofia", "Max", "Olga",
+]
+LAST_NAMES = [
+    "Иванов", "Петрова", "Смирнов", "Кузнецова", "Попов", "Соколова", "Лебедев", "Козлова",
+    "Smith", "Brown", "Novak", "Petrov", "Sidorov", "Orlova", "Volkov", "Morozova",
+]
+QUERIES = ["иван", "ivan", "petrov", "ольга", "ova", "al", "u", "user123", "ivan pet", "zzzz"]
+
+
+def generate(count: int, seed: int = 1) -> dict:
+    """Синтетический users.json (только поля, которые читает индекс)."""
+    rnd = random.Random(seed)
+    users = {}
+    now = int(time.time())
+    for n in range(count):
+        uid = 100_000_000 + n
+        name = f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}"
+        username = f"user{n}" if rnd.random() < 0.6 else None
+        seen = time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(now - rnd.randrange(90 * 86400)))
+        users[str(uid)] = {"user_id": uid, "name": name, "username": username, "last_seen": seen}
+    return {"users": users, "blocked": [], "unreachable": {}}
+
+
+def linear_search(users: list, query: str) -> list:
+    """Прежний поиск: подстрока по всем пользователям."""
+    query = query.strip().lower()
+    results = []
+    for user in users:
+        uid = str(user.get('user_id', ''))
+        name = (user.get('name') or '').lower()
+        username = (user.get('username') or '').lower()
+        if query in uid or query in name or query in username:
+            results.append(user)
+    return results
+
+
+def measure(fn: Callable[[str], object], queries: List[str], repeat: int) -> List[float]:
+    timings = []
+    for _ in range(repeat):
+        for query in queries:
+            started = time.perf_counter()
+            fn(query)
+            timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings
+
+
+def report(label: str, timings: List[float]) -> None:
+    p50 = timings[len(timings) // 2]
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(f"{label:<10} p50={p50 * 1000:9.3f} ms  p99={p99 * 1000:9.3f} ms  "
+          f"mean={statistics.fmean(timings) * 1000:9.3f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Admin user search benchmark")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=10, help="Повторов каждого запроса для индекса")
+    parser.add_argument("--linear-repeat", type=int, default=1, help="Повторов для перебора (0 — пропустить)")
+    args = parser.parse_args()
+
+    data = generate(args.users)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    index = UserIndex()
+    started = time.perf_counter()
+    index.rebuild(data)
+    build = time.perf_counter() - started
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"users={args.users} build={build:.1f}s rss_growth≈{(rss_after - rss_before) / 1024:.0f} MB")
+
+    for query in QUERIES:
+        ids, total = index.find(query, limit=10)
+        print(f"  {query!r:<12} найдено={total:<8} top={ids[:3]}")
+
+    report("index", measure(lambda q: index.find(q, limit=10), QUERIES, args.repeat))
+
+    # Точечное обновление (как в track_user)
+    uid = 100_000_000
+    user = dict(data["users"][str(uid)], name="Зинаида Тестова", username="zina_test")
+    started = time.perf_counter()
+    index.update_user(uid, user)
+    print(f"update_user: {(time.perf_counter() - started) * 1000:.3f} ms; "
+          f"'зинаида' → {index.find('зинаида')[0]}")
+
+    if args.linear_repeat:
+        users = list(data["users"].values())
+        report("linear", measure(lambda q: linear_search(users, q), QUERIES, args.linear_repeat))
+
+
+if __name__ == "__main__":
+    main()
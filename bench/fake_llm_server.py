@@ -0,0 +1,356 @@
+"""
+Локальный fake-сервер провайдеров ИИ для нагрузочного тестирования.
+
+Отвечает в форматах:
+- Groq (OpenAI-совместимый): POST /openai/v1/chat/completions (+ stream=true, SSE)
+- Gemini REST: POST /v1beta/models/{model}:generateContent
+               POST /v1beta/models/{model}:streamGenerateContent (?alt=sse или JSON-массив)
+
+Настраивается задержка (распределение), доля ошибок 500, доля 429,
+лимит одновременных запросов (сверх него — 429) и модели, которые всегда падают
+(для проверки failover).
+
+Запуск:
+    python -m bench.fake_llm_server --port 8787 --latency lognormal:-0.5,0.4 --error-rate 0.02
+
+Бот против него:
+    GROQ_BASE_URL=http://127.0.0.1:8787 GROQ_API_KEY=fake \\
+    GEMINI_API_ENDPOINT=http://127.0.0.1:8787 GEMINI_API_KEY=fake python main.py
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Callable, Optional, Set
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+WORDS = (
+    "подключение сервер протокол приложение настройки подписка оплата устройство "
+    "попробуйте перезапустить выберите другой профиль обновите версию connection "
+    "server protocol settings device please retry"
+).split()
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """
+    Разбирает описание распределения задержки (секунды):
+        fixed:0.5
+        uniform:0.2,1.5
+        normal:0.8,0.2        (среднее, отклонение; отрицательные обрезаются до 0)
+        lognormal:-0.5,0.4    (mu, sigma натурального логарифма)
+        exp:0.7               (среднее)
+    """
+    kind, _, params = spec.partition(":")
+    values = [float(x) for x in params.split(",") if x.strip()] if params else []
+    if kind == "fixed":
+        value = values[0] if values else 0.0
+        return lambda: value
+    if kind == "uniform":
+        low, high = values
+        return lambda: random.uniform(low, high)
+    if kind == "normal":
+        mu, sigma = values
+        return lambda: max(0.0, random.gauss(mu, sigma))
+    if kind == "lognormal":
+        mu, sigma = values
+        return lambda: random.lognormvariate(mu, sigma)
+    if kind == "exp":
+        mean = values[0]
+        return lambda: random.expovariate(1.0 / mean)
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+@dataclass
+class FakeLLMConfig:
+    """Поведение fake-сервера."""
+    latency: Callable[[], float] = field(default=lambda: 0.5)
+    error_rate: float = 0.0  # Доля ответов 500
+    rate_limit_rate: float = 0.0  # Доля ответов 429
+    max_concurrency: int = 0  # Сверх этого — 429 (0 — без лимита)
+    fail_models: Set[str] = field(default_factory=set)  # Эти модели всегда отвечают 500
+    completion_tokens: int = 60  # Длина ответа в токенах (словах)
+    stream_chunks: int = 8  # На сколько частей делить потоковый ответ
+
+
+class FakeLLMServer:
+    """aiohttp-приложение, имитирующее Groq и Gemini."""
+
+    def __init__(self, config: FakeLLMConfig):
+        self.config = config
+        self.in_flight = 0
+        self.stats = {'requests': 0, 'ok': 0, 'errors': 0, 'rate_limited': 0}
+
+    # ------------------------------------------------------------------
+    # Общая логика
+    # ------------------------------------------------------------------
+
+    def _answer_words(self) -> list:
+        return [random.choice(WORDS) for _ in range(self.config.completion_tokens)]
+
+    @staticmethod
+    def _count_tokens(text: str) -> int:
+        return max(1, len(text) // 3)
+
+    def _injected_failure(self, model: str) -> Optional[web.Response]:
+        """Возвращает ответ-ошибку, если её нужно сымитировать."""
+        cfg = self.config
+        if cfg.max_concurrency and self.in_flight > cfg.max_concurrency:
+            return self._error(429, "Rate limit reached (concurrency)")
+        if cfg.rate_limit_rate and random.random() < cfg.rate_limit_rate:
+            return self._error(429, "Rate limit reached")
+        if model in cfg.fail_models or (cfg.error_rate and random.random() < cfg.error_rate):
+            return self._error(500, "Internal server error (injected)")
+        return None
+
+    def _error(self, status: int, message: str) -> web.Response:
+        if status == 429:
+            self.stats['rate_limited'] += 1
+        else:
+            self.stats['errors'] += 1
+        headers = {"retry-after": "1"} if status == 429 else None
+        return web.json_response(
+            {"error": {"message": message, "type": "fake_error", "code": status}},
+            status=status,
+            headers=headers,
+        )
+
+    async def _handle(self, model: str, prompt_text: str, stream: bool, request: web.Request, shape: str):
+        self.stats['requests'] += 1
+        self.in_flight += 1
+        try:
+            failure = self._injected_failure(model)
+            if failure is not None:
+                await asyncio.sleep(self.config.latency() * 0.1)
+                return failure
+
+            latency = self.config.latency()
+            words = self._answer_words()
+            prompt_tokens = self._count_tokens(prompt_text)
+
+            if not stream:
+                await asyncio.sleep(latency)
+                self.stats['ok'] += 1
+                text = " ".join(words)
+                if shape == "openai":
+                    return web.json_response(self._openai_completion(model, text, prompt_tokens, len(words)))
+                return web.json_response(self._gemini_response(text, prompt_tokens, len(words)))
+
+            return await self._stream(request, model, words, prompt_tokens, latency, shape)
+        finally:
+            self.in_flight -= 1
+
+    async def _stream(self, request, model, words, prompt_tokens, latency, shape):
+        """Потоковый ответ: первая часть после половины задержки, остальные равномерно."""
+        sse = shape == "openai" or request.query.get("alt") == "sse"
+        response = web.StreamResponse(
+            headers={"Content-Type": "text/event-stream" if sse else "application/json"}
+        )
+        await response.prepare(request)
+
+        chunks = max(1, self.config.stream_chunks)
+        size = max(1, len(words) // chunks)
+        parts = [words[i:i + size] for i in range(0, len(words), size)]
+        await asyncio.sleep(latency / 2)
+        step = (latency / 2) / len(parts)
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        if not sse:
+            await response.write(b"[")
+        for i, part in enumerate(parts):
+            text = " ".join(part) + " "
+            last = i == len(parts) - 1
+            if shape == "openai":
+                payload = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "delta": {"role": "assistant", "content": text} if i == 0 else {"content": text},
+                        "finish_reason": "stop" if last else None,
+                    }],
+                }
+                if last:
+                    payload["x_groq"] = {"usage": self._usage(prompt_tokens, len(words))}
+            else:
+                payload = self._gemini_response(text, prompt_tokens, len(words) if last else 0, final=last)
+
+            body = json.dumps(payload, ensure_ascii=False)
+            if sse:
+                await response.write(f"data: {body}\n\n".encode("utf-8"))
+            else:
+                await response.write((body + ("" if last else ",")).encode("utf-8"))
+            await asyncio.sleep(step)
+
+        if shape == "openai":
+            await response.write(b"data: [DONE]\n\n")
+        elif not sse:
+            await response.write(b"]")
+        self.stats['ok'] += 1
+        await response.write_eof()
+        return response
+
+    # ------------------------------------------------------------------
+    # Форматы ответов
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _usage(prompt_tokens: int, completion_tokens: int) -> dict:
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    def _openai_completion(self, model: str, text: str, prompt_tokens: int, completion_tokens: int) -> dict:
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop",
+                "logprobs": None,
+            }],
+            "usage": self._usage(prompt_tokens, completion_tokens),
+            "system_fingerprint": "fp_fake",
+        }
+
+    @staticmethod
+    def _gemini_response(text: str, prompt_tokens: int, completion_tokens: int, final: bool = True) -> dict:
+        candidate = {
+            "content": {"parts": [{"text": text}], "role": "model"},
+            "index": 0,
+        }
+        if final:
+            candidate["finishReason"] = "STOP"
+        return {
+            "candidates": [candidate],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "candidatesTokenCount": completion_tokens,
+                "totalTokenCount": prompt_tokens + completion_tokens,
+            },
+        }
+
+    # ------------------------------------------------------------------
+    # Маршруты
+    # ------------------------------------------------------------------
+
+    async def openai_chat(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        prompt_text = " ".join(str(m.get("content", "")) for m in body.get("messages", []))
+        return await self._handle(body.get("model", ""), prompt_text, bool(body.get("stream")), request, "openai")
+
+    async def gemini_generate(self, request: web.Request) -> web.StreamResponse:
+        model, _, action = request.match_info["model_action"].partition(":")
+        if action not in ("generateContent", "streamGenerateContent"):
+            return web.json_response({"error": {"message": f"Unknown action {action}"}}, status=404)
+        body = await request.json()
+        texts = [body.get("systemInstruction", {}) or {}] + list(body.get("contents", []))
+        prompt_text = " ".join(
+            str(part.get("text", "")) for content in texts for part in content.get("parts", [])
+        )
+        return await self._handle(model, prompt_text, action == "streamGenerateContent", request, "gemini")
+
+    async def stats_handler(self, request: web.Request) -> web.Response:
+        return web.json_response({**self.stats, "in_flight": self.in_flight})
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/openai/v1/chat/completions", self.openai_chat)
+        app.router.add_post("/v1beta/models/{model_action}", self.gemini_generate)
+        app.router.add_get("/stats", self.stats_handler)
+        return app
+
+
+async def start_server(config: FakeLLMConfig, host: str = "127.0.0.1", port: int = 0):
+    """
+    Запускает сервер в текущем event loop.
+
+    Returns:
+        (runner, server, base_url) — runner.cleanup() для остановки
+    """
+    server = FakeLLMServer(config)
+    runner = web.AppRunner(server.make_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host=host, port=port)
+    await site.start()
+    actual_port = site._server.sockets[0].getsockname()[1]
+    return runner, server, f"http://{host}:{actual_port}"
+
+
+def start_server_in_thread(config: FakeLLMConfig, host: str = "127.0.0.1", port: int = 0):
+    """
+    Запускает сервер в отдельном потоке со своим event loop.
+
+    Так задержки сервера не искажаются нагрузкой самого бенчмарка
+    (и наоборот), а клиент может делать синхронные вызовы.
+
+    Returns:
+        (stop, server, base_url) — stop() останавливает сервер и поток
+    """
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, name="fake-llm", daemon=True)
+    thread.start()
+    runner, server, base_url = asyncio.run_coroutine_threadsafe(
+        start_server(config, host, port), loop
+    ).result()
+
+    def stop() -> None:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+    return stop, server, base_url
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    """Аргументы командной строки для FakeLLMConfig (общие с бенчмарком)."""
+    parser.add_argument("--latency", default="lognormal:-0.7,0.5",
+                        help="Распределение задержки: fixed:S | uniform:A,B | normal:M,SD | lognormal:MU,SIGMA | exp:MEAN")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Доля ответов 429")
+    parser.add_argument("--provider-concurrency", type=int, default=0,
+                        help="Одновременных запросов, сверх которых сервер отвечает 429 (0 — без лимита)")
+    parser.add_argument("--fail-models", default="", help="Модели через запятую, которые всегда отвечают 500")
+    parser.add_argument("--completion-tokens", type=int, default=60)
+
+
+def config_from_args(args: argparse.Namespace) -> FakeLLMConfig:
+    return FakeLLMConfig(
+        latency=parse_latency(args.latency),
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        max_concurrency=args.provider_concurrency,
+        fail_models={m.strip() for m in args.fail_models.split(",") if m.strip()},
+        completion_tokens=args.completion_tokens,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake Groq/Gemini server for offline AI benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    server = FakeLLMServer(config_from_args(args))
+    logger.info(f"Fake LLM server on http://{args.host}:{args.port}")
+    web.run_app(server.make_app(), host=args.host, port=args.port, access_log=None, print=None)
+
+
+if __name__ == "__main__":
+    main()
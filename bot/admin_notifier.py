@@ -0,0 +1,333 @@
+"""
+Очередь уведомлений админу (и чатам уведомлений групп).
+
+Пересылки сообщений пользователей, карточки и уведомления о новых
+пользователях не отправляются прямо из хэндлера, а ставятся в очередь
+своего чата. У каждого чата свой воркер; темп чата (~1 сообщение в секунду —
+столько Telegram пропускает в один чат) и повторы после TelegramRetryAfter
+обеспечивает общий планировщик отправки (send_scheduler):
+
+1. Приоритеты: пересылки сообщений раньше уведомлений о новых пользователях
+2. Под нагрузкой текстовые сообщения одного пользователя склеиваются:
+   - ещё не отправленное уведомление дополняется новым текстом;
+   - если очередь чата занята (или чат на паузе RetryAfter), а предыдущее
+     уведомление пользователя уже отправлено недавно, оно редактируется на месте
+
+Глубина очереди — метрика admin_notify_queue_depth.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+
+from bot.metrics import registry
+from bot.send_scheduler import SEND_ADMIN, SEND_NOTIFICATION, send_scheduler, set_send_priority
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты (меньше — раньше)
+PRIORITY_FORWARD = 0
+PRIORITY_NEW_USER = 10
+
+# Лимит длины текста сообщения Telegram
+MAX_TEXT_LENGTH = 4096
+
+ADMIN_NOTIFY_QUEUE_DEPTH = registry.gauge("admin_notify_queue_depth", "Уведомлений админу в очереди")
+ADMIN_NOTIFY = registry.counter(
+    "admin_notify_total", "Уведомлений админу по результату", ["result"]
+)
+ADMIN_NOTIFY_WAIT = registry.histogram(
+    "admin_notify_wait_seconds",
+    "Время от постановки уведомления в очередь до отправки",
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0),
+)
+
+
+@dataclass
+class AdminNotifierConfig:
+    """Конфигурация очереди уведомлений."""
+    max_queue_size: int = 1000  # На чат; дальше вытесняются наименее важные
+    coalesce_window: float = 60.0  # Редактировать отправленное не позже (сек)
+    coalesce_backlog: int = 3  # «Под нагрузкой» — столько уведомлений в очереди чата
+    stop_timeout: float = 5.0  # Дослать очередь при остановке бота (сек)
+
+
+@dataclass(order=True)
+class _Notice:
+    priority: int
+    seq: int
+    bot: Bot = field(compare=False)
+    chat_id: int = field(compare=False)
+    key: Optional[Hashable] = field(compare=False, default=None)
+    # Текстовое уведомление: заголовок (карточка) и склеиваемые части
+    header: str = field(compare=False, default="")
+    parts: List[str] = field(compare=False, default_factory=list)
+    reply_markup: Any = field(compare=False, default=None)
+    edit_message_id: Optional[int] = field(compare=False, default=None)
+    # Прочие уведомления (медиа): вызов отправки
+    send: Optional[Callable[[], Awaitable[Any]]] = field(compare=False, default=None)
+    enqueued_at: float = field(compare=False, default_factory=time.monotonic)
+    pending: bool = field(compare=False, default=True)
+
+    @property
+    def text(self) -> str:
+        body = "\n\n".join(self.parts)
+        return f"{self.header}\n\n{body}" if self.header else body
+
+    def can_append(self, part: str) -> bool:
+        return self.send is None and len(self.text) + len(part) + 2 <= MAX_TEXT_LENGTH
+
+
+@dataclass
+class _Sent:
+    message_id: int
+    header: str
+    parts: List[str]
+    reply_markup: Any
+    sent_at: float
+
+
+class _ChatQueue:
+    def __init__(self, chat_id: int):
+        self.chat_id = chat_id
+        self.heap: List[_Notice] = []
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.sending = False
+
+    @property
+    def busy(self) -> bool:
+        return send_scheduler.paused(self.chat_id)
+
+
+class AdminNotifier:
+    """
+    Очереди уведомлений по чатам с темпом, приоритетами и склейкой.
+
+    Использование:
+        admin_notifier.send_text(bot, ADMIN_ID, body, header=card, key=("private", user_id))
+        admin_notifier.send_custom(bot, ADMIN_ID, lambda: bot.send_photo(...))
+    """
+
+    def __init__(self, config: Optional[AdminNotifierConfig] = None):
+        self.config = config or AdminNotifierConfig()
+        self._queues: Dict[int, _ChatQueue] = {}
+        self._seq = itertools.count()
+        # Последнее уведомление по (чат, ключ): ещё в очереди или уже отправленное
+        self._tail: Dict[Tuple[int, Hashable], _Notice] = {}
+        self._sent: Dict[Tuple[int, Hashable], _Sent] = {}
+
+        self.stats = {
+            'queued': 0,
+            'sent': 0,
+            'merged': 0,
+            'edited': 0,
+            'dropped': 0,
+            'failed': 0,
+        }
+
+    def configure(self, config: AdminNotifierConfig) -> None:
+        """Применяет новую конфигурацию (используется при старте)."""
+        self.config = config
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(queue.heap) for queue in self._queues.values())
+
+    def get_stats(self) -> dict:
+        return {**self.stats, 'queue_depth': self.queue_depth}
+
+    # ------------------------------------------------------------------
+    # Постановка в очередь
+    # ------------------------------------------------------------------
+
+    def send_text(
+        self,
+        bot: Bot,
+        chat_id: int,
+        body: str,
+        header: str = "",
+        key: Optional[Hashable] = None,
+        reply_markup: Any = None,
+        priority: int = PRIORITY_FORWARD,
+    ) -> None:
+        """
+        Текстовое уведомление. С key (например, ("private", user_id))
+        следующие тексты того же ключа склеиваются с ним под нагрузкой.
+        """
+        queue = self._queue(chat_id)
+        if key is not None:
+            tail = self._tail.get((chat_id, key))
+            if tail is not None and tail.pending and tail.can_append(body):
+                # Ещё не отправлено — дополняем
+                tail.parts.append(body)
+                self._count('merged')
+                return
+            sent = self._sent.get((chat_id, key))
+            if (
+                sent is not None
+                and (len(queue.heap) >= self.config.coalesce_backlog or queue.busy)
+                and time.monotonic() - sent.sent_at <= self.config.coalesce_window
+                and tail is not None and not tail.pending and tail.send is None
+            ):
+                notice = _Notice(
+                    priority, next(self._seq), bot, chat_id, key,
+                    header=sent.header, parts=[*sent.parts, body],
+                    reply_markup=sent.reply_markup, edit_message_id=sent.message_id,
+                )
+                if len(notice.text) <= MAX_TEXT_LENGTH:
+                    self._push(queue, notice)
+                    return
+        notice = _Notice(
+            priority, next(self._seq), bot, chat_id, key,
+            header=header, parts=[body], reply_markup=reply_markup,
+        )
+        self._push(queue, notice)
+
+    def send_custom(
+        self,
+        bot: Bot,
+        chat_id: int,
+        send: Callable[[], Awaitable[Any]],
+        key: Optional[Hashable] = None,
+        priority: int = PRIORITY_FORWARD,
+    ) -> None:
+        """
+        Любое другое уведомление (фото, документ, альбом): send() вызывается
+        в очереди чата. key сохраняет порядок
+        относительно текстов того же ключа.
+        """
+        self._push(self._queue(chat_id), _Notice(priority, next(self._seq), bot, chat_id, key, send=send))
+
+    def _queue(self, chat_id: int) -> _ChatQueue:
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = _ChatQueue(chat_id)
+        if queue.task is None or queue.task.done():
+            queue.task = asyncio.create_task(self._worker(queue))
+        return queue
+
+    def _push(self, queue: _ChatQueue, notice: _Notice) -> None:
+        if len(queue.heap) >= self.config.max_queue_size:
+            worst = max(queue.heap)
+            if notice > worst:
+                logger.warning(f"Admin notify queue for {queue.chat_id} is full, dropping notice")
+                self._count('dropped')
+                return
+            queue.heap.remove(worst)
+            heapq.heapify(queue.heap)
+            worst.pending = False
+            self._count('dropped')
+        heapq.heappush(queue.heap, notice)
+        if notice.key is not None:
+            self._tail[(queue.chat_id, notice.key)] = notice
+        self.stats['queued'] += 1
+        ADMIN_NOTIFY_QUEUE_DEPTH.set(self.queue_depth)
+        queue.wakeup.set()
+
+    def _count(self, result: str) -> None:
+        self.stats[result] += 1
+        ADMIN_NOTIFY.labels(result=result).inc()
+
+    # ------------------------------------------------------------------
+    # Отправка
+    # ------------------------------------------------------------------
+
+    async def _worker(self, queue: _ChatQueue) -> None:
+        while True:
+            while not queue.heap:
+                queue.wakeup.clear()
+                await queue.wakeup.wait()
+            notice = heapq.heappop(queue.heap)
+            notice.pending = False
+            ADMIN_NOTIFY_QUEUE_DEPTH.set(self.queue_depth)
+            queue.sending = True
+            try:
+                await self._deliver(queue, notice)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Admin notify to {queue.chat_id} failed: {e}", exc_info=True)
+                self._count('failed')
+            finally:
+                queue.sending = False
+            if len(self._tail) > 1000 or len(self._sent) > 1000:
+                self._cleanup(time.monotonic())
+
+    async def _deliver(self, queue: _ChatQueue, notice: _Notice) -> None:
+        """Отправляет уведомление; темп чата и повторы после RetryAfter — в планировщике."""
+        set_send_priority(SEND_NOTIFICATION if notice.priority >= PRIORITY_NEW_USER else SEND_ADMIN)
+        try:
+            if notice.send is not None:
+                await notice.send()
+            elif notice.edit_message_id is not None and await self._edit(notice):
+                self._remember(notice, notice.edit_message_id)
+                ADMIN_NOTIFY_WAIT.observe(time.monotonic() - notice.enqueued_at)
+                self._count('edited')
+                return
+            else:
+                # Новое сообщение (или правка не удалась)
+                message = await notice.bot.send_message(
+                    chat_id=notice.chat_id, text=notice.text, reply_markup=notice.reply_markup
+                )
+                self._remember(notice, message.message_id)
+        except Exception as e:
+            logger.error(f"Error sending notification to {queue.chat_id}: {e}")
+            self._count('failed')
+            return
+        ADMIN_NOTIFY_WAIT.observe(time.monotonic() - notice.enqueued_at)
+        self._count('sent')
+
+    async def _edit(self, notice: _Notice) -> bool:
+        """Редактирует отправленное уведомление; False — отправить заново."""
+        try:
+            await notice.bot.edit_message_text(
+                text=notice.text,
+                chat_id=notice.chat_id,
+                message_id=notice.edit_message_id,
+                reply_markup=notice.reply_markup,
+            )
+            return True
+        except TelegramBadRequest as e:
+            if "message is not modified" in str(e):
+                return True
+            # Сообщение удалено или слишком старое — отправим новое
+            logger.debug(f"Admin notify edit failed, sending new message: {e}")
+            notice.edit_message_id = None
+            return False
+
+    def _remember(self, notice: _Notice, message_id: int) -> None:
+        if notice.key is None:
+            return
+        self._sent[(notice.chat_id, notice.key)] = _Sent(
+            message_id, notice.header, list(notice.parts), notice.reply_markup, time.monotonic()
+        )
+
+    def _cleanup(self, now: float) -> None:
+        """Удаляет записи, которые уже нельзя ни дополнить, ни редактировать."""
+        for k in [k for k, sent in self._sent.items() if now - sent.sent_at > self.config.coalesce_window]:
+            del self._sent[k]
+        for k in [k for k, tail in self._tail.items() if not tail.pending and k not in self._sent]:
+            del self._tail[k]
+
+    async def stop(self) -> None:
+        """Досылает очередь (не дольше stop_timeout) и останавливает воркеры."""
+        deadline = time.monotonic() + self.config.stop_timeout
+        while (
+            self.queue_depth or any(queue.sending for queue in self._queues.values())
+        ) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self.queue_depth:
+            logger.warning(f"Admin notify: {self.queue_depth} notices not sent at shutdown")
+        for queue in self._queues.values():
+            if queue.task:
+                queue.task.cancel()
+
+
+admin_notifier = AdminNotifier()
@@ -1,69 +1,107 @@
 """
 Модуль для управления блокировкой ИИ-ответов.
 Когда админ начинает отвечать пользователю, ИИ блокируется для этого пользователя.
+
+Блокировки хранятся в общем состоянии (bot.shared_state): ответ админа
+и сообщение пользователя могут обрабатываться разными процессами.
+Если бэкенд недоступен, ошибка считается в shared_state_errors_total,
+а ИИ считается незаблокированным — бот продолжает отвечать.
 """
-import time
 import logging
+import time
 
-logger = logging.getLogger(__name__)
+from bot.metrics import registry
+from bot.shared_state import STATE_BACKEND_ERRORS, shared_state
 
-# Хранилище заблокированных пользователей: {user_id: timestamp}
-# Если админ начал отвечать, ИИ не должен отвечать этому пользователю
-_blocked_users = {}
+logger = logging.getLogger(__name__)
 
 # Время блокировки в секундах (30 минут по умолчанию)
+# Если админ начал отвечать, ИИ не должен отвечать этому пользователю
 BLOCK_DURATION = 30 * 60
 
+# Окно, в котором подключение админа считается эскалацией после ответа ИИ с опорой на FAQ
+GROUNDED_ESCALATION_WINDOW = 30 * 60
+
+GROUNDED_ANSWERS = registry.counter(
+    "ai_grounded_answers_total", "Ответов ИИ с подстановкой записей FAQ"
+)
+GROUNDED_ESCALATIONS = registry.counter(
+    "ai_grounded_escalations_total", "Ответов ИИ с FAQ, после которых подключился админ"
+)
+
+
+def _block_key(user_id: int) -> str:
+    return f"ai_block:{user_id}"
+
+
+def _grounded_key(user_id: int) -> str:
+    return f"ai_grounded:{user_id}"
+
+
+def _backend_error(action: str, user_id: int, error: Exception) -> None:
+    STATE_BACKEND_ERRORS.labels(operation="ai_block").inc()
+    logger.error(f"Shared state error on AI {action} for user {user_id}: {error}")
 
-def block_ai_for_user(user_id: int):
+
+async def block_ai_for_user(user_id: int):
     """
     Блокирует ИИ-ответы для указанного пользователя.
     Используется когда админ начинает отвечать.
     """
-    _blocked_users[user_id] = time.time()
-    logger.info(f"AI blocked for user {user_id}")
+    try:
+        await shared_state.backend.set(_block_key(user_id), time.time(), ttl=BLOCK_DURATION)
+        logger.info(f"AI blocked for user {user_id}")
+
+        # Ключ живёт GROUNDED_ESCALATION_WINDOW — если он есть, это эскалация
+        if await shared_state.backend.pop(_grounded_key(user_id)) is not None:
+            GROUNDED_ESCALATIONS.inc()
+            logger.info(f"Escalation after FAQ-grounded AI answer for user {user_id}")
+    except Exception as e:
+        _backend_error("block", user_id, e)
 
 
-def unblock_ai_for_user(user_id: int):
+async def mark_grounded_answer(user_id: int):
     """
-    Разблокирует ИИ-ответы для указанного пользователя.
+    Отмечает, что пользователь получил ответ ИИ с опорой на FAQ.
+    Используется для подсчёта, как часто такие ответы обходятся без админа.
     """
-    if user_id in _blocked_users:
-        del _blocked_users[user_id]
-        logger.info(f"AI unblocked for user {user_id}")
+    GROUNDED_ANSWERS.inc()
+    try:
+        await shared_state.backend.set(_grounded_key(user_id), time.time(), ttl=GROUNDED_ESCALATION_WINDOW)
+    except Exception as e:
+        _backend_error("grounding mark", user_id, e)
 
 
-def is_ai_blocked_for_user(user_id: int) -> bool:
+def get_grounding_stats() -> dict:
+    """Статистика ответов ИИ с опорой на FAQ (этого процесса)."""
+    grounded = int(GROUNDED_ANSWERS.value)
+    escalated = int(GROUNDED_ESCALATIONS.value)
+    return {
+        "grounded": grounded,
+        "escalated": escalated,
+        "resolved_rate": (grounded - escalated) / grounded if grounded else None,
+    }
+
+
+async def unblock_ai_for_user(user_id: int):
     """
-    Проверяет, заблокирован ли ИИ для данного пользователя.
-    Автоматически разблокирует, если прошло больше BLOCK_DURATION времени.
+    Разблокирует ИИ-ответы для указанного пользователя.
     """
-    if user_id not in _blocked_users:
-        return False
-    
-    # Проверяем, не истекло ли время блокировки
-    block_time = _blocked_users[user_id]
-    if time.time() - block_time > BLOCK_DURATION:
-        logger.info(f"AI block expired for user {user_id}, auto-unblocking")
-        unblock_ai_for_user(user_id)
-        return False
-    
-    return True
+    try:
+        await shared_state.backend.delete(_block_key(user_id))
+        logger.info(f"AI unblocked for user {user_id}")
+    except Exception as e:
+        _backend_error("unblock", user_id, e)
 
 
-def cleanup_expired_blocks():
+async def is_ai_blocked_for_user(user_id: int) -> bool:
     """
-    Очищает устаревшие блокировки.
-    Можно вызывать периодически для очистки памяти.
+    Проверяет, заблокирован ли ИИ для данного пользователя.
+    Блокировка снимается сама через BLOCK_DURATION (TTL ключа).
+    Ошибка бэкенда — False: лучше ответ ИИ, чем молчание бота.
     """
-    current_time = time.time()
-    expired_users = [
-        user_id for user_id, block_time in _blocked_users.items()
-        if current_time - block_time > BLOCK_DURATION
-    ]
-    
-    for user_id in expired_users:
-        unblock_ai_for_user(user_id)
-    
-    if expired_users:
-        logger.debug(f"Cleaned up {len(expired_users)} expired AI blocks")
+    try:
+        return await shared_state.backend.get(_block_key(user_id)) is not None
+    except Exception as e:
+        _backend_error("block check", user_id, e)
+        return False
@@ -0,0 +1,232 @@
+"""
+Диспетчер запросов к ИИ с ограничением параллелизма.
+
+Без ограничения всплеск из сотен сообщений порождает столько же одновременных
+запросов к Groq/Gemini: провайдер отвечает 429, а все ответы становятся медленными.
+
+Диспетчер:
+1. Ограничивает число одновременных вызовов ИИ (max_concurrency)
+2. Ставит остальные запросы в очередь с приоритетом:
+   личные сообщения раньше упоминаний в группе,
+   пользователи, которые часто спрашивают, — позже остальных
+3. Сбрасывает нагрузку: если ожидание в очереди дольше max_queue_wait
+   или очередь переполнена, вызывается AIQueueTimeout и пользователь
+   получает резервный ответ вместо бесконечного ожидания
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from bot.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты (меньше — раньше)
+PRIORITY_PRIVATE = 0
+PRIORITY_GROUP = 10
+
+# Метрики
+AI_QUEUE_DEPTH = registry.gauge("ai_queue_depth", "Запросов к ИИ в очереди")
+AI_IN_FLIGHT = registry.gauge("ai_in_flight", "Запросов к ИИ выполняется сейчас")
+AI_QUEUE_WAIT = registry.histogram(
+    "ai_queue_wait_seconds",
+    "Время ожидания запроса к ИИ в очереди",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+AI_SHED = registry.counter("ai_shed_total", "Запросов к ИИ, сброшенных без ответа", ["reason"])
+
+
+class AIQueueTimeout(Exception):
+    """Запрос к ИИ не дождался свободного слота (или очередь переполнена)."""
+
+
+@dataclass
+class AIDispatcherConfig:
+    """Конфигурация диспетчера ИИ."""
+    max_concurrency: int = 4  # Одновременных запросов к провайдеру
+    max_queue_wait: float = 20.0  # Максимум ожидания в очереди (сек)
+    max_queue_size: int = 200  # Больше — сразу сбрасываем
+
+    # Понижение приоритета для частых запросов от одного пользователя
+    repeat_window: float = 60.0  # Окно учёта (сек)
+    repeat_penalty: int = 1  # Штраф за каждый запрос в окне сверх первого
+    repeat_max_penalty: int = 5
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    future: asyncio.Future
+    enqueued_at: float
+
+
+class AIDispatcher:
+    """
+    Ограничивает параллелизм вызовов ИИ и управляет очередью ожидания.
+
+    Использование:
+        answer = await ai_dispatcher.submit(
+            lambda: get_ai_response(text, model),
+            user_id=user_id,
+            priority=PRIORITY_PRIVATE,
+        )
+    """
+
+    def __init__(self, config: Optional[AIDispatcherConfig] = None):
+        self.config = config or AIDispatcherConfig()
+        self._heap: List[_Waiter] = []
+        self._waiting = 0  # Ожидающих в куче (без ушедших по таймауту и отменённых)
+        self._seq = itertools.count()
+        self._active = 0
+        self._recent: Dict[int, Deque[float]] = {}
+
+        self.stats = {
+            'submitted': 0,
+            'completed': 0,
+            'timed_out': 0,
+            'rejected': 0,
+        }
+
+    def configure(self, config: AIDispatcherConfig) -> None:
+        """Применяет новую конфигурацию (используется при старте)."""
+        self.config = config
+        self._wake_waiters()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._waiting
+
+    def _drop_waiter(self, future: asyncio.Future) -> None:
+        """Убирает ожидающего из очереди (таймаут, отмена задачи)."""
+        future.cancel()
+        self._waiting -= 1
+        # Отменённые записи лежат в куче до извлечения; когда их большинство — чистим
+        if len(self._heap) > 2 * self._waiting + 64:
+            self._heap = [w for w in self._heap if not w.future.done()]
+            heapq.heapify(self._heap)
+        AI_QUEUE_DEPTH.set(self._waiting)
+
+    def _effective_priority(self, user_id: Optional[int], priority: int) -> int:
+        """Учитывает частоту запросов пользователя и возвращает итоговый приоритет."""
+        if user_id is None:
+            return priority
+        now = time.monotonic()
+        times = self._recent.get(user_id)
+        if times is None:
+            times = deque()
+            self._recent[user_id] = times
+        while times and now - times[0] > self.config.repeat_window:
+            times.popleft()
+        penalty = min(len(times) * self.config.repeat_penalty, self.config.repeat_max_penalty)
+        times.append(now)
+        return priority + penalty
+
+    def _cleanup_recent(self) -> None:
+        """Удаляет устаревшие записи о частоте запросов."""
+        now = time.monotonic()
+        stale = [
+            uid for uid, times in self._recent.items()
+            if not times or now - times[-1] > self.config.repeat_window
+        ]
+        for uid in stale:
+            del self._recent[uid]
+
+    def _wake_waiters(self) -> None:
+        """Передаёт освободившиеся слоты ожидающим в порядке приоритета."""
+        while self._heap and self._active < self.config.max_concurrency:
+            waiter = heapq.heappop(self._heap)
+            if waiter.future.done():
+                continue  # Ушёл по таймауту
+            self._waiting -= 1
+            self._active += 1
+            waiter.future.set_result(None)
+        AI_QUEUE_DEPTH.set(self.queue_depth)
+        AI_IN_FLIGHT.set(self._active)
+
+    async def _acquire(self, priority: int) -> None:
+        enqueued_at = time.monotonic()
+
+        if self._active < self.config.max_concurrency and not self.queue_depth:
+            self._active += 1
+            AI_IN_FLIGHT.set(self._active)
+            AI_QUEUE_WAIT.observe(0.0)
+            return
+
+        if self.queue_depth >= self.config.max_queue_size:
+            self.stats['rejected'] += 1
+            AI_SHED.labels(reason="queue_full").inc()
+            raise AIQueueTimeout("AI queue is full")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, _Waiter(priority, next(self._seq), future, enqueued_at))
+        self._waiting += 1
+        AI_QUEUE_DEPTH.set(self._waiting)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.config.max_queue_wait)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # Слот выдан в последний момент — пользуемся им
+                pass
+            else:
+                self._drop_waiter(future)
+                self.stats['timed_out'] += 1
+                AI_SHED.labels(reason="timeout").inc()
+                AI_QUEUE_WAIT.observe(time.monotonic() - enqueued_at)
+                raise AIQueueTimeout(f"AI queue wait exceeded {self.config.max_queue_wait}s")
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release()
+            else:
+                self._drop_waiter(future)
+            raise
+
+        AI_QUEUE_WAIT.observe(time.monotonic() - enqueued_at)
+
+    def _release(self) -> None:
+        self._active -= 1
+        self._wake_waiters()
+
+    async def submit(
+        self,
+        call: Callable[[], Awaitable[Any]],
+        user_id: Optional[int] = None,
+        priority: int = PRIORITY_PRIVATE,
+    ) -> Any:
+        """
+        Выполняет вызов ИИ, когда появится свободный слот.
+
+        Raises:
+            AIQueueTimeout: если слот не освободился за max_queue_wait
+                или очередь переполнена
+        """
+        self.stats['submitted'] += 1
+        effective = self._effective_priority(user_id, priority)
+        if len(self._recent) > 10000:
+            self._cleanup_recent()
+
+        await self._acquire(effective)
+        try:
+            return await call()
+        finally:
+            self.stats['completed'] += 1
+            self._release()
+
+    def get_stats(self) -> dict:
+        """Возвращает статистику."""
+        return {
+            **self.stats,
+            'in_flight': self._active,
+            'queue_depth': self.queue_depth,
+            'max_concurrency': self.config.max_concurrency,
+        }
+
+
+# Глобальный экземпляр (конфигурация применяется при старте в main.py)
+ai_dispatcher = AIDispatcher()
@@ -1,69 +1,167 @@
+import asyncio
 import logging
+import time
+from typing import Dict, List, Optional, Tuple
 import google.generativeai as genai
 from groq import AsyncGroq
 from bot import config
+from bot.ai_memory import conversation_memory, estimate_tokens
+from bot.ai_block_manager import mark_grounded_answer
+from bot import ai_stats
 
 logger = logging.getLogger(__name__)
 
 # Инициализируем только клиент Groq, т.к. у Gemini модель создается динамически
-groq_client = AsyncGroq(api_key=config.GROQ_API_KEY)
+groq_client = AsyncGroq(api_key=config.GROQ_API_KEY, base_url=config.GROQ_BASE_URL or None)
 # Настраиваем Gemini, но не создаем модель сразу
 try:
-    genai.configure(api_key=config.GEMINI_API_KEY)
+    if config.GEMINI_API_ENDPOINT:
+        # Свой адрес API поддерживается только REST-транспортом
+        genai.configure(
+            api_key=config.GEMINI_API_KEY,
+            transport="rest",
+            client_options={"api_endpoint": config.GEMINI_API_ENDPOINT},
+        )
+    else:
+        genai.configure(api_key=config.GEMINI_API_KEY)
     logger.info("Gemini API configured successfully.")
 except Exception as e:
     logger.error(f"Failed to configure Gemini API: {e}")
 
 
-async def get_ai_response(prompt: str, service_name: str) -> str:
+# Бюджет токенов на записи FAQ в промпте (по умолчанию)
+DEFAULT_FAQ_CONTEXT_BUDGET = 600
+
+
+def build_faq_context(candidates: List[dict], token_budget: int = DEFAULT_FAQ_CONTEXT_BUDGET) -> str:
+    """
+    Собирает блок справки из ближайших записей FAQ в пределах бюджета токенов.
+    Записи идут по убыванию схожести; не влезающие целиком отбрасываются
+    (кроме первой — она обрезается до бюджета).
+    """
+    parts = []
+    used = 0
+    for item in candidates:
+        entry = f"В: {item['question']}\nО: {item['answer']}"
+        tokens = estimate_tokens(entry)
+        if used + tokens > token_budget:
+            if parts:
+                break
+            # Обрезаем с запасом: estimate_tokens ~ 3 символа на токен
+            entry = entry[:max(0, token_budget - 1) * 3]
+            tokens = estimate_tokens(entry)
+        parts.append(entry)
+        used += tokens
+    return "\n\n".join(parts)
+
+
+# Ответ модели: (текст, токены запроса, токены ответа)
+AIResult = Tuple[str, Optional[int], Optional[int]]
+
+
+async def _ask_groq(model: str, system_prompt: str, history: List[Dict[str, str]], prompt: str) -> AIResult:
+    """Один запрос к модели Groq (OpenAI-совместимый формат сообщений)."""
+    messages = [{"role": "system", "content": system_prompt}]
+    messages.extend(history)
+    messages.append({"role": "user", "content": prompt})
+    chat_completion = await groq_client.chat.completions.create(
+        messages=messages,
+        model=model,
+    )
+    usage = getattr(chat_completion, "usage", None)
+    return (
+        chat_completion.choices[0].message.content,
+        getattr(usage, "prompt_tokens", None),
+        getattr(usage, "completion_tokens", None),
+    )
+
+
+async def _ask_gemini(model: str, system_prompt: str, history: List[Dict[str, str]], prompt: str) -> AIResult:
+    """Один запрос к модели Gemini (роли user/model)."""
+    # Создаем объект модели прямо в цикле
+    gemini_model = genai.GenerativeModel(model, system_instruction=system_prompt)
+    contents = [
+        {"role": "model" if msg["role"] == "assistant" else "user", "parts": [msg["content"]]}
+        for msg in history
+    ]
+    contents.append({"role": "user", "parts": [prompt]})
+    if config.GEMINI_API_ENDPOINT:
+        # У REST-транспорта нет рабочего async-клиента: синхронный вызов в отдельном потоке
+        response = await asyncio.to_thread(gemini_model.generate_content, contents)
+    else:
+        response = await gemini_model.generate_content_async(contents)
+    usage = getattr(response, "usage_metadata", None)
+    return (
+        response.text,
+        getattr(usage, "prompt_token_count", None),
+        getattr(usage, "candidates_token_count", None),
+    )
+
+
+async def get_ai_response(
+    prompt: str,
+    service_name: str,
+    user_id: Optional[int] = None,
+    faq_candidates: Optional[List[dict]] = None,
+) -> str:
     """
     Получает ответ от ИИ с логикой отказоустойчивости (failover).
     Пробует модели из списка в .env по очереди.
+
+    Если передан user_id, в запрос добавляется история диалога с этим
+    пользователем, а успешный ответ запоминается.
+    faq_candidates — ближайшие записи FAQ (из search_faq), которые
+    подставляются в системный промпт как справка.
     """
     settings = config.load_json(config.SETTINGS_FILE)
     system_prompt = settings.get('ai_prompt', config.DEFAULT_AI_PROMPT)
 
-    full_prompt = f"{system_prompt}\n\n---\nВот вопрос пользователя:\n\"{prompt}\""
-    logger.debug(f"Constructed full prompt for service '{service_name}'.")
+    faq_context = ""
+    if faq_candidates:
+        budget = int(settings.get('faq_context_token_budget', DEFAULT_FAQ_CONTEXT_BUDGET))
+        faq_context = build_faq_context(faq_candidates, budget)
+    if faq_context:
+        system_prompt = (
+            f"{system_prompt}\n\n---\n"
+            f"Справка из FAQ (используй, только если относится к вопросу; не добавляй фактов сверх неё):\n"
+            f"{faq_context}"
+        )
+
+    history = conversation_memory.get_history(user_id) if user_id is not None else []
+    logger.debug(f"Constructed prompt for service '{service_name}' with {len(history)} history messages.")
 
-    # --- ЛОГИКА ДЛЯ GROQ ---
     if service_name == "groq":
-        logger.info(f"Attempting to get response from Groq models: {config.GROQ_MODELS}")
-        for model in config.GROQ_MODELS:
-            logger.debug(f"Trying Groq model: '{model}'...")
-            try:
-                chat_completion = await groq_client.chat.completions.create(
-                    messages=[{"role": "user", "content": full_prompt}],
-                    model=model,
-                )
-                logger.info(f"SUCCESS! Got response from Groq model: '{model}'.")
-                return chat_completion.choices[0].message.content
-            except Exception as e:
-                logger.warning(f"Groq model '{model}' failed: {e}. Trying next model...")
-                continue # Переходим к следующей модели в списке
-
-        # Если цикл завершился, а ответа нет
-        logger.error("All Groq models in the list failed.")
-        return "Извините, сервис Groq временно недоступен. Попробовали все резервные варианты."
-
-    # --- ЛОГИКА ДЛЯ GEMINI ---
+        models, ask = config.GROQ_MODELS, _ask_groq
     elif service_name == "gemini":
-        logger.info(f"Attempting to get response from Gemini models: {config.GEMINI_MODELS}")
-        for model in config.GEMINI_MODELS:
-            logger.debug(f"Trying Gemini model: '{model}'...")
-            try:
-                # Создаем объект модели прямо в цикле
-                gemini_model = genai.GenerativeModel(model)
-                response = await gemini_model.generate_content_async(full_prompt)
-                logger.info(f"SUCCESS! Got response from Gemini model: '{model}'.")
-                return response.text
-            except Exception as e:
-                logger.warning(f"Gemini model '{model}' failed: {e}. Trying next model...")
-                continue
-
-        logger.error("All Gemini models in the list failed.")
-        return "Извините, сервис Gemini временно недоступен. Попробовали все резервные варианты."
-
+        models, ask = config.GEMINI_MODELS, _ask_gemini
     else:
         logger.warning(f"Unknown or disabled AI service called: '{service_name}'")
         return "ИИ выключен или не выбран."
+
+    title = service_name.capitalize()
+    logger.info(f"Attempting to get response from {title} models: {models}")
+    for depth, model in enumerate(models):
+        logger.debug(f"Trying {title} model: '{model}'...")
+        started = time.monotonic()
+        try:
+            answer, prompt_tokens, completion_tokens = await ask(model, system_prompt, history, prompt)
+        except Exception as e:
+            ai_stats.record_failure(service_name, model, time.monotonic() - started, e)
+            logger.warning(f"{title} model '{model}' failed: {e}. Trying next model...")
+            continue # Переходим к следующей модели в списке
+
+        ai_stats.record_success(
+            service_name, model, time.monotonic() - started, prompt_tokens, completion_tokens
+        )
+        ai_stats.record_failover(service_name, depth)
+        logger.info(f"SUCCESS! Got response from {title} model: '{model}'.")
+        if user_id is not None and answer:
+            conversation_memory.add_turn(user_id, prompt, answer)
+            if faq_context:
+                await mark_grounded_answer(user_id)
+        return answer
+
+    # Если цикл завершился, а ответа нет
+    ai_stats.record_failover(service_name, None)
+    logger.error(f"All {title} models in the list failed.")
+    return f"Извините, сервис {title} временно недоступен. Попробовали все резервные варианты."
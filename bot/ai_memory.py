@@ -0,0 +1,250 @@
+"""
+Память диалога с ИИ для каждого пользователя.
+
+Без неё каждый запрос к ИИ независим: уточняющий вопрос ("а на Android?")
+теряет контекст, и пользователь переспрашивает, удваивая нагрузку.
+
+Хранится кольцо последних N реплик (вопрос + ответ) на пользователя:
+- история, отправляемая в модель, обрезается по бюджету токенов
+- диалоги без активности дольше idle_ttl удаляются
+- общий объём памяти ограничен глобальным лимитом токенов,
+  при превышении вытесняются давно неактивные пользователи (LRU)
+- опционально сохраняется в файл при остановке и загружается при старте
+"""
+import json
+import logging
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MEMORY_FILE = "bot/data/ai_memory.json"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Грубая оценка числа токенов без токенизатора.
+    ~3 символа на токен — с запасом для кириллицы.
+    """
+    if not text:
+        return 0
+    return len(text) // 3 + 1
+
+
+@dataclass
+class ConversationMemoryConfig:
+    """Конфигурация памяти диалогов."""
+    max_turns: int = 6  # Реплик (вопрос + ответ) на пользователя
+    token_budget: int = 1500  # Токенов истории в одном запросе к ИИ
+    idle_ttl: float = 30 * 60  # Забываем диалог после простоя (сек)
+    global_token_cap: int = 2_000_000  # Общий лимит по всем пользователям
+    max_turn_chars: int = 2000  # Длинные реплики обрезаются при сохранении
+
+
+# Реплика: (вопрос, ответ, unix-время) — кортеж компактнее dict
+Turn = Tuple[str, str, int]
+
+
+@dataclass
+class _Conversation:
+    turns: Deque[Turn]
+    tokens: int = 0
+    last_active: float = field(default_factory=time.time)
+
+
+class ConversationMemory:
+    """
+    Кольцевой буфер реплик на пользователя с LRU-вытеснением.
+
+    Использование:
+        history = conversation_memory.get_history(user_id)
+        ...
+        conversation_memory.add_turn(user_id, question, answer)
+    """
+
+    def __init__(self, config: Optional[ConversationMemoryConfig] = None):
+        self.config = config or ConversationMemoryConfig()
+        # Порядок = порядок активности (первый — самый давний)
+        self._conversations: "OrderedDict[int, _Conversation]" = OrderedDict()
+        self._total_tokens = 0
+
+    def configure(self, config: ConversationMemoryConfig) -> None:
+        """Применяет новую конфигурацию (используется при старте)."""
+        self.config = config
+        for conv in self._conversations.values():
+            while len(conv.turns) > config.max_turns:
+                self._drop_oldest_turn(conv)
+        self._enforce_global_cap()
+
+    @staticmethod
+    def _turn_tokens(turn: Turn) -> int:
+        return estimate_tokens(turn[0]) + estimate_tokens(turn[1])
+
+    def _drop_oldest_turn(self, conv: _Conversation) -> None:
+        turn = conv.turns.popleft()
+        tokens = self._turn_tokens(turn)
+        conv.tokens -= tokens
+        self._total_tokens -= tokens
+
+    def _forget(self, user_id: int) -> None:
+        conv = self._conversations.pop(user_id, None)
+        if conv:
+            self._total_tokens -= conv.tokens
+
+    def _is_expired(self, conv: _Conversation, now: float) -> bool:
+        return now - conv.last_active > self.config.idle_ttl
+
+    def _enforce_global_cap(self) -> None:
+        while self._total_tokens > self.config.global_token_cap and self._conversations:
+            user_id, conv = self._conversations.popitem(last=False)
+            self._total_tokens -= conv.tokens
+            logger.debug(f"AI memory evicted user {user_id} (global cap)")
+
+    def add_turn(self, user_id: int, question: str, answer: str) -> None:
+        """Запоминает реплику (вопрос пользователя и ответ ИИ)."""
+        limit = self.config.max_turn_chars
+        turn: Turn = (question[:limit], answer[:limit], int(time.time()))
+
+        now = time.time()
+        conv = self._conversations.get(user_id)
+        if conv is None or self._is_expired(conv, now):
+            self._forget(user_id)
+            conv = _Conversation(turns=deque())
+            self._conversations[user_id] = conv
+        else:
+            self._conversations.move_to_end(user_id)
+
+        if len(conv.turns) >= self.config.max_turns:
+            self._drop_oldest_turn(conv)
+
+        tokens = self._turn_tokens(turn)
+        conv.turns.append(turn)
+        conv.tokens += tokens
+        conv.last_active = now
+        self._total_tokens += tokens
+
+        self._enforce_global_cap()
+        self.cleanup_expired()
+
+    def get_history(self, user_id: int, token_budget: Optional[int] = None) -> List[Dict[str, str]]:
+        """
+        Возвращает историю в виде сообщений [{"role": "user"|"assistant", "content": ...}],
+        от старых к новым, обрезанную по бюджету токенов (новые реплики важнее).
+        """
+        conv = self._conversations.get(user_id)
+        if conv is None:
+            return []
+        if self._is_expired(conv, time.time()):
+            self._forget(user_id)
+            return []
+
+        budget = self.config.token_budget if token_budget is None else token_budget
+        selected: List[Turn] = []
+        used = 0
+        for turn in reversed(conv.turns):
+            tokens = self._turn_tokens(turn)
+            if used + tokens > budget:
+                break
+            selected.append(turn)
+            used += tokens
+
+        messages: List[Dict[str, str]] = []
+        for question, answer, _ in reversed(selected):
+            messages.append({"role": "user", "content": question})
+            messages.append({"role": "assistant", "content": answer})
+        return messages
+
+    def clear(self, user_id: int) -> None:
+        """Забывает диалог пользователя."""
+        self._forget(user_id)
+
+    def cleanup_expired(self) -> int:
+        """
+        Удаляет диалоги без активности дольше idle_ttl.
+        Диалоги упорядочены по активности, поэтому проверяем только начало.
+        """
+        now = time.time()
+        removed = 0
+        while self._conversations:
+            user_id, conv = next(iter(self._conversations.items()))
+            if not self._is_expired(conv, now):
+                break
+            self._forget(user_id)
+            removed += 1
+        if removed:
+            logger.debug(f"AI memory: cleaned up {removed} idle conversations")
+        return removed
+
+    def get_stats(self) -> dict:
+        """Возвращает статистику."""
+        return {
+            'users': len(self._conversations),
+            'tokens': self._total_tokens,
+            'global_token_cap': self.config.global_token_cap,
+        }
+
+    # ------------------------------------------------------------------
+    # Сохранение / загрузка
+    # ------------------------------------------------------------------
+
+    def save(self, filename: str = MEMORY_FILE) -> bool:
+        """Сохраняет непросроченные диалоги в файл."""
+        self.cleanup_expired()
+        data = {
+            str(uid): [list(turn) for turn in conv.turns]
+            for uid, conv in self._conversations.items()
+        }
+        try:
+            path = Path(filename)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+            logger.info(f"AI memory saved: {len(data)} conversations")
+            return True
+        except Exception as e:
+            logger.error(f"Error saving AI memory: {e}")
+            return False
+
+    def load(self, filename: str = MEMORY_FILE) -> int:
+        """Загружает диалоги из файла, пропуская просроченные."""
+        path = Path(filename)
+        if not path.exists():
+            return 0
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading AI memory: {e}")
+            return 0
+
+        now = time.time()
+        loaded = []
+        for uid, turns in data.items():
+            if not turns:
+                continue
+            last_ts = turns[-1][2]
+            if now - last_ts > self.config.idle_ttl:
+                continue
+            loaded.append((last_ts, int(uid), turns))
+
+        # Восстанавливаем порядок активности
+        loaded.sort(key=lambda x: x[0])
+        for last_ts, uid, turns in loaded:
+            conv = _Conversation(turns=deque(), last_active=float(last_ts))
+            for q, a, ts in turns[-self.config.max_turns:]:
+                turn: Turn = (q, a, int(ts))
+                conv.turns.append(turn)
+                conv.tokens += self._turn_tokens(turn)
+            self._conversations[uid] = conv
+            self._total_tokens += conv.tokens
+
+        self._enforce_global_cap()
+        logger.info(f"AI memory loaded: {len(self._conversations)} conversations")
+        return len(self._conversations)
+
+
+# Глобальный экземпляр (конфигурация применяется при старте в main.py)
+conversation_memory = ConversationMemory()
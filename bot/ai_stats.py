@@ -0,0 +1,118 @@
+"""
+Учёт использования ИИ по моделям.
+
+Для каждой модели Groq/Gemini считаются:
+- гистограмма задержек (фиксированные корзины)
+- токены запроса и ответа (из полей usage провайдера)
+- ошибки по классу исключения
+- глубина failover: какая по счёту модель дала ответ
+
+Данные хранятся в реестре метрик (эндпоинт /metrics) и показываются
+на экране «Статистика ИИ» в админ-панели.
+"""
+import logging
+from typing import Dict, List, Optional
+
+from bot.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Корзины задержек LLM (секунды)
+LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 20.0, 30.0, 60.0)
+
+AI_LATENCY = registry.histogram(
+    "ai_request_duration_seconds",
+    "Длительность запроса к модели ИИ",
+    ["service", "model"],
+    buckets=LATENCY_BUCKETS,
+)
+AI_REQUESTS = registry.counter(
+    "ai_requests_total", "Запросов к моделям ИИ", ["service", "model", "status"]
+)
+AI_ERRORS = registry.counter(
+    "ai_errors_total", "Ошибок моделей ИИ по классу исключения", ["service", "model", "error"]
+)
+AI_TOKENS = registry.counter(
+    "ai_tokens_total", "Токенов, израсходованных моделями ИИ", ["service", "model", "kind"]
+)
+AI_FAILOVER = registry.counter(
+    "ai_failover_depth_total",
+    "Ответов по глубине failover (0 — основная модель, exhausted — все модели упали)",
+    ["service", "depth"],
+)
+
+
+def record_success(
+    service: str,
+    model: str,
+    latency: float,
+    prompt_tokens: Optional[int] = None,
+    completion_tokens: Optional[int] = None,
+) -> None:
+    """Учитывает успешный ответ модели."""
+    AI_LATENCY.labels(service=service, model=model).observe(latency)
+    AI_REQUESTS.labels(service=service, model=model, status="ok").inc()
+    if prompt_tokens:
+        AI_TOKENS.labels(service=service, model=model, kind="prompt").inc(prompt_tokens)
+    if completion_tokens:
+        AI_TOKENS.labels(service=service, model=model, kind="completion").inc(completion_tokens)
+
+
+def record_failure(service: str, model: str, latency: float, error: BaseException) -> None:
+    """Учитывает ошибку модели."""
+    AI_LATENCY.labels(service=service, model=model).observe(latency)
+    AI_REQUESTS.labels(service=service, model=model, status="error").inc()
+    AI_ERRORS.labels(service=service, model=model, error=type(error).__name__).inc()
+
+
+def record_failover(service: str, depth: Optional[int]) -> None:
+    """Учитывает, на какой по счёту модели завершился запрос (None — все упали)."""
+    AI_FAILOVER.labels(service=service, depth="exhausted" if depth is None else str(depth)).inc()
+
+
+def get_model_stats() -> List[Dict]:
+    """
+    Сводка по моделям для админ-панели.
+
+    Returns:
+        Список словарей: service, model, ok, errors, p50, p95, avg_latency,
+        prompt_tokens, completion_tokens, top_errors
+    """
+    requests: Dict[tuple, Dict[str, float]] = {}
+    for (service, model, status), child in AI_REQUESTS.children():
+        requests.setdefault((service, model), {})[status] = child.value
+
+    tokens: Dict[tuple, Dict[str, float]] = {}
+    for (service, model, kind), child in AI_TOKENS.children():
+        tokens.setdefault((service, model), {})[kind] = child.value
+
+    errors: Dict[tuple, List[tuple]] = {}
+    for (service, model, error), child in AI_ERRORS.children():
+        errors.setdefault((service, model), []).append((error, int(child.value)))
+
+    result = []
+    for (service, model), hist in AI_LATENCY.children():
+        key = (service, model)
+        ok = int(requests.get(key, {}).get("ok", 0))
+        result.append({
+            "service": service,
+            "model": model,
+            "ok": ok,
+            "errors": int(requests.get(key, {}).get("error", 0)),
+            "p50": hist.quantile(0.5),
+            "p95": hist.quantile(0.95),
+            "avg_latency": hist.sum / hist.count if hist.count else None,
+            "prompt_tokens": int(tokens.get(key, {}).get("prompt", 0)),
+            "completion_tokens": int(tokens.get(key, {}).get("completion", 0)),
+            "top_errors": sorted(errors.get(key, []), key=lambda x: x[1], reverse=True)[:3],
+        })
+    result.sort(key=lambda x: (x["service"], -(x["ok"] + x["errors"])))
+    return result
+
+
+def get_failover_stats() -> Dict[str, Dict[str, int]]:
+    """Распределение ответов по глубине failover: {service: {depth: count}}."""
+    result: Dict[str, Dict[str, int]] = {}
+    for (service, depth), child in AI_FAILOVER.children():
+        result.setdefault(service, {})[depth] = int(child.value)
+    return result
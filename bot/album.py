@@ -0,0 +1,113 @@
+"""
+Сборка альбомов (media group) во входящих сообщениях.
+
+Telegram присылает альбом как отдельные сообщения с общим media_group_id.
+AlbumMiddleware придерживает первую часть альбома, пока приходят остальные
+(не дольше latency после последней части и max_wait после первой), и вызывает
+хэндлер один раз: событие — первая часть, в data["album"] — все части по порядку.
+Остальные части до хэндлера не доходят.
+
+Подключается как outer middleware роутера:
+    router.message.outer_middleware(AlbumMiddleware(AlbumConfig()))
+"""
+import asyncio
+import html
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import (
+    InputMediaAudio,
+    InputMediaDocument,
+    InputMediaPhoto,
+    InputMediaVideo,
+    Message,
+    TelegramObject,
+)
+
+logger = logging.getLogger(__name__)
+
+# Больше частей в альбоме Telegram не допускает
+MAX_ALBUM_SIZE = 10
+
+
+@dataclass
+class AlbumConfig:
+    """Конфигурация сборки альбомов."""
+    latency: float = 0.6  # Ожидание следующей части (сек)
+    max_wait: float = 3.0  # Максимум ожидания с первой части (сек)
+    private_only: bool = True  # Собирать только в личных чатах
+
+
+class _PendingAlbum:
+    __slots__ = ("messages", "started_at", "last_at")
+
+    def __init__(self, message: Message, now: float):
+        self.messages: List[Message] = [message]
+        self.started_at = now
+        self.last_at = now
+
+
+class AlbumMiddleware(BaseMiddleware):
+    """Собирает части альбома и передаёт их хэндлеру одним вызовом."""
+
+    def __init__(self, config: AlbumConfig = None):
+        self.config = config or AlbumConfig()
+        self._pending: Dict[Tuple[int, str], _PendingAlbum] = {}
+        self.albums = 0  # Собрано альбомов
+        self.absorbed = 0  # Частей, не дошедших до хэндлера отдельно
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Message) or not event.media_group_id:
+            return await handler(event, data)
+        if self.config.private_only and event.chat.type != "private":
+            return await handler(event, data)
+
+        loop = asyncio.get_running_loop()
+        key = (event.chat.id, event.media_group_id)
+        pending = self._pending.get(key)
+        if pending is not None:
+            # Часть уже собираемого альбома — обработает первая часть
+            pending.messages.append(event)
+            pending.last_at = loop.time()
+            self.absorbed += 1
+            return None
+
+        pending = self._pending[key] = _PendingAlbum(event, loop.time())
+        try:
+            while len(pending.messages) < MAX_ALBUM_SIZE:
+                deadline = min(pending.last_at + self.config.latency, pending.started_at + self.config.max_wait)
+                delay = deadline - loop.time()
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+        finally:
+            self._pending.pop(key, None)
+
+        album = sorted(pending.messages, key=lambda m: m.message_id)
+        self.albums += 1
+        logger.debug(f"Album {event.media_group_id} in chat {event.chat.id}: {len(album)} parts")
+        data["album"] = album
+        return await handler(album[0], data)
+
+
+def album_to_media(album: List[Message]) -> list:
+    """InputMedia для send_media_group из частей альбома (подписи — HTML-экранированные)."""
+    media = []
+    for message in album:
+        caption = html.escape(message.caption) if message.caption else None
+        if message.photo:
+            media.append(InputMediaPhoto(media=message.photo[-1].file_id, caption=caption))
+        elif message.video:
+            media.append(InputMediaVideo(media=message.video.file_id, caption=caption))
+        elif message.document:
+            media.append(InputMediaDocument(media=message.document.file_id, caption=caption))
+        elif message.audio:
+            media.append(InputMediaAudio(media=message.audio.file_id, caption=caption))
+    return media
@@ -13,6 +13,7 @@ from aiogram.types import FSInputFile
 from zoneinfo import ZoneInfo
 
 from bot import config
+from bot.shared_state import shared_state
 
 logger = logging.getLogger(__name__)
 
@@ -197,6 +198,10 @@ async def run_daily_backup_loop(bot: Bot) -> None:
         logger.info("Next daily backup at %s (in %.0f sec)", next_run.isoformat(), sleep_s)
         await asyncio.sleep(max(1, sleep_s))
 
+        # С несколькими процессами бота бэкап отправляет один из них
+        if not await shared_state.acquire_lease(f"daily_backup:{next_run.date().isoformat()}", ttl=12 * 3600):
+            continue
+
         try:
             p = create_backup_file()
             # Отправляем админу
@@ -0,0 +1,749 @@
+"""
+Движок рассылки.
+
+Рассылка выполняется фоновой задачей, а не внутри callback-хэндлера:
+админ сразу получает сообщение с прогрессом, которое обновляется
+каждые progress_interval секунд (отправлено / ошибок / ETA),
+и кнопки «Пауза» / «Продолжить» / «Отменить».
+
+Текстовая рассылка отправляется через send_message (с HTML-разметкой),
+любое другое сообщение (фото, видео, документ, голосовое...) — через
+copy_message из чата админа: Telegram копирует уже загруженный файл
+на своей стороне, и медиа не передаётся повторно ни для одного получателя.
+
+Темп задаёт общий планировщик отправки (send_scheduler): рассылка получает
+свободные места глобального лимита после ответов пользователям и админу,
+отправляют несколько параллельных воркеров. TelegramRetryAfter планировщик
+обрабатывает сам — ставит на паузу всех отправителей и повторяет сообщение.
+
+С несколькими процессами бота рассылку выполняет процесс, держащий аренду
+«broadcast». Он публикует состояние задания в общем состоянии и забирает
+оттуда команды (пауза / продолжить / отменить), которые кнопки прогресса
+записали в другом процессе.
+
+Задание сохраняется в файл (строка статусов, по символу на получателя;
+список получателей — отдельным файлом один раз) и после перезапуска бота
+продолжается с места остановки. Статусы пишутся не на каждое сообщение,
+а пачками и при обновлении прогресса: перед отправкой очередной
+пачки её получатели помечаются как «в работе». Если процесс упал, такие
+получатели считаются «неизвестными» и повторно не получают сообщение —
+лучше недоставить часть одной пачки, чем отправить кому-то дважды.
+"""
+import asyncio
+import html
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from bot.keyboards.inline import broadcast_done_keyboard, broadcast_progress_keyboard
+from bot.metrics import registry
+from bot.send_scheduler import SEND_BULK, set_send_priority
+from bot.shared_state import STATE_BACKEND_ERRORS, shared_state
+from bot.user_manager import (
+    add_broadcast_record, mark_unreachable,
+    UNREACHABLE_BLOCKED_BOT, UNREACHABLE_DEACTIVATED, UNREACHABLE_CHAT_NOT_FOUND,
+)
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_JOB_FILE = "bot/data/broadcast_job.json"
+# Список получателей пишется один раз при создании задания
+BROADCAST_RECIPIENTS_FILE = "bot/data/broadcast_recipients.json"
+
+# Статусы получателей (по символу на получателя)
+STATUS_PENDING = "."
+STATUS_CLAIMED = "?"  # Взят в работу, результат ещё не сохранён
+STATUS_SENT = "s"
+STATUS_FAILED = "f"
+STATUS_UNKNOWN = "u"  # Был в работе при аварийной остановке — не отправляем повторно
+STATUS_BLOCKED_BOT = "b"
+STATUS_DEACTIVATED = "d"
+STATUS_CHAT_NOT_FOUND = "n"
+
+# Ошибки, после которых получатель исключается из будущих рассылок
+UNREACHABLE_STATUSES = {
+    STATUS_BLOCKED_BOT: UNREACHABLE_BLOCKED_BOT,
+    STATUS_DEACTIVATED: UNREACHABLE_DEACTIVATED,
+    STATUS_CHAT_NOT_FOUND: UNREACHABLE_CHAT_NOT_FOUND,
+}
+FAILED_STATUSES = (STATUS_FAILED, *UNREACHABLE_STATUSES)
+
+BROADCAST_MESSAGES = registry.counter(
+    "broadcast_messages_total", "Сообщений рассылки по результату", ["status"]
+)
+BROADCAST_METRIC_LABELS = {STATUS_SENT: "sent", STATUS_FAILED: "failed", **UNREACHABLE_STATUSES}
+
+# Общее состояние: задание процесса-исполнителя и команды ему
+BROADCAST_STATUS_KEY = "broadcast:status"
+BROADCAST_COMMANDS = ("pause", "resume", "cancel")
+
+
+@dataclass
+class BroadcastConfig:
+    """Конфигурация движка рассылки."""
+    workers: int = 8  # Параллельных отправителей
+    progress_interval: float = 5.0  # Обновление сообщения с прогрессом (сек)
+    checkpoint_batch: int = 200  # Размер пачки «в работе» между сохранениями
+    stop_timeout: float = 10.0  # Ожидание текущих отправок при остановке бота (сек)
+
+
+@dataclass
+class BroadcastJob:
+    """Состояние одной рассылки."""
+    job_id: int
+    text: str
+    user_ids: List[int]
+    statuses: bytearray
+    progress_chat_id: Optional[int] = None
+    progress_message_id: Optional[int] = None
+    # Исходное сообщение для copy_message (медиа-рассылка); None — текст через send_message
+    source_chat_id: Optional[int] = None
+    source_message_id: Optional[int] = None
+    state: str = "running"  # running | paused | cancelled | done
+    cursor: int = 0  # Получатели до курсора уже взяты в работу
+    claimed_until: int = 0  # Граница пачки, помеченной как «в работе»
+    sent: int = 0
+    failed: int = 0  # Все ошибки, включая недоступных
+    unreachable: int = 0  # Заблокировали бота / удалены / чат не найден
+    unknown: int = 0
+    created_at: str = field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    active_seconds: float = 0.0  # Время отправки в предыдущих запусках
+
+    # Текущий запуск (не сохраняется)
+    run_started: float = field(default_factory=time.monotonic)
+    run_processed: int = 0
+
+    @classmethod
+    def create(cls, text: str, user_ids: List[int], **kwargs) -> "BroadcastJob":
+        return cls(
+            job_id=int(time.time()),
+            text=text,
+            user_ids=list(user_ids),
+            statuses=bytearray(STATUS_PENDING.encode() * len(user_ids)),
+            **kwargs,
+        )
+
+    @property
+    def total(self) -> int:
+        return len(self.user_ids)
+
+    @property
+    def processed(self) -> int:
+        return self.sent + self.failed + self.unknown
+
+    def eta(self) -> Optional[float]:
+        """Оценка оставшегося времени (сек) по скорости текущего запуска."""
+        elapsed = time.monotonic() - self.run_started
+        if not self.run_processed or elapsed <= 0:
+            return None
+        speed = self.run_processed / elapsed
+        return (self.total - self.processed) / speed
+
+    def set_status(self, index: int, status: str) -> None:
+        self.statuses[index] = ord(status)
+
+    def release_claimed(self) -> None:
+        """
+        Возвращает в очередь получателей пачки, которые ещё не были выданы
+        воркерам (при штатной остановке их статус точно известен).
+        """
+        for i in range(self.cursor, self.claimed_until):
+            if self.statuses[i] == ord(STATUS_CLAIMED):
+                self.statuses[i] = ord(STATUS_PENDING)
+        self.claimed_until = self.cursor
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "text": self.text,
+            "statuses": self.statuses.decode("ascii"),
+            "progress_chat_id": self.progress_chat_id,
+            "progress_message_id": self.progress_message_id,
+            "source_chat_id": self.source_chat_id,
+            "source_message_id": self.source_message_id,
+            "state": self.state,
+            "cursor": self.claimed_until,
+            "created_at": self.created_at,
+            "active_seconds": round(self.active_seconds, 1),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict, user_ids: List[int]) -> "BroadcastJob":
+        """
+        Восстанавливает задание из файла. Получатели, бывшие «в работе»
+        в момент сохранения, становятся «неизвестными»: их статус потерян.
+        """
+        statuses = bytearray(
+            data["statuses"].replace(STATUS_CLAIMED, STATUS_UNKNOWN).encode("ascii")
+        )
+        cursor = int(data.get("cursor", 0))
+        return cls(
+            job_id=data["job_id"],
+            text=data["text"],
+            user_ids=user_ids,
+            statuses=statuses,
+            progress_chat_id=data.get("progress_chat_id"),
+            progress_message_id=data.get("progress_message_id"),
+            source_chat_id=data.get("source_chat_id"),
+            source_message_id=data.get("source_message_id"),
+            state=data.get("state", "running"),
+            cursor=cursor,
+            claimed_until=cursor,
+            sent=statuses.count(STATUS_SENT.encode()),
+            failed=sum(statuses.count(c.encode()) for c in FAILED_STATUSES),
+            unreachable=sum(statuses.count(c.encode()) for c in UNREACHABLE_STATUSES),
+            unknown=statuses.count(STATUS_UNKNOWN.encode()),
+            created_at=data.get("created_at", ""),
+            active_seconds=float(data.get("active_seconds", 0)),
+        )
+
+
+def classify_send_error(error: Exception) -> str:
+    """
+    Статус получателя по ошибке отправки:
+    403 «bot was blocked» / «user is deactivated», 400 «chat not found» —
+    получатель недоступен; остальное — разовая ошибка.
+    """
+    message = str(error).lower()
+    if isinstance(error, TelegramForbiddenError):
+        if "deactivated" in message:
+            return STATUS_DEACTIVATED
+        return STATUS_BLOCKED_BOT
+    if isinstance(error, TelegramBadRequest) and ("chat not found" in message or "user not found" in message):
+        return STATUS_CHAT_NOT_FOUND
+    return STATUS_FAILED
+
+
+def _format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "—"
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600} ч {seconds % 3600 // 60} мин"
+    if seconds >= 60:
+        return f"{seconds // 60} мин {seconds % 60} сек"
+    return f"{seconds} сек"
+
+
+class BroadcastEngine:
+    """
+    Фоновые рассылки с темпом под лимиты Telegram.
+
+    Одновременно существует одно задание: лимит Telegram общий для бота,
+    и две параллельные рассылки лишь делили бы его между собой.
+
+    Использование:
+        job = broadcast_engine.start(bot, text, user_ids, chat_id, message_id)
+        broadcast_engine.pause() / await broadcast_engine.resume(bot) / await broadcast_engine.cancel(bot)
+    """
+
+    def __init__(
+        self,
+        config: Optional[BroadcastConfig] = None,
+        job_file: str = BROADCAST_JOB_FILE,
+        recipients_file: str = BROADCAST_RECIPIENTS_FILE,
+    ):
+        self.config = config or BroadcastConfig()
+        self.job_file = job_file
+        self.recipients_file = recipients_file
+        self.current: Optional[BroadcastJob] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lease_task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def configure(self, config: BroadcastConfig) -> None:
+        """Применяет новую конфигурацию (используется при старте)."""
+        self.config = config
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def lease_ttl(self) -> float:
+        """Аренда рассылки в общем состоянии: держится, пока задание существует."""
+        return max(30.0, self.config.progress_interval * 3)
+
+    async def claim(self) -> bool:
+        """
+        Право запустить рассылку. С несколькими процессами бота рассылку
+        выполняет один из них — тот, что держит аренду.
+        """
+        return await shared_state.acquire_lease("broadcast", self.lease_ttl)
+
+    def _hold_lease(self, bot: Bot) -> None:
+        """
+        Продлевает аренду всё время жизни задания — и на паузе тоже: иначе
+        другой процесс запустит свою рассылку и перезапишет файлы задания.
+        """
+        if not shared_state.shared:
+            return
+        if self._lease_task is None or self._lease_task.done():
+            self._lease_task = asyncio.create_task(self._lease_loop(bot))
+
+    async def _lease_loop(self, bot: Bot) -> None:
+        """Аренда, состояние задания для других процессов и их команды — раз в progress_interval."""
+        while self.has_job:
+            await self._publish_status()
+            await asyncio.sleep(self.config.progress_interval)
+            if not await shared_state.renew_lease("broadcast", self.lease_ttl):
+                logger.warning("Broadcast lease is held by another bot process")
+            if self.has_job:
+                await self._apply_command(bot)
+
+    async def _drop_lease(self) -> None:
+        if self._lease_task is not None and self._lease_task is not asyncio.current_task():
+            self._lease_task.cancel()
+        self._lease_task = None
+        if shared_state.shared:
+            try:
+                await shared_state.backend.delete(BROADCAST_STATUS_KEY)
+            except Exception as e:
+                self._backend_error(e)
+        await shared_state.release_lease("broadcast")
+
+    @staticmethod
+    def _backend_error(error: Exception) -> None:
+        STATE_BACKEND_ERRORS.labels(operation="broadcast").inc()
+        logger.error(f"Shared state error on broadcast control: {error}")
+
+    @staticmethod
+    def _status(job: BroadcastJob) -> dict:
+        return {'job_id': job.job_id, 'state': job.state, 'processed': job.processed, 'total': job.total}
+
+    async def _publish_status(self) -> None:
+        try:
+            await shared_state.backend.set(BROADCAST_STATUS_KEY, self._status(self.current), ttl=self.lease_ttl)
+        except Exception as e:
+            self._backend_error(e)
+
+    async def _apply_command(self, bot: Bot) -> None:
+        job = self.current
+        try:
+            command = await shared_state.backend.pop(f"broadcast:command:{job.job_id}")
+        except Exception as e:
+            self._backend_error(e)
+            return
+        if command not in BROADCAST_COMMANDS:
+            return
+        logger.info(f"Broadcast {job.job_id}: '{command}' from another bot process")
+        if command == "pause":
+            self.pause()
+        elif command == "resume":
+            await self.resume(bot)
+        else:
+            await self.cancel(bot)
+
+    async def get_status(self) -> Optional[dict]:
+        """
+        Незавершённое задание (job_id, state, processed, total) — этого процесса
+        или процесса, который выполняет рассылку. None — заданий нет.
+        """
+        if self.has_job:
+            return self._status(self.current)
+        if not shared_state.shared:
+            return None
+        try:
+            return await shared_state.backend.get(BROADCAST_STATUS_KEY)
+        except Exception as e:
+            self._backend_error(e)
+            return None
+
+    async def send_command(self, job_id: int, command: str) -> bool:
+        """
+        Команда рассылке, которую выполняет другой процесс бота (pause / resume / cancel);
+        исполнитель заберёт её не позже чем через progress_interval. False — такой рассылки нет.
+        """
+        if self.has_job or command not in BROADCAST_COMMANDS:
+            return False
+        status = await self.get_status()
+        if not status or status.get('job_id') != job_id:
+            return False
+        try:
+            await shared_state.backend.set(f"broadcast:command:{job_id}", command, ttl=self.lease_ttl)
+        except Exception as e:
+            self._backend_error(e)
+            return False
+        return True
+
+    @property
+    def has_job(self) -> bool:
+        """Есть незавершённое задание (идёт или на паузе)."""
+        return self.current is not None and self.current.state in ("running", "paused")
+
+    # ------------------------------------------------------------------
+    # Управление
+    # ------------------------------------------------------------------
+
+    def start(
+        self,
+        bot: Bot,
+        text: str,
+        user_ids: List[int],
+        progress_chat_id: Optional[int] = None,
+        progress_message_id: Optional[int] = None,
+        source_chat_id: Optional[int] = None,
+        source_message_id: Optional[int] = None,
+    ) -> BroadcastJob:
+        """
+        Запускает рассылку в фоне. Бросает RuntimeError, если есть незавершённое задание.
+
+        Если передан source_message_id, получателям копируется это сообщение
+        (copy_message), а text служит только подписью в истории и прогрессе.
+        """
+        if self.has_job:
+            raise RuntimeError("Broadcast is already in progress")
+
+        job = BroadcastJob.create(
+            text,
+            user_ids,
+            progress_chat_id=progress_chat_id,
+            progress_message_id=progress_message_id,
+            source_chat_id=source_chat_id,
+            source_message_id=source_message_id,
+        )
+        self.current = job
+        self._save_recipients(job)
+        self._save(job)
+        self._launch(bot, job)
+        self._hold_lease(bot)
+        logger.info(f"Broadcast {job.job_id} started: {job.total} recipients")
+        return job
+
+    def pause(self) -> bool:
+        """Ставит рассылку на паузу (воркеры дозавершают текущие отправки)."""
+        if not self.is_running or self.current.state != "running":
+            return False
+        self.current.state = "paused"
+        logger.info(f"Broadcast {self.current.job_id} pausing")
+        return True
+
+    async def resume(self, bot: Bot) -> bool:
+        """Продолжает рассылку после паузы."""
+        job = self.current
+        if job is None or job.state != "paused":
+            return False
+        if not await shared_state.acquire_lease("broadcast", self.lease_ttl):
+            logger.warning(f"Broadcast {job.job_id}: lease is held by another bot process, not resuming")
+            return False
+        self._hold_lease(bot)
+        if self.is_running:
+            # Пауза ещё не вступила в силу — дождёмся остановки воркеров
+            await self._task
+        self._launch(bot, job)
+        logger.info(f"Broadcast {job.job_id} resumed at {job.processed}/{job.total}")
+        return True
+
+    async def cancel(self, bot: Bot) -> bool:
+        """Отменяет рассылку; уже отправленное остаётся в истории."""
+        job = self.current
+        if job is None or job.state not in ("running", "paused"):
+            return False
+        was_running = self.is_running
+        job.state = "cancelled"
+        if was_running:
+            # Воркеры остановятся, итог подведёт _run
+            await self._task
+        else:
+            await self._finish(bot, job)
+        return True
+
+    async def restore(self, bot: Bot) -> Optional[BroadcastJob]:
+        """
+        Загружает незавершённое задание после перезапуска бота.
+        Прерванная рассылка продолжается, рассылка на паузе ждёт админа.
+        """
+        path = Path(self.job_file)
+        if not path.exists():
+            return None
+        if not await self.claim():
+            logger.info("Broadcast job is owned by another bot process, not restoring")
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            with open(self.recipients_file, 'r', encoding='utf-8') as f:
+                job = BroadcastJob.from_dict(data, json.load(f))
+        except Exception as e:
+            logger.error(f"Error loading broadcast job: {e}")
+            await shared_state.release_lease("broadcast")
+            return None
+
+        self.current = job
+        self._hold_lease(bot)
+        if job.unknown:
+            logger.warning(
+                f"Broadcast {job.job_id}: {job.unknown} recipients have unknown status "
+                f"after an unclean shutdown and will not be retried"
+            )
+        if job.state == "running":
+            self._launch(bot, job)
+            logger.info(f"Broadcast {job.job_id} resumed after restart at {job.processed}/{job.total}")
+        else:
+            logger.info(f"Broadcast {job.job_id} restored in state '{job.state}'")
+        return job
+
+    async def stop(self) -> None:
+        """
+        Останавливает рассылку при выключении бота.
+        Задание остаётся «running» в файле и продолжится после запуска;
+        аренда освобождается, чтобы задание смог подхватить перезапущенный процесс.
+        """
+        if self.is_running:
+            self._stopping = True
+            try:
+                await asyncio.wait_for(asyncio.shield(self._task), self.config.stop_timeout)
+            except asyncio.TimeoutError:
+                self._task.cancel()
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    pass
+            finally:
+                self._stopping = False
+        if self.has_job:
+            await self._drop_lease()
+
+    # ------------------------------------------------------------------
+    # Сохранение
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _write_json(filename: str, data) -> None:
+        """Атомарная запись: через временный файл и rename."""
+        path = Path(filename)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        tmp.replace(path)
+
+    def _save_recipients(self, job: BroadcastJob) -> None:
+        try:
+            self._write_json(self.recipients_file, job.user_ids)
+        except Exception as e:
+            logger.error(f"Error saving broadcast recipients: {e}")
+
+    def _save(self, job: BroadcastJob) -> None:
+        try:
+            self._write_json(self.job_file, job.to_dict())
+        except Exception as e:
+            logger.error(f"Error saving broadcast job: {e}")
+
+    def _delete_job_file(self) -> None:
+        for filename in (self.job_file, self.recipients_file):
+            try:
+                Path(filename).unlink(missing_ok=True)
+            except Exception as e:
+                logger.error(f"Error deleting {filename}: {e}")
+
+    # ------------------------------------------------------------------
+    # Отправка
+    # ------------------------------------------------------------------
+
+    def _launch(self, bot: Bot, job: BroadcastJob) -> None:
+        job.state = "running"
+        job.run_started = time.monotonic()
+        job.run_processed = 0
+        self._task = asyncio.create_task(self._run(bot, job))
+
+    def _recipients(self, job: BroadcastJob) -> Iterator[int]:
+        """
+        Выдаёт индексы получателей по порядку.
+        Перед выдачей очередной пачки она помечается «в работе» и задание сохраняется.
+        """
+        while job.cursor < job.total:
+            if job.state != "running" or self._stopping:
+                return
+            index = job.cursor
+            if index >= job.claimed_until:
+                end = min(job.total, index + max(1, self.config.checkpoint_batch))
+                for i in range(index, end):
+                    if job.statuses[i] == ord(STATUS_PENDING):
+                        job.statuses[i] = ord(STATUS_CLAIMED)
+                job.claimed_until = end
+                self._save(job)
+            job.cursor += 1
+            if job.statuses[index] == ord(STATUS_CLAIMED):
+                yield index
+
+    async def _run(self, bot: Bot, job: BroadcastJob) -> None:
+        recipients = self._recipients(job)
+        workers = [
+            asyncio.create_task(self._worker(bot, job, recipients))
+            for _ in range(max(1, self.config.workers))
+        ]
+        progress = asyncio.create_task(self._progress_loop(bot, job))
+        try:
+            await asyncio.gather(*workers)
+            if job.state == "running" and job.cursor >= job.total:
+                job.state = "done"
+        finally:
+            for task in workers:
+                task.cancel()
+            progress.cancel()
+            job.active_seconds += time.monotonic() - job.run_started
+            # Получатели, которых воркеры не успели взять, возвращаются в очередь
+            if job.state in ("running", "paused"):
+                job.release_claimed()
+            if job.state in ("done", "cancelled"):
+                await self._finish(bot, job)
+            else:
+                self._save(job)
+                if job.state == "paused":
+                    await self._edit_progress(
+                        bot, job, self.format_progress(job),
+                        reply_markup=broadcast_progress_keyboard(job.job_id, paused=True),
+                    )
+            logger.info(
+                f"Broadcast {job.job_id} {job.state}: sent={job.sent}, failed={job.failed}, "
+                f"unknown={job.unknown}, {job.processed}/{job.total}"
+            )
+
+    async def _finish(self, bot: Bot, job: BroadcastJob) -> None:
+        """
+        Подводит итог рассылки: недоступные получатели исключаются из будущих
+        рассылок, запись в историю, удаление файла задания, итоговое сообщение.
+        """
+        dead = {
+            job.user_ids[i]: UNREACHABLE_STATUSES[chr(status)]
+            for i, status in enumerate(job.statuses)
+            if chr(status) in UNREACHABLE_STATUSES
+        }
+        await mark_unreachable(dead)
+        await add_broadcast_record(
+            job.text,
+            job.sent,
+            job.failed,
+            total=job.total,
+            unknown=job.unknown,
+            duration=job.active_seconds,
+            status=job.state,
+            unreachable=len(dead),
+        )
+        self._delete_job_file()
+        await self._drop_lease()
+        await self._report_done(bot, job)
+
+    async def _worker(self, bot: Bot, job: BroadcastJob, recipients: Iterator[int]) -> None:
+        # В планировщике отправки рассылка пропускает вперёд ответы пользователям и админу
+        set_send_priority(SEND_BULK)
+        # Общий итератор: каждый получатель достаётся ровно одному воркеру
+        for index in recipients:
+            status = await self._send(bot, job, job.user_ids[index])
+            job.set_status(index, status)
+            if status == STATUS_SENT:
+                job.sent += 1
+            else:
+                job.failed += 1
+                if status in UNREACHABLE_STATUSES:
+                    job.unreachable += 1
+            BROADCAST_MESSAGES.labels(status=BROADCAST_METRIC_LABELS[status]).inc()
+            job.run_processed += 1
+
+    async def _send(self, bot: Bot, job: BroadcastJob, user_id: int) -> str:
+        """
+        Отправляет одно сообщение. Возвращает статус получателя.
+        Темп и повторы после RetryAfter — в планировщике отправки.
+        """
+        try:
+            if job.source_message_id is not None:
+                await bot.copy_message(
+                    chat_id=user_id,
+                    from_chat_id=job.source_chat_id,
+                    message_id=job.source_message_id,
+                )
+            else:
+                await bot.send_message(chat_id=user_id, text=job.text, parse_mode="HTML")
+            return STATUS_SENT
+        except Exception as e:
+            status = classify_send_error(e)
+            if status == STATUS_FAILED:
+                logger.warning(f"Broadcast to {user_id} failed: {e}")
+            else:
+                logger.debug(f"Broadcast to {user_id}: recipient unreachable ({e})")
+            return status
+
+    # ------------------------------------------------------------------
+    # Прогресс
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def format_progress(job: BroadcastJob) -> str:
+        percent = job.processed * 100 // job.total if job.total else 100
+        title = "⏸ <b>Рассылка на паузе</b>" if job.state == "paused" else "⏳ <b>Рассылка...</b>"
+        text = (
+            f"{title} {percent}%\n\n"
+            f"📬 Отправлено: {job.sent}\n"
+            f"❌ Ошибок: {job.failed}\n"
+        )
+        if job.unreachable:
+            text += f"🚫 Из них недоступны: {job.unreachable}\n"
+        if job.unknown:
+            text += f"❔ Неизвестно (сбой бота): {job.unknown}\n"
+        text += f"👥 Всего: {job.total}\n"
+        if job.state == "running":
+            text += f"⏱ Осталось: ~{_format_duration(job.eta())}"
+        return text
+
+    async def _edit_progress(self, bot: Bot, job: BroadcastJob, text: str, **kwargs) -> None:
+        if job.progress_chat_id is None or job.progress_message_id is None:
+            return
+        try:
+            await bot.edit_message_text(
+                text=text,
+                chat_id=job.progress_chat_id,
+                message_id=job.progress_message_id,
+                parse_mode="HTML",
+                **kwargs,
+            )
+        except TelegramBadRequest:
+            # "message is not modified" или сообщение удалено — не критично
+            pass
+        except Exception as e:
+            logger.debug(f"Broadcast progress update failed: {e}")
+
+    async def _progress_loop(self, bot: Bot, job: BroadcastJob) -> None:
+        last_text = None
+        while True:
+            await asyncio.sleep(self.config.progress_interval)
+            # Промежуточное сохранение: результаты уже отправленных не потеряются
+            self._save(job)
+            text = self.format_progress(job)
+            if text != last_text:
+                await self._edit_progress(
+                    bot, job, text, reply_markup=broadcast_progress_keyboard(job.job_id)
+                )
+                last_text = text
+
+    async def _report_done(self, bot: Bot, job: BroadcastJob) -> None:
+        title = "✅ <b>Рассылка завершена</b>" if job.state == "done" else "❌ <b>Рассылка отменена</b>"
+        unknown = f"❔ Неизвестно (сбой бота): {job.unknown}\n" if job.unknown else ""
+        unreachable = (
+            f"🚫 Недоступны (исключены из рассылок): {job.unreachable}\n" if job.unreachable else ""
+        )
+        preview = html.escape(job.text[:50])
+        await self._edit_progress(
+            bot,
+            job,
+            f"{title}\n\n"
+            f"📬 Отправлено: {job.sent}\n"
+            f"❌ Ошибок: {job.failed}\n"
+            f"{unreachable}"
+            f"{unknown}"
+            f"👥 Всего: {job.total}\n"
+            f"⏱ Длительность: {_format_duration(job.active_seconds)}\n\n"
+            f"<i>{preview}...</i>",
+            reply_markup=broadcast_done_keyboard(),
+        )
+
+
+# Глобальный экземпляр (конфигурация применяется при старте в main.py)
+broadcast_engine = BroadcastEngine()
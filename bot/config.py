@@ -65,6 +65,9 @@ ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
 BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "").strip()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "").strip()
+# Альтернативные адреса API ИИ (например, локальный fake-сервер из bench/)
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "").strip()
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT", "").strip()
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").strip().upper()
 
 # Читаем строки, разделяем по запятой и создаем списки.
@@ -136,6 +139,9 @@ WEBHOOK_HOST = os.getenv("WEBHOOK_HOST")
 WEBHOOK_PATH = os.getenv("WEBHOOK_PATH")
 WEB_SERVER_HOST = os.getenv("WEB_SERVER_HOST", "0.0.0.0")
 WEB_SERVER_PORT = int(os.getenv("WEB_SERVER_PORT", 8000))
+# Общее состояние для нескольких процессов webhook: пусто — в памяти (один процесс),
+# sqlite:///bot/data/state.db — процессы на одном хосте, redis://redis:6379/0 — на разных
+STATE_BACKEND_URL = os.getenv("STATE_BACKEND_URL", "").strip()
 
 # --- Remnawave API ---
 REMNAWAVE_API_URL = os.getenv("REMNAWAVE_API_URL", "").strip()
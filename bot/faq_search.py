@@ -1,9 +1,16 @@
+import heapq
 import logging
+import os
 from difflib import SequenceMatcher
 from bot.config import FAQ_FILE, load_json
 
 logger = logging.getLogger(__name__)
 
+# Предпостроенный индекс FAQ: пересобирается только при изменении faq.json.
+# Для каждого вопроса хранится SequenceMatcher с уже разобранным seq2,
+# так что при поиске разбирается только вопрос пользователя.
+_faq_index = {"mtime": None, "entries": []}
+
 
 def calculate_similarity(text1: str, text2: str) -> float:
     """
@@ -12,40 +19,74 @@ def calculate_similarity(text1: str, text2: str) -> float:
     return SequenceMatcher(None, text1.lower(), text2.lower()).ratio()
 
 
-def search_faq(user_question: str, similarity_threshold: float = 0.4) -> dict:
+def _get_faq_index() -> list:
+    """Возвращает индекс FAQ [(item, matcher)], пересобирая его при изменении файла."""
+    try:
+        mtime = os.stat(FAQ_FILE).st_mtime_ns
+    except OSError:
+        mtime = None
+
+    if mtime is not None and _faq_index["mtime"] == mtime:
+        return _faq_index["entries"]
+
+    faq_data = load_json(FAQ_FILE, default_data=[])
+    entries = []
+    for item in faq_data:
+        matcher = SequenceMatcher(None)
+        matcher.set_seq2(item.get('question', '').lower())
+        entries.append((item, matcher))
+
+    _faq_index["mtime"] = mtime
+    _faq_index["entries"] = entries
+    logger.debug(f"FAQ index rebuilt: {len(entries)} entries")
+    return entries
+
+
+def search_faq(
+    user_question: str,
+    similarity_threshold: float = 0.4,
+    top_k: int = 0,
+    min_similarity: float = 0.0,
+) -> dict:
     """
     Ищет ответ в FAQ на основе вопроса пользователя.
-    
+
     Args:
         user_question: Вопрос пользователя
         similarity_threshold: Порог схожести (от 0 до 1). По умолчанию 0.4
-        
+        top_k: Сколько ближайших записей вернуть в 'candidates', если совпадение
+               не найдено (для подстановки в промпт ИИ). 0 — не собирать
+        min_similarity: Минимальная схожесть кандидата (отсекает шум)
+
     Returns:
         dict: Словарь с ключами 'found' (bool), 'answer' (str), 'question' (str), 'media' (dict)
-              Если ничего не найдено, возвращает {'found': False}
+              Если ничего не найдено, возвращает {'found': False, 'candidates': [...]},
+              где candidates — до top_k ближайших записей ({'question', 'answer', 'similarity'})
     """
-    faq_data = load_json(FAQ_FILE, default_data=[])
-    
-    if not faq_data:
+    entries = _get_faq_index()
+
+    if not entries:
         logger.debug("FAQ is empty, nothing to search")
-        return {'found': False}
-    
-    best_match = None
-    best_similarity = 0.0
-    
-    # Ищем наиболее похожий вопрос
-    for item in faq_data:
-        faq_question = item.get('question', '')
-        similarity = calculate_similarity(user_question, faq_question)
-        
-        logger.debug(f"Comparing with FAQ: '{faq_question[:50]}...' - similarity: {similarity:.2f}")
-        
-        if similarity > best_similarity:
-            best_similarity = similarity
-            best_match = item
-    
+        return {'found': False, 'candidates': []}
+
+    query = user_question.lower()
+    debug = logger.isEnabledFor(logging.DEBUG)
+    scored = []
+
+    # Один проход: лучшее совпадение и ближайшие кандидаты
+    for item, matcher in entries:
+        matcher.set_seq1(query)
+        similarity = matcher.ratio()
+
+        if debug:
+            logger.debug(f"Comparing with FAQ: '{item.get('question', '')[:50]}...' - similarity: {similarity:.2f}")
+
+        scored.append((similarity, item))
+
+    best_similarity, best_match = max(scored, key=lambda x: x[0])
+
     # Если нашли достаточно похожий вопрос
-    if best_match and best_similarity >= similarity_threshold:
+    if best_similarity > 0 and best_similarity >= similarity_threshold:
         logger.info(f"Found FAQ match with similarity {best_similarity:.2f}: '{best_match.get('question', '')[:50]}...'")
         return {
             'found': True,
@@ -54,6 +95,19 @@ def search_faq(user_question: str, similarity_threshold: float = 0.4) -> dict:
             'media': best_match.get('media'),
             'similarity': best_similarity
         }
-    
+
+    candidates = []
+    if top_k > 0:
+        nearest = heapq.nlargest(top_k, scored, key=lambda x: x[0])
+        candidates = [
+            {
+                'question': item.get('question', ''),
+                'answer': item.get('answer', ''),
+                'similarity': similarity,
+            }
+            for similarity, item in nearest
+            if similarity >= min_similarity and item.get('answer')
+        ]
+
     logger.debug(f"No FAQ match found. Best similarity was {best_similarity:.2f}, threshold is {similarity_threshold}")
-    return {'found': False}
+    return {'found': False, 'candidates': candidates}
@@ -45,6 +45,8 @@ class AdminStates(StatesGroup):
     
     # === Состояния для режима работы ===
     waiting_for_group_id = State()
+    waiting_for_group_triggers = State()
+    waiting_for_group_notify_chat = State()
     
     # === Быстрые ответы ===
     waiting_for_quick_reply_name = State()
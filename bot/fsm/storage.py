@@ -0,0 +1,49 @@
+"""
+Хранилище FSM в общем состоянии: состояние диалога админа не теряется,
+если следующий апдейт обработает другой процесс или процесс перезапустится.
+"""
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from bot.shared_state import SharedState
+
+
+class SharedStateStorage(BaseStorage):
+    """
+    FSM-хранилище поверх бэкенда общего состояния.
+
+    Использование:
+        dp = Dispatcher(storage=SharedStateStorage(shared_state))
+    """
+
+    def __init__(self, state: SharedState, ttl: Optional[float] = None):
+        self.state = state
+        self.ttl = ttl  # Незавершённый диалог забывается через ttl секунд (None — никогда)
+
+    @staticmethod
+    def _key(key: StorageKey, part: str) -> str:
+        return f"fsm:{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}:{part}"
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        if state is None:
+            await self.state.backend.delete(self._key(key, "state"))
+        else:
+            await self.state.backend.set(self._key(key, "state"), state, ttl=self.ttl)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self.state.backend.get(self._key(key, "state"))
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        if not data:
+            await self.state.backend.delete(self._key(key, "data"))
+        else:
+            await self.state.backend.set(self._key(key, "data"), dict(data), ttl=self.ttl)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict(await self.state.backend.get(self._key(key, "data")) or {})
+
+    async def close(self) -> None:
+        pass
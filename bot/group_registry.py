@@ -0,0 +1,196 @@
+"""
+Реестр групп: несколько привязанных групп с собственными настройками.
+
+Хранится в settings.json под ключом "groups" (ключ — ID чата):
+
+    "groups": {
+        "-1001234567890": {
+            "title": "Поддержка RU",
+            "mode": "full",              # full | triggers | off
+            "triggers": null,            # null — общие триггеры из settings.json
+            "faq_threshold": null,       # null — общий faq_similarity_threshold
+            "ai_enabled": null,          # null — общий ai_enabled
+            "notify_chat_id": null       # null — ADMIN_ID
+        }
+    }
+
+Старый формат (один group_id / group_title) читается как реестр из одной
+группы и переписывается в новый при первом изменении.
+
+Реестр перечитывается только при изменении settings.json; поиск группы
+по ID чата — O(1), триггеры каждой группы скомпилированы в одно выражение.
+"""
+import logging
+import os
+import re
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from bot.config import ADMIN_ID, SETTINGS_FILE, load_json, save_json
+
+logger = logging.getLogger(__name__)
+
+MODE_FULL = "full"  # Отвечает на обращения (FAQ, триггеры, ИИ) и на триггеры
+MODE_TRIGGERS = "triggers"  # Только триггеры
+MODE_OFF = "off"  # Группа привязана, но бот молчит
+MODES = (MODE_FULL, MODE_TRIGGERS, MODE_OFF)
+
+
+@dataclass
+class GroupConfig:
+    chat_id: int
+    title: str = "Без названия"
+    mode: str = MODE_FULL
+    triggers: Optional[Dict[str, str]] = None
+    faq_threshold: Optional[float] = None
+    ai_enabled: Optional[bool] = None
+    notify_chat_id: Optional[int] = None
+    # Вычисляемые при загрузке: триггеры (свои или общие) и их выражение
+    trigger_items: List[Tuple[str, str]] = field(default_factory=list, repr=False)
+    trigger_pattern: Optional[re.Pattern] = field(default=None, repr=False)
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        for key in ("chat_id", "trigger_items", "trigger_pattern"):
+            data.pop(key)
+        return data
+
+    @classmethod
+    def from_dict(cls, chat_id: int, data: dict) -> "GroupConfig":
+        known = {k: v for k, v in data.items() if k in cls.__dataclass_fields__}
+        known.pop("trigger_items", None)
+        known.pop("trigger_pattern", None)
+        config = cls(chat_id=chat_id, **known)
+        if config.mode not in MODES:
+            config.mode = MODE_FULL
+        return config
+
+    def compile_triggers(self, global_triggers: Dict[str, str]) -> None:
+        triggers = self.triggers if self.triggers is not None else global_triggers
+        self.trigger_items = [(k.lower(), v) for k, v in triggers.items() if k]
+        self.trigger_pattern = re.compile(
+            "|".join(re.escape(keyword) for keyword, _ in self.trigger_items), re.IGNORECASE
+        ) if self.trigger_items else None
+
+    def match_trigger(self, text: str) -> Optional[str]:
+        """Ответ первого (в порядке настроек) триггера, найденного в тексте."""
+        if not text or not self.trigger_pattern or not self.trigger_pattern.search(text):
+            return None
+        text_lower = text.lower()
+        for keyword, response in self.trigger_items:
+            if keyword in text_lower:
+                logger.info(f"Trigger matched in group {self.chat_id}: '{keyword}'")
+                return response
+        return None
+
+    def notify_target(self) -> int:
+        return self.notify_chat_id or ADMIN_ID
+
+
+class GroupRegistry:
+    """Привязанные группы; перечитывается при изменении settings.json."""
+
+    def __init__(self, settings_file: str = SETTINGS_FILE):
+        self.settings_file = settings_file
+        self._settings_key = object()
+        self._groups: Dict[int, GroupConfig] = {}
+        self.enabled = False  # bot_mode == 'group'
+        self.settings: dict = {}
+
+    def refresh(self) -> None:
+        try:
+            stat = os.stat(self.settings_file)
+            key = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            key = None
+        if key == self._settings_key:
+            return
+        self._settings_key = key
+        self._load(load_json(self.settings_file, default_data={}))
+
+    def _load(self, settings: dict) -> None:
+        self.settings = settings
+        self.enabled = settings.get('bot_mode') == 'group'
+        groups: Dict[int, GroupConfig] = {}
+        raw = settings.get('groups')
+        if raw is None and settings.get('group_id'):
+            # Старый формат: одна группа
+            raw = {str(settings['group_id']): {"title": settings.get('group_title', "Без названия")}}
+        for chat_id, data in (raw or {}).items():
+            try:
+                config = GroupConfig.from_dict(int(chat_id), data or {})
+            except (TypeError, ValueError) as e:
+                logger.error(f"Invalid group config {chat_id}: {e}")
+                continue
+            config.compile_triggers(settings.get('triggers', {}))
+            groups[config.chat_id] = config
+        self._groups = groups
+
+    def get(self, chat_id: int) -> Optional[GroupConfig]:
+        self.refresh()
+        return self._groups.get(chat_id)
+
+    def all(self) -> List[GroupConfig]:
+        self.refresh()
+        return list(self._groups.values())
+
+    def _save(self, groups: Dict[int, GroupConfig]) -> None:
+        settings = load_json(self.settings_file, default_data={})
+        settings['groups'] = {str(chat_id): config.to_dict() for chat_id, config in groups.items()}
+        # group_id оставляем для обратной совместимости (первая группа)
+        if groups:
+            first = next(iter(groups.values()))
+            settings['group_id'] = first.chat_id
+            settings['group_title'] = first.title
+        else:
+            settings.pop('group_id', None)
+            settings.pop('group_title', None)
+        save_json(self.settings_file, settings)
+        self._settings_key = object()  # перечитать при следующем обращении
+
+    def link(self, chat_id: int, title: str) -> GroupConfig:
+        """Добавляет группу (или обновляет название уже привязанной)."""
+        self.refresh()
+        groups = dict(self._groups)
+        config = groups.get(chat_id) or GroupConfig(chat_id=chat_id)
+        config.title = title or "Без названия"
+        groups[chat_id] = config
+        self._save(groups)
+        return config
+
+    def unlink(self, chat_id: int) -> bool:
+        self.refresh()
+        if chat_id not in self._groups:
+            return False
+        groups = dict(self._groups)
+        del groups[chat_id]
+        self._save(groups)
+        return True
+
+    def update(self, chat_id: int, **changes) -> Optional[GroupConfig]:
+        """Меняет настройки группы (mode, triggers, faq_threshold, ai_enabled, notify_chat_id)."""
+        self.refresh()
+        config = self._groups.get(chat_id)
+        if config is None:
+            return None
+        for key, value in changes.items():
+            if key not in GroupConfig.__dataclass_fields__ or key in ("chat_id", "trigger_items", "trigger_pattern"):
+                raise ValueError(f"Unknown group setting: {key}")
+            setattr(config, key, value)
+        self._save(self._groups)
+        return config
+
+    # Итоговые значения с учётом общих настроек
+
+    def faq_threshold(self, config: GroupConfig) -> float:
+        if config.faq_threshold is not None:
+            return config.faq_threshold
+        return self.settings.get('faq_similarity_threshold', 0.4)
+
+    def ai_enabled(self, config: GroupConfig) -> bool:
+        if config.ai_enabled is not None:
+            return config.ai_enabled
+        return bool(self.settings.get('ai_enabled', False))
+
+
+group_registry = GroupRegistry()
@@ -1,6 +1,7 @@
 """
 Улучшенная админ-панель с расширенным функционалом.
 """
+import asyncio
 import logging
 import html
 import csv
@@ -11,7 +12,7 @@ from pathlib import Path
 from aiogram import Router, F, types, Bot
 from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
-from aiogram.types import BufferedInputFile, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import BufferedInputFile, FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton
 from zoneinfo import ZoneInfo
 
 from bot.fsm.admin_states import AdminStates
@@ -34,6 +35,7 @@ from bot.keyboards.inline import (
     ai_management_keyboard,
     ai_model_selection_keyboard,
     ai_test_keyboard,
+    ai_stats_keyboard,
     # Бэкапы
     backup_menu_keyboard,
     backup_restore_keyboard,
@@ -44,9 +46,19 @@ from bot.keyboards.inline import (
     # Рассылка
     broadcast_menu_keyboard,
     broadcast_confirm_keyboard,
-    broadcast_done_keyboard,
+    broadcast_progress_keyboard,
+    broadcast_segment_keyboard,
     # Статистика
     dashboard_keyboard,
+    export_users_keyboard,
+    EXPORT_SEGMENT_LABELS,
+    # Режим работы и группы
+    work_mode_keyboard,
+    groups_list_keyboard,
+    group_settings_keyboard,
+    group_input_keyboard,
+    confirm_action_keyboard,
+    GROUP_MODE_LABELS,
     # Справка
     help_menu_keyboard,
     help_back_keyboard,
@@ -55,11 +67,22 @@ from bot import config as bot_config
 from bot.config import SETTINGS_FILE, FAQ_FILE, load_json, save_json, DEFAULT_AI_PROMPT
 from bot.backup_manager import create_backup_file, list_backups, restore_backup_file, send_backup_to_admin
 from bot.user_manager import (
-    get_all_users, get_users_stats, get_user, 
+    get_users_stats, get_activity_stats, get_language_stats, get_user_columns, get_user, 
     block_user, unblock_user, is_user_blocked,
-    get_active_user_ids, add_broadcast_record, get_broadcast_history
+    get_active_user_ids, get_broadcast_history, get_unreachable_stats,
+    get_user_index, get_users_page, get_user_ids_by_recency, iter_user_snapshots, search_users, resolve_segment, count_segment, Segment,
+    UNREACHABLE_BLOCKED_BOT, UNREACHABLE_DEACTIVATED, UNREACHABLE_CHAT_NOT_FOUND,
 )
+from bot.user_index import ORIGIN_PRIVATE, ORIGIN_GROUP
 from bot.ai_integration import get_ai_response
+from bot.ai_stats import get_model_stats, get_failover_stats
+from bot.ai_block_manager import get_grounding_stats
+from bot.ai_dispatcher import ai_dispatcher
+from bot.broadcast import broadcast_engine
+from bot.user_export import COLUMN_PRESETS, UsersCsvWriter, cleanup
+from bot.group_registry import group_registry
+from bot.welcome_image import DEFAULT_WELCOME_IMAGE_PATH, file_digest, forget_file_id, remember_file_id, send_welcome_photo
+from bot.remnawave_integration import remnawave_client, sync_subscription_expiry
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -93,6 +116,7 @@ async def show_dashboard(callback: types.CallbackQuery, state: FSMContext):
     
     # Статистика пользователей
     user_stats = get_users_stats()
+    activity = get_activity_stats()
     
     # Статистика FAQ
     faq_list = load_json(FAQ_FILE, default_data=[])
@@ -113,6 +137,10 @@ async def show_dashboard(callback: types.CallbackQuery, state: FSMContext):
         f"👥 <b>Пользователи</b>\n"
         f"├ Всего: {user_stats['total']}\n"
         f"├ Заблокировано: {user_stats['blocked']}\n"
+        f"├ Недоступны (бот заблокирован / удалены): {user_stats['unreachable']}\n"
+        f"├ Доступны для рассылки: {user_stats['reachable']}\n"
+        f"├ Активны сегодня / 7 / 30 дн: {activity['dau']} / {activity['wau']} / {activity['mau']}\n"
+        f"├ Новых за 7 дней: {activity['new_week']}\n"
         f"└ Сообщений: {user_stats['total_messages']}\n\n"
         f"🗂️ <b>FAQ</b>\n"
         f"└ Вопросов: {faq_count}\n\n"
@@ -130,41 +158,128 @@ async def show_dashboard(callback: types.CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
-@router.callback_query(F.data == "admin_export_users")
-async def export_users_csv(callback: types.CallbackQuery, bot: Bot):
-    """Экспорт пользователей в CSV."""
-    users = get_all_users()
+@router.callback_query(F.data == "admin_analytics")
+async def show_analytics(callback: types.CallbackQuery):
+    """Аналитика по колоночному снимку пользователей."""
+    columns = get_user_columns()
+    if not len(columns):
+        return await callback.answer("Пользователей пока нет", show_alert=True)
     
-    if not users:
-        return await callback.answer("Нет пользователей для экспорта", show_alert=True)
+    now = int(datetime.now(timezone.utc).timestamp())
+    total = len(columns)
     
-    # Создаём CSV в памяти
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['ID', 'Имя', 'Username', 'Первое сообщение', 'Последнее сообщение', 'Сообщений', 'Заблокирован'])
+    text = f"📈 <b>Аналитика</b> ({total} польз.)\n\n<b>Последняя активность</b>\n"
+    for label, count in columns.activity_distribution(now):
+        text += f"├ {label}: {count} ({count / total * 100:.1f}%)\n"
     
-    for user in users:
-        writer.writerow([
-            user.get('user_id', ''),
-            user.get('name', ''),
-            user.get('username', ''),
-            user.get('first_seen', '')[:19] if user.get('first_seen') else '',
-            user.get('last_seen', '')[:19] if user.get('last_seen') else '',
-            user.get('message_count', 0),
-            'Да' if user.get('blocked') else 'Нет'
-        ])
+    percentiles = columns.message_percentiles((50, 90, 99))
+    text += (
+        f"\n💬 <b>Сообщений на пользователя</b>\n"
+        f"└ медиана {percentiles[50]}, p90 {percentiles[90]}, p99 {percentiles[99]}\n"
+    )
     
-    # Отправляем файл
-    csv_bytes = output.getvalue().encode('utf-8-sig')
-    tz = ZoneInfo(bot_config.TIMEZONE) if bot_config.TIMEZONE else timezone.utc
-    filename = f"users_{datetime.now(tz).strftime('%Y%m%d_%H%M%S')}.csv"
+    top_langs = columns.language_split()[:5]
+    text += "\n🌐 <b>Языки</b>: " + ", ".join(f"{lang} {count}" for lang, count in top_langs) + "\n"
     
-    await bot.send_document(
-        chat_id=callback.from_user.id,
-        document=BufferedInputFile(csv_bytes, filename=filename),
-        caption=f"📤 Экспорт пользователей\nВсего: {len(users)}"
+    text += "\n👥 <b>Когорты по неделе прихода</b>\n<i>новых · вернулись после 1-й недели · активны за 7 дн</i>\n"
+    for cohort in columns.cohort_retention(now, weeks=6):
+        users = cohort['users']
+        if not users:
+            continue
+        returned = cohort['returned'] / users * 100
+        active = cohort['active'] / users * 100
+        week = "эта неделя" if cohort['weeks_ago'] == 0 else f"{cohort['weeks_ago']} нед. назад"
+        text += f"├ {week}: {users} · {returned:.0f}% · {active:.0f}%\n"
+    
+    try:
+        await callback.message.edit_text(
+            text,
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text="‹ Назад", callback_data="admin_dashboard")],
+            ]),
+            parse_mode="HTML"
+        )
+    except TelegramBadRequest:
+        pass
+    await callback.answer()
+
+
+def _export_user_ids(segment: str) -> list[int]:
+    """ID пользователей для выгрузки (по индексам, по убыванию активности)."""
+    index = get_user_index()
+    if segment == "active30":
+        only = set(resolve_segment(Segment(seen_within_days=30)))
+    elif segment == "reachable":
+        only = index.reachable()
+    elif segment == "blocked":
+        only = set(index.blocked)
+    else:
+        only = None
+    return get_user_ids_by_recency(only)
+
+
+@router.callback_query(F.data == "admin_export_users")
+@router.callback_query(F.data.startswith("admin_export_set_"))
+async def export_users_menu(callback: types.CallbackQuery):
+    """Параметры выгрузки пользователей в CSV."""
+    segment, columns, compress = "all", "basic", False
+    if callback.data.startswith("admin_export_set_"):
+        segment, columns, gz = callback.data[len("admin_export_set_"):].rsplit("_", 2)
+        compress = gz == "1"
+    
+    text = (
+        "📤 <b>Экспорт пользователей (CSV)</b>\n\n"
+        "Выберите аудиторию и набор колонок. Большая выгрузка "
+        "делится на несколько файлов (лимит Telegram — 50 МБ)."
     )
-    await callback.answer("CSV отправлен!")
+    try:
+        await callback.message.edit_text(
+            text, reply_markup=export_users_keyboard(segment, columns, compress), parse_mode="HTML"
+        )
+    except TelegramBadRequest:
+        pass
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("admin_export_run_"))
+async def export_users_csv(callback: types.CallbackQuery, bot: Bot):
+    """Экспорт пользователей в CSV: пачки снимков пишутся в файлы в рабочем потоке."""
+    segment, columns, gz = callback.data[len("admin_export_run_"):].rsplit("_", 2)
+    compress = gz == "1"
+    if segment not in EXPORT_SEGMENT_LABELS or columns not in COLUMN_PRESETS:
+        return await callback.answer("Неизвестные параметры выгрузки", show_alert=True)
+    
+    user_ids = _export_user_ids(segment)
+    if not user_ids:
+        return await callback.answer("Нет пользователей для экспорта", show_alert=True)
+    
+    await callback.answer("⏳ Готовлю выгрузку...")
+    writer = UsersCsvWriter(COLUMN_PRESETS[columns], compress)
+    try:
+        async for chunk in iter_user_snapshots(user_ids):
+            await asyncio.to_thread(writer.write, chunk)
+        result = await asyncio.to_thread(writer.close)
+    except BaseException:
+        await asyncio.to_thread(writer.abort)
+        raise
+    
+    tz = ZoneInfo(bot_config.TIMEZONE) if bot_config.TIMEZONE else timezone.utc
+    stamp = datetime.now(tz).strftime('%Y%m%d_%H%M%S')
+    suffix = ".csv.gz" if compress else ".csv"
+    total_parts = len(result.parts)
+    try:
+        for number, path in enumerate(result.parts, 1):
+            part = f"_part{number}" if total_parts > 1 else ""
+            caption = f"📤 Экспорт пользователей ({EXPORT_SEGMENT_LABELS[segment]})\nВсего: {result.rows}"
+            if total_parts > 1:
+                caption += f"\nЧасть {number}/{total_parts}"
+            await bot.send_document(
+                chat_id=callback.from_user.id,
+                document=FSInputFile(path, filename=f"users_{stamp}{part}{suffix}"),
+                caption=caption,
+            )
+    finally:
+        cleanup(result)
 
 
 # ============================================================================
@@ -266,6 +381,11 @@ async def process_welcome_image(message: types.Message, state: FSMContext, bot:
         settings["welcome_image_path"] = str(target_path)
         save_json(SETTINGS_FILE, settings)
 
+        # Старый file_id больше не подходит; фото (не документ) можно сразу слать по file_id
+        forget_file_id()
+        if message.photo:
+            remember_file_id(file_digest(str(target_path)), file_id)
+
         await state.clear()
         await message.answer("✅ Изображение приветствия обновлено!", reply_markup=admin_start_keyboard())
     except Exception as e:
@@ -282,16 +402,17 @@ async def preview_welcome(callback: types.CallbackQuery, bot: Bot):
     user_name = html.escape(callback.from_user.full_name or "Тестовый Пользователь")
     welcome_text = (raw_text or "").replace("{user_name}", user_name)
     
-    image_path = settings.get("welcome_image_path") or "bot/assets/welcome.jpg"
+    image_path = settings.get("welcome_image_path") or DEFAULT_WELCOME_IMAGE_PATH
     
     try:
-        from aiogram.types import FSInputFile
-        photo = FSInputFile(image_path)
-        await bot.send_photo(
-            chat_id=callback.from_user.id,
-            photo=photo,
-            caption=f"👁️ <b>Предпросмотр приветствия:</b>\n\n{welcome_text}",
-            parse_mode="HTML",
+        await send_welcome_photo(
+            lambda photo: bot.send_photo(
+                chat_id=callback.from_user.id,
+                photo=photo,
+                caption=f"👁️ <b>Предпросмотр приветствия:</b>\n\n{welcome_text}",
+                parse_mode="HTML",
+            ),
+            image_path,
         )
     except Exception as e:
         await bot.send_message(
@@ -1104,6 +1225,66 @@ async def process_ai_test(message: types.Message, state: FSMContext, bot: Bot):
         )
 
 
+@router.callback_query(F.data == "admin_ai_stats")
+async def ai_stats_screen(callback: types.CallbackQuery):
+    """Статистика использования ИИ по моделям: задержки, токены, ошибки, failover."""
+    def fmt_sec(value):
+        return f"{value:.1f}с" if value is not None else "—"
+
+    text = "📈 <b>Статистика ИИ</b>\n<i>с момента запуска бота</i>\n\n"
+
+    models = get_model_stats()
+    if not models:
+        text += "Запросов к ИИ пока не было.\n"
+    for m in models:
+        total = m['ok'] + m['errors']
+        text += (
+            f"<b>{html.escape(m['service'].capitalize())}</b> · <code>{html.escape(m['model'])}</code>\n"
+            f"├ Запросов: {total} (✓{m['ok']} ✗{m['errors']})\n"
+            f"├ Задержка: p50 {fmt_sec(m['p50'])}, p95 {fmt_sec(m['p95'])}, ср. {fmt_sec(m['avg_latency'])}\n"
+            f"├ Токены: {m['prompt_tokens']} → {m['completion_tokens']}\n"
+        )
+        if m['ok']:
+            text += f"├ Токенов на ответ: {(m['prompt_tokens'] + m['completion_tokens']) // m['ok']}\n"
+        if m['top_errors']:
+            errors = ", ".join(f"{html.escape(name)}×{count}" for name, count in m['top_errors'])
+            text += f"└ Ошибки: {errors}\n\n"
+        else:
+            text += "└ Ошибок нет\n\n"
+
+    failover = get_failover_stats()
+    if failover:
+        text += "<b>Failover</b> (какая модель ответила)\n"
+        for service, depths in failover.items():
+            parts = []
+            for depth, count in sorted(depths.items(), key=lambda x: (x[0] == "exhausted", x[0])):
+                label = "все упали" if depth == "exhausted" else f"#{int(depth) + 1}"
+                parts.append(f"{label}: {count}")
+            text += f"• {html.escape(service.capitalize())}: {', '.join(parts)}\n"
+        text += "\n"
+
+    grounding = get_grounding_stats()
+    if grounding['grounded']:
+        rate = grounding['resolved_rate'] * 100
+        text += (
+            f"<b>Ответы с опорой на FAQ</b>\n"
+            f"└ {grounding['grounded']}, без подключения админа: {rate:.0f}%\n\n"
+        )
+
+    queue = ai_dispatcher.get_stats()
+    text += (
+        f"<b>Очередь</b>\n"
+        f"└ Сейчас: {queue['in_flight']}/{queue['max_concurrency']}, в очереди: {queue['queue_depth']}, "
+        f"сброшено: {queue['timed_out'] + queue['rejected']}"
+    )
+
+    try:
+        await callback.message.edit_text(text, reply_markup=ai_stats_keyboard(), parse_mode="HTML")
+    except TelegramBadRequest:
+        pass
+    await callback.answer()
+
+
 # ============================================================================
 # БЭКАПЫ
 # ============================================================================
@@ -1309,36 +1490,37 @@ async def users_menu(callback: types.CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
-@router.callback_query(F.data == "admin_users_list")
-async def users_list(callback: types.CallbackQuery):
-    """Список пользователей."""
-    users = get_all_users()
+async def _show_users_page(callback: types.CallbackQuery, cursor: str = None, backward: bool = False):
+    """Страница списка пользователей (по убыванию последней активности)."""
+    page = get_users_page(cursor, backward=backward)
     
-    if not users:
+    if not page['users']:
         return await callback.answer("Пользователей пока нет", show_alert=True)
     
-    await callback.message.edit_text(
-        f"📋 <b>Список пользователей</b> ({len(users)})\n\n"
-        f"🚫 = заблокирован",
-        reply_markup=users_list_keyboard(users, page=0),
-        parse_mode="HTML"
-    )
+    try:
+        await callback.message.edit_text(
+            f"📋 <b>Список пользователей</b> ({page['total']})\n\n"
+            f"🚫 = заблокирован",
+            reply_markup=users_list_keyboard(page['users'], page['prev'], page['next']),
+            parse_mode="HTML"
+        )
+    except TelegramBadRequest:
+        pass
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("admin_users_page_"))
+@router.callback_query(F.data == "admin_users_list")
+async def users_list(callback: types.CallbackQuery):
+    """Список пользователей."""
+    await _show_users_page(callback)
+
+
+@router.callback_query(F.data.startswith("admin_users_next_") | F.data.startswith("admin_users_prev_"))
 async def users_list_page(callback: types.CallbackQuery):
-    """Пагинация списка пользователей."""
-    page = int(callback.data.split('_')[-1])
-    users = get_all_users()
-    
-    await callback.message.edit_text(
-        f"📋 <b>Список пользователей</b> ({len(users)})\n\n"
-        f"🚫 = заблокирован",
-        reply_markup=users_list_keyboard(users, page=page),
-        parse_mode="HTML"
-    )
-    await callback.answer()
+    """Пагинация списка пользователей по курсору из callback_data."""
+    backward = callback.data.startswith("admin_users_prev_")
+    cursor = callback.data[len("admin_users_next_"):]
+    await _show_users_page(callback, cursor, backward=backward)
 
 
 @router.callback_query(F.data.startswith("admin_user_info_"))
@@ -1358,6 +1540,14 @@ async def user_info(callback: types.CallbackQuery):
     blocked = user.get('blocked', False)
     
     status = "🚫 Заблокирован" if blocked else "✅ Активен"
+    unreachable_reasons = {
+        UNREACHABLE_BLOCKED_BOT: "заблокировал бота",
+        UNREACHABLE_DEACTIVATED: "аккаунт удалён",
+        UNREACHABLE_CHAT_NOT_FOUND: "чат не найден",
+    }
+    if user.get('unreachable'):
+        reason = unreachable_reasons.get(user['unreachable'], user['unreachable'])
+        status += f"\nРассылка: 📵 недоступен ({reason}, {user.get('unreachable_at', '')[:10]})"
     
     text = (
         f"👤 <b>Пользователь</b>\n\n"
@@ -1384,10 +1574,10 @@ async def toggle_user_block(callback: types.CallbackQuery):
     user_id = int(callback.data.split('_')[-1])
     
     if is_user_blocked(user_id):
-        unblock_user(user_id)
+        await unblock_user(user_id)
         await callback.answer("✅ Пользователь разблокирован")
     else:
-        block_user(user_id)
+        await block_user(user_id)
         await callback.answer("🚫 Пользователь заблокирован")
     
     # Обновляем информацию
@@ -1432,7 +1622,7 @@ async def users_block_start(callback: types.CallbackQuery, state: FSMContext):
 async def process_user_block(message: types.Message, state: FSMContext):
     try:
         user_id = int(message.text.strip())
-        block_user(user_id)
+        await block_user(user_id)
         await state.clear()
         await message.answer(f"🚫 Пользователь {user_id} заблокирован", reply_markup=users_menu_keyboard())
     except ValueError:
@@ -1456,7 +1646,7 @@ async def users_unblock_start(callback: types.CallbackQuery, state: FSMContext):
 async def process_user_unblock(message: types.Message, state: FSMContext):
     try:
         user_id = int(message.text.strip())
-        if unblock_user(user_id):
+        if await unblock_user(user_id):
             await state.clear()
             await message.answer(f"✅ Пользователь {user_id} разблокирован", reply_markup=users_menu_keyboard())
         else:
@@ -1481,18 +1671,7 @@ async def users_search_start(callback: types.CallbackQuery, state: FSMContext):
 
 @router.message(AdminStates.waiting_for_user_search)
 async def process_user_search(message: types.Message, state: FSMContext):
-    query = message.text.strip().lower()
-    users = get_all_users()
-    
-    # Ищем по ID, имени или username
-    results = []
-    for user in users:
-        uid = str(user.get('user_id', ''))
-        name = (user.get('name') or '').lower()
-        username = (user.get('username') or '').lower()
-        
-        if query in uid or query in name or query in username:
-            results.append(user)
+    results, total = search_users(message.text or "", limit=10)
     
     await state.clear()
     
@@ -1518,37 +1697,51 @@ async def process_user_search(message: types.Message, state: FSMContext):
     else:
         # Показываем список
         await message.answer(
-            f"🔍 <b>Найдено: {len(results)}</b>",
-            reply_markup=users_list_keyboard(results, page=0),
+            f"🔍 <b>Найдено: {total}</b>"
+            + (f"\nПоказаны первые {len(results)}" if total > len(results) else ""),
+            reply_markup=users_list_keyboard(results),
             parse_mode="HTML"
         )
 
 
+def _trend(current: int, previous: int) -> str:
+    """Изменение к прошлому периоду: ↑12% / ↓5% / →."""
+    if not previous:
+        return ""
+    change = (current - previous) / previous * 100
+    if abs(change) < 0.5:
+        return "→"
+    return f"{'↑' if change > 0 else '↓'}{abs(change):.0f}%"
+
+
 @router.callback_query(F.data == "admin_users_stats")
 async def users_stats(callback: types.CallbackQuery):
     """Статистика пользователей."""
     stats = get_users_stats()
-    users = get_all_users()
-    
-    # Считаем активных за последние 7 дней
-    from datetime import timedelta
-    week_ago = datetime.now(timezone.utc) - timedelta(days=7)
-    active_week = 0
-    for user in users:
-        try:
-            last_seen = datetime.fromisoformat(user.get('last_seen', '').replace('Z', '+00:00'))
-            if last_seen > week_ago:
-                active_week += 1
-        except Exception:
-            pass
+    activity = get_activity_stats()
     
     text = (
         f"📊 <b>Статистика пользователей</b>\n\n"
         f"👥 Всего: {stats['total']}\n"
         f"🚫 Заблокировано: {stats['blocked']}\n"
-        f"📅 Активных за неделю: {active_week}\n"
-        f"💬 Всего сообщений: {stats['total_messages']}"
-    )
+        f"💬 Всего сообщений: {stats['total_messages']}\n\n"
+        f"📅 <b>Активность</b> (сутки UTC, к прошлому периоду)\n"
+        f"├ Сегодня: {activity['dau']} {_trend(activity['dau'], activity['dau_prev'])}\n"
+        f"├ 7 дней: {activity['wau']} {_trend(activity['wau'], activity['wau_prev'])}\n"
+        f"└ 30 дней: {activity['mau']} {_trend(activity['mau'], activity['mau_prev'])}\n"
+        f"📈 По дням: {' · '.join(str(n) for n in activity['daily'])}\n\n"
+        f"🆕 <b>Новые</b>: сегодня {activity['new_today']}, "
+        f"7 дн {activity['new_week']}, 30 дн {activity['new_month']}"
+    )
+    
+    unreachable = get_unreachable_stats()
+    if unreachable:
+        text += (
+            f"\n\n📵 <b>Недоступны для рассылки:</b> {sum(unreachable.values())}\n"
+            f"├ Заблокировали бота: {unreachable.get(UNREACHABLE_BLOCKED_BOT, 0)}\n"
+            f"├ Аккаунт удалён: {unreachable.get(UNREACHABLE_DEACTIVATED, 0)}\n"
+            f"└ Чат не найден: {unreachable.get(UNREACHABLE_CHAT_NOT_FOUND, 0)}"
+        )
     
     await callback.message.edit_text(text, reply_markup=users_menu_keyboard(), parse_mode="HTML")
     await callback.answer()
@@ -1575,9 +1768,16 @@ async def broadcast_menu(callback: types.CallbackQuery, state: FSMContext):
             preview = h.get('message_preview', '')[:30]
             history_text += f"• {ts}: {sent} получателей\n  <i>{html.escape(preview)}...</i>\n"
     
+    running_text = ""
+    job_status = await broadcast_engine.get_status()
+    if job_status:
+        status = "⏸ Рассылка на паузе" if job_status['state'] == "paused" else "⏳ Идёт рассылка"
+        running_text = f"\n{status}: {job_status['processed']}/{job_status['total']}"
+    
     text = (
         f"📢 <b>Рассылка</b>\n\n"
         f"Активных пользователей: {active_users}"
+        f"{running_text}"
         f"{history_text}"
     )
     
@@ -1597,79 +1797,264 @@ async def broadcast_new(callback: types.CallbackQuery, state: FSMContext):
     await callback.message.edit_text(
         f"📨 <b>Новая рассылка</b>\n\n"
         f"Получателей: {active_count}\n\n"
-        f"Введите текст сообщения для рассылки:\n"
-        f"<i>(поддерживается HTML-форматирование)</i>",
+        f"Отправьте сообщение для рассылки:\n"
+        f"<i>текст (поддерживается HTML-форматирование) или фото, видео, документ, "
+        f"голосовое — с подписью или без</i>",
         reply_markup=back_to_admin_panel(),
         parse_mode="HTML"
     )
     await callback.answer()
 
 
+# Подписи типов сообщений для предпросмотра и истории рассылок
+BROADCAST_CONTENT_LABELS = {
+    "photo": "🖼 Фото",
+    "video": "🎬 Видео",
+    "animation": "🎞 GIF",
+    "document": "📎 Документ",
+    "audio": "🎵 Аудио",
+    "voice": "🎤 Голосовое",
+    "video_note": "⏺ Видеосообщение",
+    "sticker": "🩷 Стикер",
+    "poll": "📊 Опрос",
+}
+
+
+def _describe_segment(segment: Segment) -> str:
+    """Человекочитаемое описание аудитории рассылки."""
+    parts = []
+    if segment.languages:
+        parts.append("язык: " + ", ".join(segment.languages))
+    if segment.seen_within_days:
+        parts.append(f"активны за {segment.seen_within_days} дн")
+    if segment.not_seen_days:
+        parts.append(f"не заходили {segment.not_seen_days}+ дн")
+    if segment.min_messages is not None or segment.max_messages is not None:
+        low, high = segment.min_messages, segment.max_messages
+        if low == high:
+            parts.append(f"сообщений: {low}")
+        elif high is None:
+            parts.append(f"сообщений: {low}+")
+        else:
+            parts.append(f"сообщений: {low}–{high}")
+    if segment.origin:
+        parts.append("из лички" if segment.origin == ORIGIN_PRIVATE else "из группы")
+    if segment.expiring_within_days:
+        parts.append(f"подписка истекает за {segment.expiring_within_days} дн")
+    return "; ".join(parts) or "все пользователи"
+
+
+def _broadcast_confirm_text(data: dict) -> str:
+    """Экран подтверждения рассылки с размером выбранного сегмента."""
+    segment = Segment.from_dict(data.get('broadcast_segment'))
+    preview_text = data.get('broadcast_preview', '')
+    kind = data.get('broadcast_kind')
+    kind_line = f"<b>Тип:</b> {kind}\n" if kind else ""
+    preview = html.escape(preview_text[:200])
+    return (
+        f"📨 <b>Подтверждение рассылки</b>\n\n"
+        f"{kind_line}"
+        f"<b>Текст:</b>\n{preview}{'...' if len(preview_text) > 200 else ''}\n\n"
+        f"<b>Аудитория:</b> {html.escape(_describe_segment(segment))}\n"
+        f"<b>Получателей:</b> {count_segment(segment)}\n\n"
+        f"Отправить?"
+    )
+
+
 @router.message(AdminStates.waiting_for_broadcast_message)
 async def process_broadcast_message(message: types.Message, state: FSMContext):
-    """Обработка текста рассылки."""
-    await state.update_data(broadcast_text=message.text)
+    """Обработка сообщения для рассылки (текст или любое медиа)."""
+    if message.text:
+        # Текст рассылается через send_message с HTML-разметкой
+        await state.update_data(
+            broadcast_text=message.text,
+            broadcast_source=None,
+            broadcast_preview=message.text,
+            broadcast_kind=None,
+        )
+    else:
+        # Остальное копируется из этого сообщения (copy_message): файл не загружается заново
+        label = BROADCAST_CONTENT_LABELS.get(message.content_type, "📦 Сообщение")
+        caption = message.caption or ""
+        await state.update_data(
+            broadcast_text=f"[{label}] {caption}".strip(),
+            broadcast_source=[message.chat.id, message.message_id],
+            broadcast_preview=caption,
+            broadcast_kind=label,
+        )
     await state.set_state(AdminStates.waiting_for_broadcast_confirm)
     
-    active_count = len(get_active_user_ids())
-    preview = html.escape(message.text[:200])
-    
     await message.answer(
-        f"📨 <b>Подтверждение рассылки</b>\n\n"
-        f"<b>Текст:</b>\n{preview}{'...' if len(message.text) > 200 else ''}\n\n"
-        f"<b>Получателей:</b> {active_count}\n\n"
-        f"Отправить?",
+        _broadcast_confirm_text(await state.get_data()),
         reply_markup=broadcast_confirm_keyboard(),
         parse_mode="HTML"
     )
 
 
+@router.callback_query(F.data.startswith("admin_bc_seg_"), AdminStates.waiting_for_broadcast_confirm)
+async def broadcast_segment(callback: types.CallbackQuery, state: FSMContext):
+    """Выбор аудитории рассылки: размер сегмента пересчитывается по индексам на каждый клик."""
+    action = callback.data[len("admin_bc_seg_"):]
+    data = await state.get_data()
+    segment = dict(data.get('broadcast_segment') or {})
+    
+    if action == "done":
+        await callback.message.edit_text(
+            _broadcast_confirm_text(data),
+            reply_markup=broadcast_confirm_keyboard(segmented=bool(segment)),
+            parse_mode="HTML"
+        )
+        return await callback.answer()
+    
+    if action == "reset":
+        segment = {}
+    elif action.startswith("lang_"):
+        lang = action[len("lang_"):]
+        languages = segment.get("languages", [])
+        segment["languages"] = [l for l in languages if l != lang] if lang in languages else languages + [lang]
+    elif action.startswith("seen_"):
+        value = action[len("seen_"):]
+        segment.pop("seen_within_days", None)
+        segment.pop("not_seen_days", None)
+        if value.startswith("idle"):
+            segment["not_seen_days"] = int(value[len("idle"):])
+        elif value != "any":
+            segment["seen_within_days"] = int(value)
+    elif action.startswith("msgs_"):
+        low, high = {"1": (1, 1), "2-9": (2, 9), "10p": (10, None)}.get(action[len("msgs_"):], (None, None))
+        segment["min_messages"], segment["max_messages"] = low, high
+    elif action.startswith("origin_"):
+        value = action[len("origin_"):]
+        segment["origin"] = value if value in (ORIGIN_PRIVATE, ORIGIN_GROUP) else None
+    elif action.startswith("exp_"):
+        value = action[len("exp_"):]
+        segment["expiring_within_days"] = None if value == "any" else int(value)
+        if value != "any" and await sync_subscription_expiry() is None:
+            return await callback.answer("Не удалось получить данные Remnawave", show_alert=True)
+    
+    segment = Segment.from_dict(segment).to_dict()
+    await state.update_data(broadcast_segment=segment)
+    
+    index = get_user_index()
+    languages = [
+        lang for lang, _ in sorted(index.language_counts().items(), key=lambda x: x[1], reverse=True)
+        if lang != "unknown"
+    ][:5]
+    size = count_segment(Segment.from_dict(segment))
+    text = (
+        f"🎯 <b>Аудитория рассылки</b>\n\n"
+        f"{html.escape(_describe_segment(Segment.from_dict(segment)))}\n\n"
+        f"👥 Получателей: <b>{size}</b> из {index.reachable_count()}\n\n"
+        f"<i>Строки: язык · активность · число сообщений · откуда писали"
+        f"{' · подписка' if remnawave_client else ''}</i>"
+    )
+    try:
+        await callback.message.edit_text(
+            text,
+            reply_markup=broadcast_segment_keyboard(segment, languages, remnawave=remnawave_client is not None),
+            parse_mode="HTML"
+        )
+    except TelegramBadRequest:
+        pass
+    await callback.answer()
+
+
 @router.callback_query(F.data == "admin_broadcast_confirm", AdminStates.waiting_for_broadcast_confirm)
 async def confirm_broadcast(callback: types.CallbackQuery, state: FSMContext, bot: Bot):
     """Подтверждение и отправка рассылки."""
     data = await state.get_data()
     text = data.get('broadcast_text', '')
+    source = data.get('broadcast_source')
     
     if not text:
         await state.clear()
         return await callback.answer("Текст рассылки пуст", show_alert=True)
     
-    await callback.message.edit_text("⏳ <b>Рассылка...</b>", parse_mode="HTML")
-    
-    user_ids = get_active_user_ids()
-    sent = 0
-    failed = 0
-    
-    for user_id in user_ids:
-        try:
-            await bot.send_message(
-                chat_id=user_id,
-                text=text,
-                parse_mode="HTML"
-            )
-            sent += 1
-        except Exception as e:
-            logger.warning(f"Broadcast to {user_id} failed: {e}")
-            failed += 1
-        
-        # Небольшая задержка чтобы не превысить лимиты
-        import asyncio
-        await asyncio.sleep(0.05)
-    
-    # Сохраняем историю
-    add_broadcast_record(text, sent, failed)
+    if broadcast_engine.has_job:
+        return await callback.answer("Другая рассылка ещё не завершена", show_alert=True)
     
+    user_ids = resolve_segment(Segment.from_dict(data.get('broadcast_segment')))
+    if not user_ids:
+        return await callback.answer("В выбранной аудитории нет получателей", show_alert=True)
+    if not await broadcast_engine.claim():
+        # Рассылку выполняет другой процесс бота
+        return await callback.answer("Другая рассылка ещё не завершена", show_alert=True)
     await state.clear()
+    
+    # Рассылка идёт в фоне: прогресс обновляется в этом же сообщении
+    job = broadcast_engine.start(
+        bot,
+        text,
+        user_ids,
+        progress_chat_id=callback.message.chat.id,
+        progress_message_id=callback.message.message_id,
+        source_chat_id=source[0] if source else None,
+        source_message_id=source[1] if source else None,
+    )
     await callback.message.edit_text(
-        f"✅ <b>Рассылка завершена</b>\n\n"
-        f"📬 Отправлено: {sent}\n"
-        f"❌ Ошибок: {failed}",
-        reply_markup=broadcast_done_keyboard(),
+        broadcast_engine.format_progress(job),
+        reply_markup=broadcast_progress_keyboard(job.job_id),
         parse_mode="HTML"
     )
     await callback.answer()
 
 
+def _broadcast_job_from_callback(callback: types.CallbackQuery):
+    """Текущее задание рассылки, если кнопка относится к нему."""
+    job_id = int(callback.data.rsplit("_", 1)[1])
+    job = broadcast_engine.current
+    if job is None or job.job_id != job_id or not broadcast_engine.has_job:
+        return None
+    return job
+
+
+async def _forward_broadcast_command(callback: types.CallbackQuery, command: str) -> bool:
+    """Рассылку выполняет другой процесс бота — команда уходит ему через общее состояние."""
+    job_id = int(callback.data.rsplit("_", 1)[1])
+    if not await broadcast_engine.send_command(job_id, command):
+        return False
+    await callback.answer("⏳ Команда передана, прогресс обновится через несколько секунд")
+    return True
+
+
+@router.callback_query(F.data.startswith("admin_bc_pause_"))
+async def pause_broadcast(callback: types.CallbackQuery):
+    """Пауза рассылки."""
+    job = _broadcast_job_from_callback(callback)
+    if job is None and await _forward_broadcast_command(callback, "pause"):
+        return
+    if job is None or not broadcast_engine.pause():
+        return await callback.answer("Рассылка уже завершена", show_alert=True)
+    await callback.answer("⏸ Рассылка приостанавливается...")
+
+
+@router.callback_query(F.data.startswith("admin_bc_resume_"))
+async def resume_broadcast(callback: types.CallbackQuery, bot: Bot):
+    """Продолжение рассылки после паузы."""
+    job = _broadcast_job_from_callback(callback)
+    if job is None and await _forward_broadcast_command(callback, "resume"):
+        return
+    if job is None or not await broadcast_engine.resume(bot):
+        return await callback.answer("Рассылка не на паузе", show_alert=True)
+    await callback.message.edit_text(
+        broadcast_engine.format_progress(job),
+        reply_markup=broadcast_progress_keyboard(job.job_id),
+        parse_mode="HTML"
+    )
+    await callback.answer("▶️ Рассылка продолжена")
+
+
+@router.callback_query(F.data.startswith("admin_bc_cancel_"))
+async def stop_broadcast(callback: types.CallbackQuery, bot: Bot):
+    """Отмена идущей рассылки (итоговое сообщение формирует движок)."""
+    job = _broadcast_job_from_callback(callback)
+    if job is None and await _forward_broadcast_command(callback, "cancel"):
+        return
+    if job is None or not await broadcast_engine.cancel(bot):
+        return await callback.answer("Рассылка уже завершена", show_alert=True)
+    await callback.answer("⏹ Рассылка отменена")
+
+
 @router.callback_query(F.data == "admin_broadcast_cancel")
 async def cancel_broadcast(callback: types.CallbackQuery, state: FSMContext):
     """Отмена рассылки."""
@@ -1692,7 +2077,18 @@ async def broadcast_history(callback: types.CallbackQuery):
         sent = h.get('sent', 0)
         failed = h.get('failed', 0)
         preview = html.escape(h.get('message_preview', '')[:50])
-        text += f"<b>{ts}</b>\n✓{sent} ✗{failed}\n<i>{preview}...</i>\n\n"
+        details = f"✓{sent} ✗{failed}"
+        if h.get('unknown'):
+            details += f" ?{h['unknown']}"
+        if h.get('unreachable'):
+            details += f" (🚫{h['unreachable']})"
+        if h.get('total') is not None:
+            details += f" из {h['total']}"
+        if h.get('duration') is not None:
+            details += f" · {int(h['duration']) // 60} мин {int(h['duration']) % 60} сек"
+        if h.get('status') == "cancelled":
+            details += " · отменена"
+        text += f"<b>{ts}</b>\n{details}\n<i>{preview}...</i>\n\n"
     
     await callback.message.edit_text(text, reply_markup=broadcast_menu_keyboard(), parse_mode="HTML")
     await callback.answer()
@@ -1840,13 +2236,21 @@ async def help_broadcast(callback: types.CallbackQuery):
         "Массовая отправка сообщений всем пользователям.\n\n"
         "<b>Как использовать:</b>\n"
         "1. Нажмите «Новая рассылка»\n"
-        "2. Введите текст сообщения\n"
+        "2. Отправьте текст или медиа (фото, видео, документ...)\n"
         "3. Проверьте предпросмотр\n"
         "4. Подтвердите отправку\n\n"
         "<b>Важно:</b>\n"
         "• Рассылка отправляется только незаблокированным пользователям\n"
+        "• Кнопка «Аудитория» ограничивает рассылку сегментом: язык, активность, "
+        "число сообщений, личка/группа, окончание подписки Remnawave\n"
+        "• Кто заблокировал бота или удалил аккаунт, помечается недоступным и исключается "
+        "из следующих рассылок (до первого нового сообщения боту)\n"
         "• Поддерживается HTML-разметка\n"
-        "• Отправка происходит с задержкой, чтобы не превысить лимиты Telegram\n"
+        "• Медиа копируется из вашего сообщения без повторной загрузки — "
+        "не удаляйте его до конца рассылки\n"
+        "• Рассылка идёт в фоне с темпом под лимиты Telegram, прогресс обновляется в сообщении\n"
+        "• Рассылку можно приостановить, продолжить или отменить кнопками под прогрессом\n"
+        "• После перезапуска бота рассылка продолжается с места остановки\n"
         "• История сохраняет последние 20 рассылок"
     )
     await callback.message.edit_text(text, reply_markup=help_back_keyboard(), parse_mode="HTML")
@@ -2060,48 +2464,57 @@ async def remnawave_example(callback: types.CallbackQuery):
 # РЕЖИМ РАБОТЫ (БОТ / ГРУППА)
 # ============================================================================
 
-@router.callback_query(F.data == "admin_work_mode_menu")
-async def work_mode_menu(callback: types.CallbackQuery, state: FSMContext):
-    """Меню выбора режима работы."""
-    await state.clear()
+def _work_mode_text() -> str:
+    """Текст меню режима работы."""
     settings = load_json(SETTINGS_FILE, default_data={})
-    
     current_mode = settings.get('bot_mode', 'private')  # 'private' или 'group'
-    group_id = settings.get('group_id', '')
+    groups = group_registry.all()
     
     if current_mode == 'group':
         mode_text = "👥 <b>Группа</b>"
-        mode_desc = "Бот работает в группе, сообщения пересылаются админу"
-        if group_id:
-            mode_desc += f"\nID группы: <code>{group_id}</code>"
+        mode_desc = "Бот работает в группах, сообщения пересылаются админу"
     else:
         mode_text = "🤖 <b>Личные сообщения</b>"
         mode_desc = "Бот работает в личке, пользователи пишут напрямую боту"
     
-    text = (
+    if groups:
+        groups_text = "\n".join(
+            f"• {html.escape(group.title)} <code>{group.chat_id}</code> — {GROUP_MODE_LABELS[group.mode]}"
+            for group in groups[:10]
+        )
+        if len(groups) > 10:
+            groups_text += f"\n… и ещё {len(groups) - 10}"
+    else:
+        groups_text = "<i>Нет привязанных групп</i>"
+    
+    return (
         f"⚙️ <b>Режим работы бота</b>\n\n"
         f"Текущий режим: {mode_text}\n"
         f"{mode_desc}\n\n"
+        f"<b>Привязанные группы:</b>\n{groups_text}\n\n"
         f"<b>Описание режимов:</b>\n"
         f"🤖 <b>Личка</b> — пользователи пишут боту напрямую\n"
-        f"👥 <b>Группа</b> — бот работает в группе/супергруппе"
+        f"👥 <b>Группа</b> — бот работает в привязанных группах/супергруппах"
     )
-    
-    # Определяем какую кнопку показать активной
-    private_mark = " ✓" if current_mode == 'private' else ""
-    group_mark = " ✓" if current_mode == 'group' else ""
-    
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [
-            InlineKeyboardButton(text=f"🤖 Личка{private_mark}", callback_data="admin_set_mode_private"),
-            InlineKeyboardButton(text=f"👥 Группа{group_mark}", callback_data="admin_set_mode_group"),
-        ],
-        [InlineKeyboardButton(text="🔗 Привязать группу", callback_data="admin_link_group")],
-        [InlineKeyboardButton(text="📋 Инструкция", callback_data="admin_mode_help")],
-        [InlineKeyboardButton(text="‹ Назад", callback_data="admin_back_to_main")],
-    ])
-    
-    await callback.message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
+
+
+async def _show_work_mode(callback: types.CallbackQuery):
+    settings = load_json(SETTINGS_FILE, default_data={})
+    try:
+        await callback.message.edit_text(
+            _work_mode_text(),
+            reply_markup=work_mode_keyboard(settings.get('bot_mode', 'private'), len(group_registry.all())),
+            parse_mode="HTML"
+        )
+    except TelegramBadRequest:
+        pass
+
+
+@router.callback_query(F.data == "admin_work_mode_menu")
+async def work_mode_menu(callback: types.CallbackQuery, state: FSMContext):
+    """Меню выбора режима работы."""
+    await state.clear()
+    await _show_work_mode(callback)
     await callback.answer()
 
 
@@ -2117,42 +2530,19 @@ async def set_mode_private(callback: types.CallbackQuery):
     save_json(SETTINGS_FILE, settings)
     
     await callback.answer("✅ Включен режим личных сообщений")
-    
-    # Обновляем меню
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [
-            InlineKeyboardButton(text="🤖 Личка ✓", callback_data="admin_set_mode_private"),
-            InlineKeyboardButton(text="👥 Группа", callback_data="admin_set_mode_group"),
-        ],
-        [InlineKeyboardButton(text="🔗 Привязать группу", callback_data="admin_link_group")],
-        [InlineKeyboardButton(text="📋 Инструкция", callback_data="admin_mode_help")],
-        [InlineKeyboardButton(text="‹ Назад", callback_data="admin_back_to_main")],
-    ])
-    
-    try:
-        await callback.message.edit_text(
-            "⚙️ <b>Режим работы бота</b>\n\n"
-            "Текущий режим: 🤖 <b>Личные сообщения</b>\n"
-            "Бот работает в личке, пользователи пишут напрямую боту",
-            reply_markup=keyboard,
-            parse_mode="HTML"
-        )
-    except TelegramBadRequest:
-        pass
+    await _show_work_mode(callback)
 
 
 @router.callback_query(F.data == "admin_set_mode_group")
 async def set_mode_group(callback: types.CallbackQuery):
     """Установка режима группы."""
-    settings = load_json(SETTINGS_FILE, default_data={})
-    
-    group_id = settings.get('group_id')
-    if not group_id:
+    if not group_registry.all():
         return await callback.answer(
             "⚠️ Сначала привяжите группу!\nДобавьте бота в группу и нажмите 'Привязать группу'",
             show_alert=True
         )
     
+    settings = load_json(SETTINGS_FILE, default_data={})
     if settings.get('bot_mode') == 'group':
         return await callback.answer("Режим группы уже активен")
     
@@ -2160,27 +2550,7 @@ async def set_mode_group(callback: types.CallbackQuery):
     save_json(SETTINGS_FILE, settings)
     
     await callback.answer("✅ Включен режим группы")
-    
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [
-            InlineKeyboardButton(text="🤖 Личка", callback_data="admin_set_mode_private"),
-            InlineKeyboardButton(text="👥 Группа ✓", callback_data="admin_set_mode_group"),
-        ],
-        [InlineKeyboardButton(text="🔗 Привязать группу", callback_data="admin_link_group")],
-        [InlineKeyboardButton(text="📋 Инструкция", callback_data="admin_mode_help")],
-        [InlineKeyboardButton(text="‹ Назад", callback_data="admin_back_to_main")],
-    ])
-    
-    try:
-        await callback.message.edit_text(
-            f"⚙️ <b>Режим работы бота</b>\n\n"
-            f"Текущий режим: 👥 <b>Группа</b>\n"
-            f"ID группы: <code>{group_id}</code>",
-            reply_markup=keyboard,
-            parse_mode="HTML"
-        )
-    except TelegramBadRequest:
-        pass
+    await _show_work_mode(callback)
 
 
 @router.callback_query(F.data == "admin_link_group")
@@ -2196,6 +2566,7 @@ async def link_group(callback: types.CallbackQuery, state: FSMContext):
         "3. Бот автоматически привяжет группу\n\n"
         "<b>Способ 2 (вручную):</b>\n"
         "Отправьте ID группы (начинается с -100...)\n\n"
+        "Групп можно привязать несколько — у каждой свои настройки.\n\n"
         "💡 Узнать ID группы можно добавив бота @getmyid_bot в группу"
     )
     
@@ -2229,17 +2600,14 @@ async def process_group_id(message: types.Message, state: FSMContext, bot: Bot):
             )
             return
         
-        settings = load_json(SETTINGS_FILE, default_data={})
-        settings['group_id'] = group_id
-        settings['group_title'] = chat_title
-        save_json(SETTINGS_FILE, settings)
+        group_registry.link(group_id, chat_title)
         
         await state.clear()
         await message.answer(
             f"✅ Группа привязана!\n\n"
             f"<b>Название:</b> {html.escape(chat_title)}\n"
             f"<b>ID:</b> <code>{group_id}</code>",
-            reply_markup=admin_start_keyboard(),
+            reply_markup=group_input_keyboard(group_id),
             parse_mode="HTML"
         )
         
@@ -2250,6 +2618,268 @@ async def process_group_id(message: types.Message, state: FSMContext, bot: Bot):
         )
 
 
+# ============================================================================
+# НАСТРОЙКИ ГРУПП
+# ============================================================================
+
+# Значения порога FAQ, по которым переключает кнопка (None — общий порог)
+GROUP_FAQ_THRESHOLDS = (None, 0.3, 0.4, 0.5, 0.6, 0.7)
+
+
+def _group_from_callback(data: str, prefix: str):
+    try:
+        return group_registry.get(int(data[len(prefix):]))
+    except ValueError:
+        return None
+
+
+def _group_settings_text(group) -> str:
+    if group.triggers is None:
+        triggers_text = "общие (из раздела «Триггеры»)"
+    elif group.triggers:
+        triggers_text = ", ".join(html.escape(keyword) for keyword in list(group.triggers)[:15])
+    else:
+        triggers_text = "<i>нет</i>"
+    notify = group.notify_target()
+    notify_text = "админ" if notify == bot_config.ADMIN_ID else f"<code>{notify}</code>"
+    return (
+        f"👥 <b>{html.escape(group.title)}</b>\n"
+        f"ID: <code>{group.chat_id}</code>\n\n"
+        f"<b>Режим:</b> {GROUP_MODE_LABELS[group.mode]}\n"
+        f"<b>ИИ:</b> {'вкл' if group_registry.ai_enabled(group) else 'выкл'}"
+        f"{' (общая настройка)' if group.ai_enabled is None else ''}\n"
+        f"<b>Порог FAQ:</b> {group_registry.faq_threshold(group):.1f}"
+        f"{' (общий)' if group.faq_threshold is None else ''}\n"
+        f"<b>Триггеры:</b> {triggers_text}\n"
+        f"<b>Уведомления:</b> {notify_text}\n\n"
+        f"<i>💬 Полный — ответы на обращения (FAQ, триггеры, ИИ) и триггеры;\n"
+        f"🔑 Только триггеры — бот реагирует только на ключевые слова;\n"
+        f"🔇 Выключен — группа привязана, но бот молчит.</i>"
+    )
+
+
+async def _show_group(callback: types.CallbackQuery, group):
+    try:
+        await callback.message.edit_text(
+            _group_settings_text(group),
+            reply_markup=group_settings_keyboard(
+                group, group_registry.ai_enabled(group), group_registry.faq_threshold(group)
+            ),
+            parse_mode="HTML"
+        )
+    except TelegramBadRequest:
+        pass
+
+
+@router.callback_query(F.data == "admin_groups")
+async def groups_list(callback: types.CallbackQuery, state: FSMContext):
+    """Список привязанных групп."""
+    await state.clear()
+    groups = group_registry.all()
+    text = "👥 <b>Привязанные группы</b>\n\n"
+    if groups:
+        text += "Выберите группу, чтобы настроить её режим, триггеры, ИИ и уведомления."
+    else:
+        text += "<i>Нет привязанных групп.</i> Напишите /link в группе, чтобы привязать её."
+    await callback.message.edit_text(text, reply_markup=groups_list_keyboard(groups), parse_mode="HTML")
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("admin_grp_view_"))
+async def group_settings(callback: types.CallbackQuery, state: FSMContext):
+    """Настройки группы."""
+    await state.clear()
+    group = _group_from_callback(callback.data, "admin_grp_view_")
+    if group is None:
+        return await callback.answer("Группа не найдена", show_alert=True)
+    await _show_group(callback, group)
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("admin_grp_mode_"))
+async def group_cycle_mode(callback: types.CallbackQuery):
+    """Переключение режима группы: полный → только триггеры → выключен."""
+    group = _group_from_callback(callback.data, "admin_grp_mode_")
+    if group is None:
+        return await callback.answer("Группа не найдена", show_alert=True)
+    modes = list(GROUP_MODE_LABELS)
+    mode = modes[(modes.index(group.mode) + 1) % len(modes)]
+    group = group_registry.update(group.chat_id, mode=mode)
+    await callback.answer(f"Режим: {GROUP_MODE_LABELS[mode]}")
+    await _show_group(callback, group)
+
+
+@router.callback_query(F.data.startswith("admin_grp_ai_"))
+async def group_cycle_ai(callback: types.CallbackQuery):
+    """ИИ в группе: общая настройка → вкл → выкл."""
+    group = _group_from_callback(callback.data, "admin_grp_ai_")
+    if group is None:
+        return await callback.answer("Группа не найдена", show_alert=True)
+    values = [None, True, False]
+    value = values[(values.index(group.ai_enabled) + 1) % len(values)]
+    group = group_registry.update(group.chat_id, ai_enabled=value)
+    await callback.answer("ИИ: " + {None: "общая настройка", True: "вкл", False: "выкл"}[value])
+    await _show_group(callback, group)
+
+
+@router.callback_query(F.data.startswith("admin_grp_faq_"))
+async def group_cycle_faq(callback: types.CallbackQuery):
+    """Порог FAQ группы: общий → 0.3 → … → 0.7."""
+    group = _group_from_callback(callback.data, "admin_grp_faq_")
+    if group is None:
+        return await callback.answer("Группа не найдена", show_alert=True)
+    values = list(GROUP_FAQ_THRESHOLDS)
+    index = values.index(group.faq_threshold) if group.faq_threshold in values else 0
+    value = values[(index + 1) % len(values)]
+    group = group_registry.update(group.chat_id, faq_threshold=value)
+    await callback.answer(f"Порог FAQ: {value if value is not None else 'общий'}")
+    await _show_group(callback, group)
+
+
+@router.callback_query(F.data.startswith("admin_grp_triggers_"))
+async def group_triggers(callback: types.CallbackQuery, state: FSMContext):
+    """Ввод собственных триггеров группы."""
+    group = _group_from_callback(callback.data, "admin_grp_triggers_")
+    if group is None:
+        return await callback.answer("Группа не найдена", show_alert=True)
+    await state.set_state(AdminStates.waiting_for_group_triggers)
+    await state.update_data(group_chat_id=group.chat_id)
+    await callback.message.edit_text(
+        f"🔑 <b>Триггеры группы «{html.escape(group.title)}»</b>\n\n"
+        "Отправьте триггеры, по одному на строку:\n"
+        "<code>ключевое слово = ответ</code>\n\n"
+        "<code>-</code> — использовать общие триггеры\n"
+        "<code>0</code> — без триггеров",
+        reply_markup=group_input_keyboard(group.chat_id),
+        parse_mode="HTML"
+    )
+    await callback.answer()
+
+
+@router.message(AdminStates.waiting_for_group_triggers)
+async def process_group_triggers(message: types.Message, state: FSMContext):
+    """Сохранение триггеров группы."""
+    data = await state.get_data()
+    chat_id = data.get('group_chat_id')
+    text = (message.text or "").strip()
+    
+    if text == "-":
+        triggers = None
+    elif text == "0":
+        triggers = {}
+    else:
+        triggers = {}
+        for line in text.splitlines():
+            keyword, sep, response = line.partition("=")
+            if not sep or not keyword.strip() or not response.strip():
+                await message.answer(
+                    f"⚠️ Строка без «=»: <code>{html.escape(line[:100])}</code>\n"
+                    "Формат: <code>ключевое слово = ответ</code>",
+                    reply_markup=group_input_keyboard(chat_id),
+                    parse_mode="HTML"
+                )
+                return
+            triggers[keyword.strip().lower()] = response.strip()
+    
+    group = group_registry.update(chat_id, triggers=triggers)
+    await state.clear()
+    if group is None:
+        await message.answer("Группа не найдена", reply_markup=back_to_admin_panel())
+        return
+    summary = "общие" if triggers is None else f"{len(triggers)} шт."
+    await message.answer(
+        f"✅ Триггеры группы сохранены: {summary}",
+        reply_markup=group_input_keyboard(chat_id)
+    )
+
+
+@router.callback_query(F.data.startswith("admin_grp_notify_"))
+async def group_notify(callback: types.CallbackQuery, state: FSMContext):
+    """Ввод чата для уведомлений о сообщениях группы."""
+    group = _group_from_callback(callback.data, "admin_grp_notify_")
+    if group is None:
+        return await callback.answer("Группа не найдена", show_alert=True)
+    await state.set_state(AdminStates.waiting_for_group_notify_chat)
+    await state.update_data(group_chat_id=group.chat_id)
+    await callback.message.edit_text(
+        f"🔔 <b>Уведомления группы «{html.escape(group.title)}»</b>\n\n"
+        "Отправьте ID чата, куда пересылать обращения из этой группы "
+        "(например, чат региональной поддержки — бот должен быть в нём).\n\n"
+        "<code>0</code> — уведомлять админа бота",
+        reply_markup=group_input_keyboard(group.chat_id),
+        parse_mode="HTML"
+    )
+    await callback.answer()
+
+
+@router.message(AdminStates.waiting_for_group_notify_chat)
+async def process_group_notify(message: types.Message, state: FSMContext, bot: Bot):
+    """Сохранение чата уведомлений группы."""
+    data = await state.get_data()
+    chat_id = data.get('group_chat_id')
+    try:
+        notify_chat_id = int((message.text or "").strip())
+    except ValueError:
+        await message.answer("⚠️ Введите числовой ID чата", reply_markup=group_input_keyboard(chat_id))
+        return
+    
+    if notify_chat_id:
+        try:
+            await bot.get_chat(notify_chat_id)
+        except Exception:
+            await message.answer(
+                "❌ Бот не видит этот чат. Добавьте бота в чат и попробуйте снова.",
+                reply_markup=group_input_keyboard(chat_id)
+            )
+            return
+    
+    group = group_registry.update(chat_id, notify_chat_id=notify_chat_id or None)
+    await state.clear()
+    if group is None:
+        await message.answer("Группа не найдена", reply_markup=back_to_admin_panel())
+        return
+    await message.answer(
+        "✅ Уведомления: " + (f"чат {notify_chat_id}" if notify_chat_id else "админ"),
+        reply_markup=group_input_keyboard(chat_id)
+    )
+
+
+@router.callback_query(F.data.startswith("admin_grp_unlink_"))
+async def group_unlink(callback: types.CallbackQuery):
+    """Подтверждение отвязки группы."""
+    group = _group_from_callback(callback.data, "admin_grp_unlink_")
+    if group is None:
+        return await callback.answer("Группа не найдена", show_alert=True)
+    await callback.message.edit_text(
+        f"🗑️ Отвязать группу «{html.escape(group.title)}»?\n\n"
+        "Бот перестанет отвечать в ней; настройки группы будут удалены.",
+        reply_markup=confirm_action_keyboard(
+            f"admin_grp_unlinkok_{group.chat_id}", f"admin_grp_view_{group.chat_id}"
+        ),
+        parse_mode="HTML"
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("admin_grp_unlinkok_"))
+async def group_unlink_confirm(callback: types.CallbackQuery, state: FSMContext):
+    """Отвязка группы."""
+    try:
+        chat_id = int(callback.data[len("admin_grp_unlinkok_"):])
+    except ValueError:
+        return await callback.answer()
+    if not group_registry.unlink(chat_id):
+        return await callback.answer("Группа не найдена", show_alert=True)
+    if not group_registry.all():
+        # Без групп режим группы не имеет смысла
+        settings = load_json(SETTINGS_FILE, default_data={})
+        if settings.get('bot_mode') == 'group':
+            settings['bot_mode'] = 'private'
+            save_json(SETTINGS_FILE, settings)
+    await callback.answer("✅ Группа отвязана")
+    await groups_list(callback, state)
+
+
 @router.callback_query(F.data == "admin_mode_help")
 async def mode_help(callback: types.CallbackQuery):
     """Инструкция по режимам."""
@@ -2261,7 +2891,7 @@ async def mode_help(callback: types.CallbackQuery):
         "• Бот отвечает в личке пользователя\n"
         "• Подходит для поддержки 1-на-1\n\n"
         "<b>👥 Режим группы:</b>\n"
-        "• Бот работает в группе/супергруппе\n"
+        "• Бот работает в одной или нескольких группах\n"
         "• Реагирует на упоминания и команды\n"
         "• Отвечает на вопросы из FAQ\n"
         "• Может использовать ИИ для ответов\n"
@@ -2270,7 +2900,10 @@ async def mode_help(callback: types.CallbackQuery):
         "1. Добавьте бота в группу\n"
         "2. Дайте права администратора\n"
         "3. Напишите /link в группе\n"
-        "4. Включите режим группы"
+        "4. Включите режим группы\n\n"
+        "<b>Несколько групп:</b>\n"
+        "Повторите /link в каждой группе. В разделе «Группы» у каждой "
+        "свои режим, триггеры, порог FAQ, ИИ и чат для уведомлений."
     )
     
     await callback.message.edit_text(
@@ -2780,19 +3413,8 @@ async def set_default_lang(callback: types.CallbackQuery):
 @router.callback_query(F.data == "admin_multilang_stats")
 async def multilang_stats(callback: types.CallbackQuery):
     """Статистика языков пользователей."""
-    from bot.user_manager import get_all_users
-    
-    users = get_all_users()
-    
-    # Считаем языки
-    lang_counts = {}
-    for user in users:
-        lang = user.get('language_code', 'unknown')
-        if lang:
-            lang = lang.split('-')[0]  # en-US -> en
-        else:
-            lang = 'unknown'
-        lang_counts[lang] = lang_counts.get(lang, 0) + 1
+    lang_counts = get_language_stats()
+    total = sum(lang_counts.values())
     
     # Сортируем по количеству
     sorted_langs = sorted(lang_counts.items(), key=lambda x: x[1], reverse=True)
@@ -2807,10 +3429,10 @@ async def multilang_stats(callback: types.CallbackQuery):
     text = "📊 <b>Статистика языков</b>\n\n"
     for lang, count in sorted_langs[:15]:
         flag = lang_flags.get(lang, "🌐")
-        percent = (count / len(users) * 100) if users else 0
+        percent = (count / total * 100) if total else 0
         text += f"{flag} <code>{lang}</code>: {count} ({percent:.1f}%)\n"
     
-    text += f"\n<b>Всего пользователей:</b> {len(users)}"
+    text += f"\n<b>Всего пользователей:</b> {total}"
     
     await callback.message.edit_text(
         text,
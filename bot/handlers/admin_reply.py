@@ -21,7 +21,7 @@ async def start_admin_reply(callback: types.CallbackQuery, state: FSMContext):
     await state.update_data(user_id_to_reply=user_id)
     
     # ⚡️ Блокируем ИИ для этого пользователя
-    block_ai_for_user(user_id)
+    await block_ai_for_user(user_id)
     logger.info(f"Admin {callback.from_user.id} started replying to user {user_id}. AI blocked for this user.")
     
     await callback.message.answer(f"Введите ваш ответ для пользователя с ID {user_id}:")
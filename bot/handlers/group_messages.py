@@ -3,49 +3,117 @@
 """
 import logging
 import html
+import re
+from dataclasses import dataclass
+from typing import Optional
+
 from aiogram import Router, F, Bot
 from aiogram.enums.chat_action import ChatAction
-from aiogram.types import Message
-from aiogram.filters import Command
+from aiogram.types import Message, User
+from aiogram.filters import Command, Filter
 
-from bot.config import ADMIN_ID, TIMEZONE, load_json, save_json, SETTINGS_FILE
+from bot.config import ADMIN_ID, TIMEZONE, load_json, SETTINGS_FILE
 from bot.keyboards.inline import admin_reply_keyboard
 from bot.ai_integration import get_ai_response
+from bot.ai_dispatcher import ai_dispatcher, AIQueueTimeout, PRIORITY_GROUP
 from bot.faq_search import search_faq
 from bot.remnawave_integration import remnawave_client
-from bot.user_manager import track_user
+from bot.user_manager import record_user_activity
+from bot.user_index import ORIGIN_GROUP
+from bot.admin_notifier import admin_notifier
+from bot.group_registry import GroupConfig, MODE_FULL, MODE_OFF, group_registry
 
 logger = logging.getLogger(__name__)
 router = Router()
+# Сообщения участников привязанной группы; проходят через GroupTrafficFilter
+group_router = Router(name="group_traffic")
 
 
-def is_group_mode() -> bool:
-    """Проверяет, включен ли режим группы."""
-    settings = load_json(SETTINGS_FILE, default_data={})
-    return settings.get('bot_mode') == 'group'
+@dataclass(frozen=True)
+class BotIdentity:
+    """
+    ID и username бота — запрашиваются один раз при запуске (get_me)
+    и хранятся в dispatcher["bot_identity"].
+    """
+    id: int
+    username: str
+    mention_pattern: Optional[re.Pattern]
 
+    @classmethod
+    def from_user(cls, me: User) -> "BotIdentity":
+        username = me.username or ""
+        pattern = re.compile(rf"@{re.escape(username)}\b", re.IGNORECASE) if username else None
+        return cls(id=me.id, username=username.lower(), mention_pattern=pattern)
 
-def get_group_id() -> int | None:
-    """Возвращает ID привязанной группы."""
-    settings = load_json(SETTINGS_FILE, default_data={})
-    return settings.get('group_id')
+    def is_mentioned(self, message: Message) -> bool:
+        """Упоминание бота по entities сообщения (mention / text_mention)."""
+        text = message.text or message.caption
+        entities = message.entities or message.caption_entities
+        if not text or not entities:
+            return False
+        for entity in entities:
+            if entity.type == "mention":
+                if self.username and entity.extract_from(text)[1:].lower() == self.username:
+                    return True
+            elif entity.type == "text_mention" and entity.user and entity.user.id == self.id:
+                return True
+        return False
 
+    def is_reply_to_bot(self, message: Message) -> bool:
+        reply = message.reply_to_message
+        return bool(reply and reply.from_user and reply.from_user.id == self.id)
 
-def check_triggers(text: str) -> str | None:
-    """Проверяет триггеры и возвращает ответ если найден."""
-    if not text:
-        return None
-    
-    settings = load_json(SETTINGS_FILE, default_data={})
-    triggers = settings.get('triggers', {})
-    
-    text_lower = text.lower()
-    for keyword, response in triggers.items():
-        if keyword.lower() in text_lower:
-            logger.info(f"Trigger matched: '{keyword}'")
-            return response
-    
-    return None
+    def strip_mention(self, text: str) -> str:
+        if not self.mention_pattern:
+            return text
+        return self.mention_pattern.sub("", text).strip()
+
+
+class GroupTrafficFilter(Filter):
+    """
+    Фильтр перед роутером группы: отсекает лишний трафик до middleware
+    (rate limit), работы с хранилищем и хэндлера.
+
+    Пропускает только сообщения из привязанных групп (реестр групп, в режиме
+    группы), не от ботов, и только если они адресованы боту (ответ / упоминание,
+    в режиме группы «full») или содержат триггер группы.
+
+    Активность участников группы учитывается здесь же, пачками
+    (record_user_activity), — и для отсечённых сообщений тоже.
+    """
+
+    async def __call__(
+        self, message: Message, bot: Bot, bot_identity: Optional[BotIdentity] = None
+    ) -> bool | dict:
+        group = group_registry.get(message.chat.id)
+        if group is None or not group_registry.enabled or group.mode == MODE_OFF:
+            return False
+        user = message.from_user
+        if not user or user.is_bot:
+            return False
+
+        record_user_activity(
+            user_id=user.id,
+            full_name=user.full_name,
+            username=user.username,
+            language_code=user.language_code,
+            origin=ORIGIN_GROUP,
+        )
+
+        if group.mode == MODE_FULL:
+            if bot_identity is None:
+                bot_identity = BotIdentity.from_user(await bot.me())
+            is_mention = bot_identity.is_mentioned(message)
+            if is_mention or bot_identity.is_reply_to_bot(message):
+                return {"group": group, "bot_identity": bot_identity, "is_addressed": True, "is_mention": is_mention}
+
+        text = message.text or message.caption
+        if text and group.trigger_pattern and group.trigger_pattern.search(text):
+            return {"group": group, "bot_identity": bot_identity, "is_addressed": False, "is_mention": False}
+        return False
+
+
+group_router.message.filter(F.chat.type.in_({'group', 'supergroup'}), GroupTrafficFilter())
 
 
 @router.message(Command("link"))
@@ -60,81 +128,60 @@ async def link_group_command(message: Message):
         await message.reply("⚠️ Только администратор бота может привязать группу.")
         return
     
-    settings = load_json(SETTINGS_FILE, default_data={})
-    settings['group_id'] = message.chat.id
-    settings['group_title'] = message.chat.title or "Без названия"
-    save_json(SETTINGS_FILE, settings)
+    group_registry.link(message.chat.id, message.chat.title or "Без названия")
     
     await message.reply(
         f"✅ Группа успешно привязана!\n\n"
         f"<b>Название:</b> {html.escape(message.chat.title or 'Без названия')}\n"
         f"<b>ID:</b> <code>{message.chat.id}</code>\n\n"
-        f"Теперь включите режим группы в админ-панели бота.",
+        f"Групп привязано: {len(group_registry.all())}. "
+        f"Режим группы включается в админ-панели бота, там же — настройки каждой группы.",
         parse_mode="HTML"
     )
 
 
-@router.message(F.chat.type.in_({'group', 'supergroup'}))
-async def handle_group_message(message: Message, bot: Bot):
-    """Обработка сообщений из группы."""
-    # Проверяем режим работы
-    if not is_group_mode():
-        return
-    
-    # Проверяем что это наша группа
-    group_id = get_group_id()
-    if not group_id or message.chat.id != group_id:
-        return
-    
-    # Пропускаем сообщения от бота
-    if message.from_user.is_bot:
-        return
-    
+router.include_router(group_router)
+
+
+@group_router.message()
+async def handle_group_message(
+    message: Message, bot: Bot, group: GroupConfig, bot_identity: Optional[BotIdentity],
+    is_addressed: bool, is_mention: bool,
+):
+    """Обработка сообщений из группы (после GroupTrafficFilter) с настройками этой группы."""
     user_id = message.from_user.id
     user_text = message.text or message.caption or ""
     
-    # Отслеживаем пользователя
-    track_user(
-        user_id=user_id,
-        full_name=message.from_user.full_name,
-        username=message.from_user.username
-    )
-    
-    # Проверяем, обращаются ли к боту
-    bot_info = await bot.get_me()
-    bot_username = bot_info.username.lower() if bot_info.username else ""
-    
-    is_reply_to_bot = (
-        message.reply_to_message and 
-        message.reply_to_message.from_user and 
-        message.reply_to_message.from_user.id == bot_info.id
-    )
-    is_mention = f"@{bot_username}" in user_text.lower() if bot_username else False
-    
-    # Если не обращаются к боту - только проверяем триггеры
-    if not is_reply_to_bot and not is_mention:
-        # Проверяем триггеры
-        trigger_response = check_triggers(user_text)
+    # Не обращаются к боту, но есть триггер
+    if not is_addressed:
+        trigger_response = group.match_trigger(user_text)
         if trigger_response:
             await message.reply(trigger_response, parse_mode="HTML")
         return
     
     # Убираем упоминание из текста
-    if is_mention and bot_username:
-        user_text = user_text.replace(f"@{bot_username}", "").replace(f"@{bot_username.upper()}", "").strip()
+    if is_mention:
+        user_text = bot_identity.strip_mention(user_text)
     
     # Отправляем уведомление админу
-    await notify_admin_about_group_message(message, bot, user_text)
+    await notify_admin_about_group_message(message, bot, user_text, group.notify_target())
     
     # Показываем что бот печатает
     await bot.send_chat_action(message.chat.id, action=ChatAction.TYPING)
     
     # 1. Проверяем FAQ
+    faq_candidates = []
     if user_text:
         settings = load_json(SETTINGS_FILE, default_data={})
-        threshold = settings.get('faq_similarity_threshold', 0.4)
+        threshold = group_registry.faq_threshold(group)
         
-        faq_result = search_faq(user_text, similarity_threshold=threshold)
+        faq_result = search_faq(
+            user_text,
+            similarity_threshold=threshold,
+            top_k=int(settings.get('faq_grounding_top_k', 3)),
+            min_similarity=float(settings.get('faq_grounding_min_similarity', 0.2)),
+        )
+        faq_candidates = faq_result.get('candidates', [])
         
         if faq_result['found']:
             logger.info(f"FAQ match in group for '{user_text[:30]}...'")
@@ -163,21 +210,29 @@ async def handle_group_message(message: Message, bot: Bot):
                 return
     
     # 2. Проверяем триггеры
-    trigger_response = check_triggers(user_text)
+    trigger_response = group.match_trigger(user_text)
     if trigger_response:
         await message.reply(trigger_response, parse_mode="HTML")
         return
     
     # 3. Пробуем ИИ
     settings = load_json(SETTINGS_FILE, default_data={})
-    ai_enabled = settings.get('ai_enabled', False)
+    ai_enabled = group_registry.ai_enabled(group)
     active_model = settings.get('active_ai')
     
     if ai_enabled and active_model and user_text:
         try:
-            ai_answer = await get_ai_response(user_text, active_model)
+            ai_answer = await ai_dispatcher.submit(
+                lambda: get_ai_response(
+                    user_text, active_model, user_id=user_id, faq_candidates=faq_candidates
+                ),
+                user_id=user_id,
+                priority=PRIORITY_GROUP,
+            )
             await message.reply(ai_answer)
             return
+        except AIQueueTimeout as e:
+            logger.warning(f"AI request in group shed for user {user_id}: {e}")
         except Exception as e:
             logger.error(f"Error getting AI response in group: {e}")
     
@@ -187,8 +242,8 @@ async def handle_group_message(message: Message, bot: Bot):
     )
 
 
-async def notify_admin_about_group_message(message: Message, bot: Bot, user_text: str):
-    """Уведомляет админа о сообщении из группы."""
+async def notify_admin_about_group_message(message: Message, bot: Bot, user_text: str, chat_id: int = ADMIN_ID):
+    """Уведомляет админа (или чат уведомлений группы) о сообщении из группы."""
     user_id = message.from_user.id
     username = message.from_user.username
     display_name = f"@{username}" if username else message.from_user.full_name
@@ -219,16 +274,19 @@ async def notify_admin_about_group_message(message: Message, bot: Bot, user_text
     # Текст сообщения
     user_message_text = html.escape(user_text) if user_text else f"<i>({message.content_type})</i>"
     
-    combined_text = f"{user_info_text}\n\n<b>Сообщение:</b>\n{user_message_text}"
+    body = f"<b>Сообщение:</b>\n{user_message_text}"
+    combined_text = f"{user_info_text}\n\n{body}"
+    reply_kb = admin_reply_keyboard(user_id)
+    notify_key = (ORIGIN_GROUP, user_id)
     
-    try:
-        reply_kb = admin_reply_keyboard(user_id)
-        
-        if message.content_type == "text":
-            await bot.send_message(chat_id=ADMIN_ID, text=combined_text, reply_markup=reply_kb, parse_mode="HTML")
-        elif message.photo:
+    if message.content_type == "text":
+        admin_notifier.send_text(bot, chat_id, body, header=user_info_text, key=notify_key, reply_markup=reply_kb)
+        return
+    
+    async def forward_media():
+        if message.photo:
             await bot.send_photo(
-                chat_id=ADMIN_ID,
+                chat_id=chat_id,
                 photo=message.photo[-1].file_id,
                 caption=combined_text,
                 reply_markup=reply_kb,
@@ -236,13 +294,13 @@ async def notify_admin_about_group_message(message: Message, bot: Bot, user_text
             )
         elif message.document:
             await bot.send_document(
-                chat_id=ADMIN_ID,
+                chat_id=chat_id,
                 document=message.document.file_id,
                 caption=combined_text,
                 reply_markup=reply_kb,
                 parse_mode="HTML"
             )
         else:
-            await bot.send_message(chat_id=ADMIN_ID, text=combined_text, reply_markup=reply_kb, parse_mode="HTML")
-    except Exception as e:
-        logger.error(f"Error sending group message to admin: {e}")
+            await bot.send_message(chat_id=chat_id, text=combined_text, reply_markup=reply_kb, parse_mode="HTML")
+    
+    admin_notifier.send_custom(bot, chat_id, forward_media, key=notify_key)
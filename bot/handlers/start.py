@@ -2,12 +2,12 @@ import html
 
 from aiogram import Router
 from aiogram.filters import CommandStart
-from aiogram.types import Message, FSInputFile
+from aiogram.types import Message
 from bot.keyboards.inline import start_keyboard, admin_start_keyboard
 from bot.config import ADMIN_ID, SETTINGS_FILE, load_json
+from bot.welcome_image import DEFAULT_WELCOME_IMAGE_PATH, send_welcome_photo
 
 router = Router()
-DEFAULT_WELCOME_IMAGE_PATH = "bot/assets/welcome.jpg"
 
 @router.message(CommandStart())
 async def handle_start(message: Message):
@@ -34,12 +34,15 @@ async def handle_start(message: Message):
     image_path = settings.get("welcome_image_path") or DEFAULT_WELCOME_IMAGE_PATH
 
     try:
-        photo = FSInputFile(image_path)
-        await message.answer_photo(
-            photo=photo,
-            caption=welcome_text,
-            reply_markup=start_keyboard(),
-            parse_mode="HTML",
+        # Картинка уходит по закэшированному file_id, загружается только первый раз
+        await send_welcome_photo(
+            lambda photo: message.answer_photo(
+                photo=photo,
+                caption=welcome_text,
+                reply_markup=start_keyboard(),
+                parse_mode="HTML",
+            ),
+            image_path,
         )
     except Exception as e:
         print(f"Error sending photo: {e}")
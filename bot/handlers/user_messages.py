@@ -4,6 +4,8 @@
 import datetime
 import logging
 import html
+from typing import List, Optional
+
 import pytz
 from aiogram import Router, F, Bot
 from aiogram.enums.chat_action import ChatAction
@@ -12,11 +14,15 @@ from aiogram.types import Message
 from bot.config import ADMIN_ID, TIMEZONE, OFF_HOURS_REPLY, load_json, SETTINGS_FILE
 from bot.keyboards.inline import admin_reply_keyboard
 from bot.ai_integration import get_ai_response
+from bot.ai_dispatcher import ai_dispatcher, AIQueueTimeout, PRIORITY_PRIVATE
 from bot.ai_block_manager import is_ai_blocked_for_user
 from bot.faq_search import search_faq
 from bot.remnawave_integration import remnawave_client
 from bot.user_manager import track_user, is_user_blocked
+from bot.user_index import ORIGIN_PRIVATE
 from bot.i18n import get_text, detect_language
+from bot.album import album_to_media
+from bot.admin_notifier import admin_notifier, PRIORITY_NEW_USER
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -91,18 +97,16 @@ async def notify_new_user(bot: Bot, message: Message):
     text += f"🌍 <b>Язык:</b> {lang_name}\n"
     text += f"📅 <b>Время:</b> {datetime.datetime.now().strftime('%d.%m.%Y %H:%M')}"
     
-    try:
-        await bot.send_message(
-            chat_id=ADMIN_ID,
-            text=text,
-            parse_mode="HTML"
-        )
-    except Exception as e:
-        logger.error(f"Error sending new user notification: {e}")
+    # После пересылок сообщений (приоритет ниже)
+    admin_notifier.send_text(bot, ADMIN_ID, text, priority=PRIORITY_NEW_USER)
 
 
 @router.message(F.chat.type == "private", F.text | F.photo | F.document | F.audio | F.video)
-async def handle_user_message(message: Message, bot: Bot):
+async def handle_user_message(message: Message, bot: Bot, album: Optional[List[Message]] = None):
+    """
+    Сообщение пользователя в личке. Альбом приходит одним вызовом:
+    message — первая часть, album — все части (см. AlbumMiddleware).
+    """
     logger.debug(f"Received message from user ID {message.from_user.id}")
     
     # Пропускаем сообщения от админа
@@ -119,11 +123,12 @@ async def handle_user_message(message: Message, bot: Bot):
         return
     
     # Отслеживаем пользователя (получаем инфо о новом)
-    is_new_user = track_user(
+    is_new_user = await track_user(
         user_id=user_id,
         full_name=message.from_user.full_name,
         username=message.from_user.username,
-        language_code=user_lang
+        language_code=user_lang,
+        origin=ORIGIN_PRIVATE,
     )
     
     # Уведомление о новом пользователе
@@ -163,21 +168,38 @@ async def handle_user_message(message: Message, bot: Bot):
             user_info_text = f"{user_info_text}\n\n🟠 Ошибка получения данных Remnawave"
     
     # Собираем сообщение пользователя
-    user_message_text = message.text if message.text else (message.caption if message.caption else "")
+    if album:
+        user_message_text = "\n\n".join(part.caption for part in album if part.caption)
+    else:
+        user_message_text = message.text if message.text else (message.caption if message.caption else "")
     user_message_text = html.escape(user_message_text) if user_message_text else ""
 
     forwarded_line = f"<i>Переслано от {safe_full_name}</i>"
-    msg_body = user_message_text if user_message_text else f"<i>({message.content_type} без текста)</i>"
-
-    parts = [user_info_text, forwarded_line, msg_body]
-    combined_text = "\n\n".join([p for p in parts if p])
+    if album:
+        album_line = f"<i>Альбом: {len(album)} шт. (выше)</i>"
+        msg_body = f"{user_message_text}\n\n{album_line}" if user_message_text else album_line
+    else:
+        msg_body = user_message_text if user_message_text else f"<i>({message.content_type} без текста)</i>"
 
-    try:
-        reply_kb = admin_reply_keyboard(user_id)
+    header = f"{user_info_text}\n\n{forwarded_line}"
+    combined_text = f"{header}\n\n{msg_body}"
+    reply_kb = admin_reply_keyboard(user_id)
+    # Через очередь уведомлений: темп ~1 сообщение/сек в чат админа, RetryAfter,
+    # тексты одного пользователя под нагрузкой склеиваются в одно сообщение
+    notify_key = (ORIGIN_PRIVATE, user_id)
 
-        if message.content_type == "text":
-            await bot.send_message(chat_id=ADMIN_ID, text=combined_text, reply_markup=reply_kb)
-        else:
+    if album:
+        # Альбом — одним send_media_group и одной карточкой с кнопкой ответа
+        # (у media group не бывает клавиатуры)
+        media = album_to_media(album)
+        admin_notifier.send_custom(
+            bot, ADMIN_ID, lambda: bot.send_media_group(chat_id=ADMIN_ID, media=media), key=notify_key
+        )
+        admin_notifier.send_text(bot, ADMIN_ID, msg_body, header=header, key=notify_key, reply_markup=reply_kb)
+    elif message.content_type == "text":
+        admin_notifier.send_text(bot, ADMIN_ID, msg_body, header=header, key=notify_key, reply_markup=reply_kb)
+    else:
+        async def forward_media():
             if message.photo:
                 await bot.send_photo(
                     chat_id=ADMIN_ID,
@@ -208,15 +230,17 @@ async def handle_user_message(message: Message, bot: Bot):
                 )
             else:
                 await bot.send_message(chat_id=ADMIN_ID, text=combined_text, reply_markup=reply_kb)
-    except Exception as e:
-        logger.error(f"Error sending message to admin: {e}", exc_info=True)
+
+        admin_notifier.send_custom(bot, ADMIN_ID, forward_media, key=notify_key)
 
     # 2. Проверка блокировки ИИ (админ уже отвечает)
-    if is_ai_blocked_for_user(user_id):
+    if await is_ai_blocked_for_user(user_id):
         logger.info(f"AI is blocked for user {user_id} - admin handling")
         return
 
     # 3. Проверка FAQ
+    # Ближайшие записи FAQ ниже порога — справка для ИИ (тот же проход поиска)
+    faq_candidates = []
     if message.text:
         logger.info(f"Searching FAQ for: '{message.text[:50]}...'")
         try:
@@ -224,7 +248,12 @@ async def handle_user_message(message: Message, bot: Bot):
             settings = load_json(SETTINGS_FILE, default_data={})
             threshold = settings.get('faq_similarity_threshold', 0.4)
             
-            faq_result = search_faq(message.text, similarity_threshold=threshold)
+            faq_result = search_faq(
+                message.text,
+                similarity_threshold=threshold,
+                top_k=int(settings.get('faq_grounding_top_k', 3)),
+                min_similarity=float(settings.get('faq_grounding_min_similarity', 0.2)),
+            )
             
             if faq_result['found']:
                 logger.info(f"Found FAQ match with similarity {faq_result.get('similarity', 0):.2f}")
@@ -257,6 +286,7 @@ async def handle_user_message(message: Message, bot: Bot):
                     return
             else:
                 logger.debug("No FAQ match found")
+                faq_candidates = faq_result.get('candidates', [])
         except Exception as e:
             logger.error(f"Error in FAQ search: {e}", exc_info=True)
 
@@ -273,17 +303,27 @@ async def handle_user_message(message: Message, bot: Bot):
     ai_enabled = settings.get('ai_enabled', False)
     active_model = settings.get('active_ai')
     logger.info(f"AI check: enabled={ai_enabled}, model='{active_model}'")
+    ai_shed = False
 
     if ai_enabled and active_model and message.text:
         logger.info(f"AI is active. Sending prompt to '{active_model}'...")
         await bot.send_chat_action(message.chat.id, action=ChatAction.TYPING)
 
         try:
-            ai_answer = await get_ai_response(message.text, active_model)
+            ai_answer = await ai_dispatcher.submit(
+                lambda: get_ai_response(
+                    message.text, active_model, user_id=user_id, faq_candidates=faq_candidates
+                ),
+                user_id=user_id,
+                priority=PRIORITY_PRIVATE,
+            )
             logger.debug(f"AI response: {ai_answer[:100]}")
             await message.answer(ai_answer)
             logger.info(f"Sent AI response to user {user_id}")
             return
+        except AIQueueTimeout as e:
+            logger.warning(f"AI request for user {user_id} shed: {e}")
+            ai_shed = True
         except Exception as e:
             logger.error(f"Error getting AI response: {e}", exc_info=True)
     else:
@@ -300,5 +340,8 @@ async def handle_user_message(message: Message, bot: Bot):
         # Используем настраиваемое сообщение
         off_hours_msg = settings.get('off_hours_message', OFF_HOURS_REPLY)
         await message.answer(off_hours_msg)
+    elif ai_shed:
+        # ИИ перегружен — сообщаем, что сообщение получено и его увидит оператор
+        await message.answer(get_text("message_received", user_lang))
     else:
         logger.debug("Working hours, no auto-reply")
@@ -54,11 +54,46 @@ def dashboard_keyboard():
     """Клавиатура дашборда."""
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="🔄 Обновить", callback_data="admin_dashboard_refresh")],
+        [InlineKeyboardButton(text="📈 Аналитика", callback_data="admin_analytics")],
         [InlineKeyboardButton(text="📤 Экспорт пользователей (CSV)", callback_data="admin_export_users")],
         [InlineKeyboardButton(text="‹ Назад", callback_data="admin_back_to_main")],
     ])
 
 
+EXPORT_SEGMENT_LABELS = {
+    "all": "Все",
+    "active30": "Активные 30 дн",
+    "reachable": "Доступные",
+    "blocked": "Заблокированные",
+}
+EXPORT_COLUMN_LABELS = {"basic": "Основные", "full": "Все поля", "ids": "Только ID"}
+
+
+def export_users_keyboard(segment: str = "all", columns: str = "basic", compress: bool = False):
+    """
+    Параметры выгрузки пользователей.
+    Текущий выбор кодируется в callback_data: admin_export_{set|run}_{segment}_{columns}_{gzip}.
+    """
+    gz = int(compress)
+
+    def option(label: str, selected: bool, seg: str, cols: str, zipped: int):
+        return InlineKeyboardButton(
+            text=f"{'✅ ' if selected else ''}{label}",
+            callback_data=f"admin_export_set_{seg}_{cols}_{zipped}",
+        )
+
+    seg_buttons = [option(label, key == segment, key, columns, gz) for key, label in EXPORT_SEGMENT_LABELS.items()]
+    col_buttons = [option(label, key == columns, segment, key, gz) for key, label in EXPORT_COLUMN_LABELS.items()]
+    return InlineKeyboardMarkup(inline_keyboard=[
+        seg_buttons[:2],
+        seg_buttons[2:],
+        col_buttons,
+        [option("🗜️ Сжать (gzip)", compress, segment, columns, 1 - gz)],
+        [InlineKeyboardButton(text="📤 Выгрузить", callback_data=f"admin_export_run_{segment}_{columns}_{gz}")],
+        [InlineKeyboardButton(text="‹ Назад", callback_data="admin_dashboard")],
+    ])
+
+
 # ============================================================================
 # ПРИВЕТСТВИЕ
 # ============================================================================
@@ -211,6 +246,7 @@ def ai_management_keyboard(settings: dict):
         [InlineKeyboardButton(text="🪄 Системный промпт", callback_data="admin_change_prompt")],
         [InlineKeyboardButton(text="🔬 Выбор модели", callback_data="admin_select_ai_model")],
         [InlineKeyboardButton(text="🧪 Тест ИИ", callback_data="admin_test_ai")],
+        [InlineKeyboardButton(text="📈 Статистика ИИ", callback_data="admin_ai_stats")],
         [InlineKeyboardButton(text="‹ Назад", callback_data="admin_back_to_main")]
     ]
     return InlineKeyboardMarkup(inline_keyboard=buttons)
@@ -229,6 +265,14 @@ def ai_model_selection_keyboard(service: str, models: List[str], current_model:
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
+def ai_stats_keyboard():
+    """Клавиатура экрана статистики ИИ."""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🔄 Обновить", callback_data="admin_ai_stats")],
+        [InlineKeyboardButton(text="‹ Назад", callback_data="admin_manage_ai")]
+    ])
+
+
 def ai_test_keyboard():
     """Клавиатура для тестирования ИИ."""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -278,14 +322,14 @@ def users_menu_keyboard():
     ])
 
 
-def users_list_keyboard(users: list, page: int = 0, per_page: int = 10):
-    """Пагинированный список пользователей."""
+def users_list_keyboard(users: list, prev_cursor: str = None, next_cursor: str = None):
+    """
+    Страница списка пользователей.
+    Курсоры (из get_users_page) кодируются в callback_data навигации.
+    """
     buttons = []
-    start = page * per_page
-    end = start + per_page
-    page_users = users[start:end]
     
-    for user in page_users:
+    for user in users:
         uid = user.get('user_id', 0)
         name = user.get('name', 'Unknown')[:20]
         username = user.get('username', '')
@@ -300,10 +344,10 @@ def users_list_keyboard(users: list, page: int = 0, per_page: int = 10):
     
     # Навигация
     nav_buttons = []
-    if page > 0:
-        nav_buttons.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"admin_users_page_{page-1}"))
-    if end < len(users):
-        nav_buttons.append(InlineKeyboardButton(text="Вперёд ▶️", callback_data=f"admin_users_page_{page+1}"))
+    if prev_cursor:
+        nav_buttons.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"admin_users_prev_{prev_cursor}"))
+    if next_cursor:
+        nav_buttons.append(InlineKeyboardButton(text="Вперёд ▶️", callback_data=f"admin_users_next_{next_cursor}"))
     if nav_buttons:
         buttons.append(nav_buttons)
     
@@ -337,16 +381,91 @@ def broadcast_menu_keyboard():
     ])
 
 
-def broadcast_confirm_keyboard():
+def broadcast_confirm_keyboard(segmented: bool = False):
     """Подтверждение рассылки."""
     return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🎯 Аудитория", callback_data="admin_bc_seg_menu")],
         [
-            InlineKeyboardButton(text="✅ Отправить всем", callback_data="admin_broadcast_confirm"),
+            InlineKeyboardButton(
+                text="✅ Отправить сегменту" if segmented else "✅ Отправить всем",
+                callback_data="admin_broadcast_confirm",
+            ),
             InlineKeyboardButton(text="❌ Отмена", callback_data="admin_broadcast_cancel"),
         ],
     ])
 
 
+def broadcast_segment_keyboard(segment: dict, languages: list, remnawave: bool = False):
+    """
+    Выбор аудитории рассылки.
+
+    Args:
+        segment: Текущий сегмент (Segment.to_dict())
+        languages: Самые частые языки пользователей
+        remnawave: Показывать фильтр по подписке Remnawave
+    """
+    def option(label: str, callback: str, selected: bool) -> InlineKeyboardButton:
+        return InlineKeyboardButton(text=f"• {label}" if selected else label, callback_data=callback)
+
+    selected_langs = segment.get("languages", [])
+    seen = (
+        f"idle{segment['not_seen_days']}" if segment.get("not_seen_days")
+        else str(segment.get("seen_within_days") or "any")
+    )
+    msgs = {(None, None): "any", (1, 1): "1", (2, 9): "2-9", (10, None): "10p"}.get(
+        (segment.get("min_messages"), segment.get("max_messages")), "any"
+    )
+    origin = segment.get("origin") or "any"
+
+    rows = []
+    if languages:
+        rows.append([
+            option(lang, f"admin_bc_seg_lang_{lang}", lang in selected_langs)
+            for lang in languages
+        ])
+    rows.append([
+        option("Все", "admin_bc_seg_seen_any", seen == "any"),
+        option("7 дн", "admin_bc_seg_seen_7", seen == "7"),
+        option("30 дн", "admin_bc_seg_seen_30", seen == "30"),
+        option("Спят 30+", "admin_bc_seg_seen_idle30", seen == "idle30"),
+    ])
+    rows.append([
+        option("Любое кол-во", "admin_bc_seg_msgs_any", msgs == "any"),
+        option("1 сообщ.", "admin_bc_seg_msgs_1", msgs == "1"),
+        option("2–9", "admin_bc_seg_msgs_2-9", msgs == "2-9"),
+        option("10+", "admin_bc_seg_msgs_10p", msgs == "10p"),
+    ])
+    rows.append([
+        option("Откуда угодно", "admin_bc_seg_origin_any", origin == "any"),
+        option("Личка", "admin_bc_seg_origin_private", origin == "private"),
+        option("Группа", "admin_bc_seg_origin_group", origin == "group"),
+    ])
+    if remnawave:
+        expiring = str(segment.get("expiring_within_days") or "any")
+        rows.append([
+            option("Любая подписка", "admin_bc_seg_exp_any", expiring == "any"),
+            option("Истекает ≤3 дн", "admin_bc_seg_exp_3", expiring == "3"),
+            option("≤7 дн", "admin_bc_seg_exp_7", expiring == "7"),
+        ])
+    rows.append([
+        InlineKeyboardButton(text="↺ Сбросить", callback_data="admin_bc_seg_reset"),
+        InlineKeyboardButton(text="✅ Готово", callback_data="admin_bc_seg_done"),
+    ])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def broadcast_progress_keyboard(job_id: int, paused: bool = False):
+    """Управление идущей рассылкой."""
+    first = (
+        InlineKeyboardButton(text="▶️ Продолжить", callback_data=f"admin_bc_resume_{job_id}")
+        if paused else
+        InlineKeyboardButton(text="⏸ Пауза", callback_data=f"admin_bc_pause_{job_id}")
+    )
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [first, InlineKeyboardButton(text="⏹ Отменить", callback_data=f"admin_bc_cancel_{job_id}")],
+    ])
+
+
 def broadcast_done_keyboard():
     """После завершения рассылки."""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -390,6 +509,79 @@ def confirm_action_keyboard(confirm_callback: str, cancel_callback: str):
     ])
 
 
+# ============================================================================
+# РЕЖИМ РАБОТЫ И ГРУППЫ
+# ============================================================================
+
+GROUP_MODE_LABELS = {
+    "full": "💬 Полный",
+    "triggers": "🔑 Только триггеры",
+    "off": "🔇 Выключен",
+}
+
+
+def work_mode_keyboard(current_mode: str, groups_count: int):
+    """Меню режима работы: личка / группа и список групп."""
+    private_mark = " ✓" if current_mode == 'private' else ""
+    group_mark = " ✓" if current_mode == 'group' else ""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text=f"🤖 Личка{private_mark}", callback_data="admin_set_mode_private"),
+            InlineKeyboardButton(text=f"👥 Группа{group_mark}", callback_data="admin_set_mode_group"),
+        ],
+        [InlineKeyboardButton(text=f"👥 Группы ({groups_count})", callback_data="admin_groups")],
+        [InlineKeyboardButton(text="🔗 Привязать группу", callback_data="admin_link_group")],
+        [InlineKeyboardButton(text="📋 Инструкция", callback_data="admin_mode_help")],
+        [InlineKeyboardButton(text="‹ Назад", callback_data="admin_back_to_main")],
+    ])
+
+
+def groups_list_keyboard(groups: list):
+    """Список привязанных групп."""
+    buttons = [
+        [InlineKeyboardButton(
+            text=f"{GROUP_MODE_LABELS.get(group.mode, group.mode)[:1]} {group.title[:40]}",
+            callback_data=f"admin_grp_view_{group.chat_id}",
+        )]
+        for group in groups
+    ]
+    buttons.append([InlineKeyboardButton(text="🔗 Привязать группу", callback_data="admin_link_group")])
+    buttons.append([InlineKeyboardButton(text="‹ Назад", callback_data="admin_work_mode_menu")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+def group_settings_keyboard(group, ai_enabled: bool, faq_threshold: float):
+    """
+    Настройки одной группы. ai_enabled / faq_threshold — итоговые значения
+    (с учётом общих настроек), чтобы показать их на кнопках.
+    """
+    chat_id = group.chat_id
+    ai_text = "🧠 ИИ: " + ("вкл" if ai_enabled else "выкл") + (" (общая)" if group.ai_enabled is None else "")
+    faq_text = f"🎯 Порог FAQ: {faq_threshold:.1f}" + (" (общий)" if group.faq_threshold is None else "")
+    triggers_text = "🔑 Триггеры: " + ("общие" if group.triggers is None else str(len(group.triggers)))
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(
+            text=f"Режим: {GROUP_MODE_LABELS.get(group.mode, group.mode)}",
+            callback_data=f"admin_grp_mode_{chat_id}",
+        )],
+        [
+            InlineKeyboardButton(text=ai_text, callback_data=f"admin_grp_ai_{chat_id}"),
+            InlineKeyboardButton(text=faq_text, callback_data=f"admin_grp_faq_{chat_id}"),
+        ],
+        [InlineKeyboardButton(text=triggers_text, callback_data=f"admin_grp_triggers_{chat_id}")],
+        [InlineKeyboardButton(text="🔔 Куда уведомлять", callback_data=f"admin_grp_notify_{chat_id}")],
+        [InlineKeyboardButton(text="🗑️ Отвязать группу", callback_data=f"admin_grp_unlink_{chat_id}")],
+        [InlineKeyboardButton(text="‹ К списку групп", callback_data="admin_groups")],
+    ])
+
+
+def group_input_keyboard(chat_id: int):
+    """Кнопка возврата к настройкам группы (при вводе значения)."""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="‹ К настройкам группы", callback_data=f"admin_grp_view_{chat_id}")]
+    ])
+
+
 # ============================================================================
 # СПРАВКА
 # ============================================================================
@@ -0,0 +1,252 @@
+"""
+Простые in-memory метрики в формате Prometheus.
+
+Используется для эндпоинта /metrics (режим webhook) и экранов статистики
+в админ-панели. Без внешних зависимостей: счётчики, gauge и гистограммы
+с фиксированными корзинами.
+
+Использование:
+    from bot.metrics import registry
+
+    requests_total = registry.counter("bot_requests_total", "Всего запросов", ["kind"])
+    requests_total.labels(kind="ai").inc()
+"""
+import math
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Корзины по умолчанию (секунды) — подходят для сетевых вызовов
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Базовый класс метрики с поддержкой меток."""
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels) -> "_Metric":
+        """Возвращает дочернюю метрику для набора меток."""
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._new_child()
+                    self._children[key] = child
+        return child
+
+    def _new_child(self) -> "_Metric":
+        raise NotImplementedError
+
+    def _self_or_default(self) -> "_Metric":
+        if self.labelnames:
+            raise ValueError(f"Metric {self.name} requires labels {self.labelnames}")
+        return self
+
+    def children(self) -> List[Tuple[Tuple[str, ...], "_Metric"]]:
+        """Список (значения меток, дочерняя метрика)."""
+        if not self.labelnames:
+            return [((), self)]
+        return list(self._children.items())
+
+    def _samples(self, label_values: Tuple[str, ...]) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        for label_values, child in self.children():
+            lines.extend(child._samples(label_values))
+        return lines
+
+
+class Counter(_Metric):
+    """Монотонно растущий счётчик."""
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), _parent=None):
+        super().__init__(name, documentation, labelnames)
+        self.value = 0.0
+        self._parent = _parent
+
+    def _new_child(self) -> "Counter":
+        return Counter(self.name, self.documentation, (), _parent=self)
+
+    def inc(self, amount: float = 1.0) -> None:
+        target = self if self._parent is not None else self._self_or_default()
+        target.value += amount
+
+    def _samples(self, label_values):
+        parent = self._parent or self
+        return [f"{self.name}{_format_labels(parent.labelnames, label_values)} {_format_value(self.value)}"]
+
+
+class Gauge(_Metric):
+    """Значение, которое может расти и уменьшаться."""
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), _parent=None):
+        super().__init__(name, documentation, labelnames)
+        self.value = 0.0
+        self._parent = _parent
+
+    def _new_child(self) -> "Gauge":
+        return Gauge(self.name, self.documentation, (), _parent=self)
+
+    def _target(self) -> "Gauge":
+        return self if self._parent is not None else self._self_or_default()
+
+    def set(self, value: float) -> None:
+        self._target().value = float(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._target().value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._target().value -= amount
+
+    def _samples(self, label_values):
+        parent = self._parent or self
+        return [f"{self.name}{_format_labels(parent.labelnames, label_values)} {_format_value(self.value)}"]
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными корзинами (память O(число корзин))."""
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        _parent=None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # последняя корзина — +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._parent = _parent
+
+    def _new_child(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, (), self.buckets, _parent=self)
+
+    def observe(self, value: float) -> None:
+        target = self if self._parent is not None else self._self_or_default()
+        idx = len(target.buckets)
+        for i, bound in enumerate(target.buckets):
+            if value <= bound:
+                idx = i
+                break
+        target.counts[idx] += 1
+        target.sum += value
+        target.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Оценка квантиля по корзинам (линейная интерполяция внутри корзины)."""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        lower = 0.0
+        for i, c in enumerate(self.counts):
+            upper = self.buckets[i] if i < len(self.buckets) else lower
+            if c and cumulative + c >= rank:
+                if i >= len(self.buckets):
+                    return lower
+                return lower + (upper - lower) * ((rank - cumulative) / c)
+            cumulative += c
+            lower = upper
+        return lower
+
+    def _samples(self, label_values):
+        parent = self._parent or self
+        names = parent.labelnames
+        lines = []
+        cumulative = 0
+        for bound, c in zip(list(self.buckets) + [math.inf], self.counts):
+            cumulative += c
+            le = _format_value(bound)
+            lines.append(f"{self.name}_bucket{_format_labels(names, label_values, ('le', le))} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(names, label_values)} {_format_value(self.sum)}")
+        lines.append(f"{self.name}_count{_format_labels(names, label_values)} {self.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Реестр метрик. Повторная регистрация возвращает существующую метрику."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, *args, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as {metric.type_name}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Текст в формате Prometheus exposition."""
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Глобальный реестр
+registry = MetricsRegistry()
@@ -6,6 +6,11 @@ Rate Limiter для защиты бота от спама и DDoS.
 2. Лимит на пользователя - запросы от одного user_id
 3. Антифлуд - защита от быстрых последовательных сообщений
 4. Чёрный список - автоматическая блокировка спамеров
+
+С общим состоянием (несколько процессов webhook) баны и глобальный лимит
+хранятся в бэкенде bot.shared_state. Лимит на пользователя и антифлуд
+остаются в процессе: балансировщик направляет все апдейты пользователя
+в один и тот же процесс.
 """
 import asyncio
 import logging
@@ -18,6 +23,8 @@ from functools import wraps
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery, TelegramObject
 
+from bot.shared_state import SharedState, STATE_BACKEND_ERRORS
+
 logger = logging.getLogger(__name__)
 
 
@@ -66,8 +73,9 @@ class RateLimiter:
             ...
     """
     
-    def __init__(self, config: Optional[RateLimitConfig] = None):
+    def __init__(self, config: Optional[RateLimitConfig] = None, state: Optional[SharedState] = None):
         self.config = config or RateLimitConfig()
+        self.state = state  # Общее состояние процессов (баны, глобальный лимит)
         self.users: Dict[int, UserState] = defaultdict(UserState)
         self.global_tokens: float = float(self.config.global_rate)
         self.global_last_update: float = time.time()
@@ -145,6 +153,33 @@ class RateLimiter:
             self.users[user_id].violations = 0
             logger.info(f"User {user_id} unbanned")
     
+    async def _check_shared(self, user_id: int) -> Optional[tuple[bool, str]]:
+        """
+        Бан и глобальный лимит из общего состояния (окно в 1 секунду на все процессы).
+        None — проверка пройдена; при ошибке бэкенда решают локальные лимиты.
+        """
+        backend = self.state.backend
+        try:
+            banned_until = await backend.get(f"ratelimit:ban:{user_id}")
+            if banned_until:
+                self.users[user_id].banned_until = max(self.users[user_id].banned_until, banned_until)
+                return False, self.config.banned_message
+            if await backend.incr(f"ratelimit:global:{int(time.time())}", ttl=2) > self.config.global_rate:
+                self.stats['rate_limited'] += 1
+                return False, self.config.rate_limit_message
+        except Exception as e:
+            STATE_BACKEND_ERRORS.labels(operation="rate_limit").inc()
+            logger.error(f"Shared rate limit check failed: {e}")
+        return None
+
+    async def _share_ban(self, user_id: int) -> None:
+        duration = self.config.auto_ban_duration
+        try:
+            await self.state.backend.set(f"ratelimit:ban:{user_id}", time.time() + duration, ttl=duration)
+        except Exception as e:
+            STATE_BACKEND_ERRORS.labels(operation="rate_limit").inc()
+            logger.error(f"Failed to share ban of user {user_id}: {e}")
+
     async def check_rate_limit(self, user_id: int) -> tuple[bool, str]:
         """
         Проверяет rate limit для пользователя.
@@ -152,8 +187,23 @@ class RateLimiter:
         Returns:
             (allowed: bool, message: str)
         """
-        async with self._lock:
+        shared = self.state is not None and self.state.shared
+        if shared and not self.is_banned(user_id):
             self.stats['total_requests'] += 1
+            denied = await self._check_shared(user_id)
+            if denied:
+                return denied
+            allowed, message = await self._check_local(user_id, check_global=False, count=False)
+            if self.is_banned(user_id):
+                # Автобан в этом процессе — действует во всех
+                await self._share_ban(user_id)
+            return allowed, message
+        return await self._check_local(user_id)
+
+    async def _check_local(self, user_id: int, check_global: bool = True, count: bool = True) -> tuple[bool, str]:
+        async with self._lock:
+            if count:
+                self.stats['total_requests'] += 1
             
             # Проверяем бан
             if self.is_banned(user_id):
@@ -166,7 +216,7 @@ class RateLimiter:
             self._refill_global_tokens()
             
             # Проверяем глобальный лимит
-            if self.global_tokens < 1:
+            if check_global and self.global_tokens < 1:
                 self.stats['rate_limited'] += 1
                 return False, self.config.rate_limit_message
             
@@ -9,6 +9,7 @@
 """
 import logging
 import json
+import time
 from datetime import datetime, timezone
 from typing import Optional, Dict, Tuple, List, Any
 import aiohttp
@@ -66,6 +67,32 @@ class RemnawaveClient:
             logger.error(f"Error fetching user from Remnawave: {e}", exc_info=True)
             return None
 
+    async def get_all_users(self, page_size: int = 500) -> Optional[List[Dict]]:
+        """Получает всех пользователей панели (постранично). None — ошибка API."""
+        url = f"{self.api_url}/api/users"
+        result: List[Dict] = []
+        try:
+            timeout = aiohttp.ClientTimeout(total=30)
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                start = 0
+                while True:
+                    params = {"start": start, "size": page_size}
+                    async with session.get(url, headers=self.headers, params=params) as response:
+                        if response.status != 200:
+                            logger.error(f"Remnawave API error: {response.status}")
+                            return None
+                        data = await response.json()
+                    users = data.get('response', {}).get('users', [])
+                    result.extend(users)
+                    if len(users) < page_size:
+                        break
+                    start += page_size
+        except Exception as e:
+            logger.error(f"Error fetching users from Remnawave: {e}", exc_info=True)
+            return None
+        logger.info(f"Fetched {len(result)} users from Remnawave (full sync)")
+        return result
+
     @staticmethod
     def _parse_dt(value) -> Optional[datetime]:
         if not value:
@@ -323,6 +350,47 @@ class RemnawaveClient:
 # Глобальный экземпляр
 remnawave_client = RemnawaveClient(REMNAWAVE_API_URL, REMNAWAVE_API_TOKEN) if REMNAWAVE_API_URL and REMNAWAVE_API_TOKEN else None
 
+# Время последней синхронизации дат окончания подписок (monotonic)
+_last_expiry_sync = 0.0
+
+
+async def sync_subscription_expiry(max_age: float = 600) -> Optional[int]:
+    """
+    Загружает даты окончания подписок из Remnawave в записи пользователей бота
+    (для сегмента рассылки «подписка истекает»). Не чаще раза в max_age секунд.
+
+    Returns:
+        Число обновлённых пользователей; None — интеграция не настроена или ошибка API
+    """
+    global _last_expiry_sync
+    if not remnawave_client:
+        return None
+    if time.monotonic() - _last_expiry_sync < max_age:
+        return 0
+
+    users = await remnawave_client.get_all_users()
+    if users is None:
+        return None
+
+    from bot.user_manager import set_subscription_expiry
+
+    expiries = {}
+    for user in users:
+        telegram_id = user.get('telegramId') or user.get('telegram_id')
+        if not telegram_id:
+            continue
+        dt_expire = RemnawaveClient._parse_dt(user.get('expireAt') or user.get('expire_at'))
+        try:
+            expiries[int(telegram_id)] = dt_expire.isoformat() if dt_expire else None
+        except (TypeError, ValueError):
+            continue
+
+    updated = await set_subscription_expiry(expiries)
+    _last_expiry_sync = time.monotonic()
+    logger.info(f"Remnawave expiry sync: {len(expiries)} linked users, {updated} updated")
+    return updated
+
+
 if remnawave_client:
     logger.info(f"Remnawave integration initialized: {REMNAWAVE_API_URL}")
 else:
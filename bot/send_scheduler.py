@@ -0,0 +1,371 @@
+"""
+Общий планировщик исходящих сообщений Telegram.
+
+Все отправки бота (ответы пользователям, уведомления админу, FAQ с медиа,
+рассылка) делят один глобальный лимит Telegram (~30 сообщений/сек). Без
+планировщика рассылка может занять весь лимит, и ответы в поддержке ждут.
+
+SendSchedulerMiddleware подключается к сессии бота и прозрачно пропускает
+через планировщик каждый метод, который отправляет или правит сообщение:
+
+1. Лимит на чат (token bucket; для групп — ~20 сообщений в минуту). Правки
+   сообщений (навигация по меню, кнопки) его не расходуют — только ждут
+   паузы чата после RetryAfter, иначе панель админа тормозит вместе с
+   пересылками в тот же чат
+2. Глобальный лимит с приоритетами: ответы пользователям > сообщения админу >
+   уведомления > рассылка. Свободные токены всегда получает самый важный
+   ожидающий запрос
+3. TelegramRetryAfter приостанавливает и чат, и глобальный лимит для всех
+   отправителей, после чего запрос повторяется (до max_retries раз; дальше
+   исключение получает вызывающий). Свои повторы и темп поверх планировщика
+   отправителям не нужны
+
+Класс запроса задаётся в задаче через set_send_priority (рассылка, очередь
+уведомлений); по умолчанию — ответ пользователю, а сообщения в чат админа — «админ».
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Union
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    CopyMessage,
+    EditMessageCaption,
+    EditMessageMedia,
+    EditMessageReplyMarkup,
+    EditMessageText,
+    ForwardMessage,
+    SendAnimation,
+    SendAudio,
+    SendContact,
+    SendDice,
+    SendDocument,
+    SendLocation,
+    SendMediaGroup,
+    SendMessage,
+    SendPhoto,
+    SendPoll,
+    SendSticker,
+    SendVenue,
+    SendVideo,
+    SendVideoNote,
+    SendVoice,
+    TelegramMethod,
+)
+
+from bot.config import ADMIN_ID
+from bot.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Классы запросов (меньше — раньше)
+SEND_INTERACTIVE = 0  # Ответы пользователям
+SEND_ADMIN = 10  # Пересылки и сообщения в чат админа
+SEND_NOTIFICATION = 20  # Уведомления (новые пользователи и т.п.)
+SEND_BULK = 30  # Рассылка
+
+SEND_CLASS_NAMES = {
+    SEND_INTERACTIVE: "interactive",
+    SEND_ADMIN: "admin",
+    SEND_NOTIFICATION: "notification",
+    SEND_BULK: "bulk",
+}
+
+# Методы, которые расходуют лимит отправки сообщений
+SCHEDULED_METHODS = (
+    SendMessage, SendPhoto, SendVideo, SendDocument, SendAudio, SendVoice,
+    SendAnimation, SendSticker, SendVideoNote, SendMediaGroup, SendLocation,
+    SendVenue, SendContact, SendPoll, SendDice, CopyMessage, ForwardMessage,
+    EditMessageText, EditMessageCaption, EditMessageMedia, EditMessageReplyMarkup,
+)
+
+# Правки сообщений: идут только через глобальный лимит, без лимита чата
+EDIT_METHODS = (EditMessageText, EditMessageCaption, EditMessageMedia, EditMessageReplyMarkup)
+
+SEND_QUEUE_DEPTH = registry.gauge(
+    "send_scheduler_queue_depth", "Запросов к Telegram, ждущих глобальный лимит", ["priority"]
+)
+SEND_WAIT = registry.histogram(
+    "send_scheduler_wait_seconds",
+    "Ожидание отправки в планировщике (лимит чата и глобальный)",
+    ["priority"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+SEND_RETRY_AFTER = registry.counter(
+    "send_scheduler_retry_after_total", "Ответов TelegramRetryAfter", ["priority"]
+)
+
+_send_priority: ContextVar[Optional[int]] = ContextVar("send_priority", default=None)
+
+
+def set_send_priority(priority: int) -> None:
+    """Класс отправок текущей задачи (действует до её конца)."""
+    _send_priority.set(priority)
+
+
+def current_send_priority(chat_id: Union[int, str, None]) -> int:
+    priority = _send_priority.get()
+    if priority is not None:
+        return priority
+    return SEND_ADMIN if chat_id == ADMIN_ID else SEND_INTERACTIVE
+
+
+class TokenBucket:
+    """
+    Token bucket для исходящих сообщений с общей паузой.
+
+    pause() останавливает выдачу токенов всем ожидающим —
+    так RetryAfter от Telegram соблюдается для всех отправителей сразу.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.last_update = time.monotonic()
+        self.paused_until = 0.0
+        # Токены выдаются в порядке очереди: сообщения в один чат не обгоняют друг друга
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Запрещает отправку на seconds секунд."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    async def acquire(self) -> None:
+        """Ждёт свободный токен (с учётом паузы)."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                elapsed = now - self.last_update
+                self.tokens = min(float(self.burst), self.tokens + elapsed * self.rate)
+                self.last_update = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    async def wait_unpaused(self) -> None:
+        """Ждёт окончания паузы, не расходуя токен."""
+        while True:
+            delay = self.paused_until - time.monotonic()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+
+@dataclass
+class SendSchedulerConfig:
+    """Конфигурация планировщика отправки."""
+    global_rate: float = 28.0  # Сообщений в секунду на бота (лимит Telegram ~30)
+    global_burst: int = 10
+    chat_rate: float = 1.0  # В личный чат
+    chat_burst: int = 3
+    group_rate: float = 20 / 60  # В группу (~20 в минуту)
+    group_burst: int = 5
+    max_retries: int = 3  # Повторов после RetryAfter (потом исключение — вызывающему)
+    max_chat_buckets: int = 10000  # Дальше простаивающие лимиты чатов удаляются
+
+
+class SendScheduler:
+    """
+    Лимиты на чат и глобальная очередь с приоритетами.
+
+    Использование:
+        await send_scheduler.acquire(chat_id, SEND_BULK)
+    """
+
+    def __init__(self, config: Optional[SendSchedulerConfig] = None):
+        self.config = config or SendSchedulerConfig()
+        self.global_bucket = TokenBucket(self.config.global_rate, self.config.global_burst)
+        self._chats: Dict[Union[int, str], TokenBucket] = {}
+        self._heap: List[list] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._pump_task: Optional[asyncio.Task] = None
+
+        self.stats = {
+            'scheduled': 0,
+            'retry_after': 0,
+        }
+
+    def configure(self, config: SendSchedulerConfig) -> None:
+        """Применяет новую конфигурацию (используется при старте)."""
+        self.config = config
+        self.global_bucket = TokenBucket(config.global_rate, config.global_burst)
+        self._chats.clear()
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for waiter in self._heap if not waiter[3].done())
+
+    def get_stats(self) -> dict:
+        return {**self.stats, 'queue_depth': self.queue_depth, 'chats': len(self._chats)}
+
+    def _chat_bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.config.max_chat_buckets:
+                self._cleanup_chats()
+            if isinstance(chat_id, int) and chat_id < 0:
+                bucket = TokenBucket(self.config.group_rate, self.config.group_burst)
+            else:
+                bucket = TokenBucket(self.config.chat_rate, self.config.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _cleanup_chats(self) -> None:
+        """Удаляет лимиты чатов, которые успели полностью восстановиться."""
+        now = time.monotonic()
+        stale = [
+            chat_id for chat_id, bucket in self._chats.items()
+            if now >= bucket.paused_until and now - bucket.last_update > bucket.burst / bucket.rate
+        ]
+        for chat_id in stale:
+            del self._chats[chat_id]
+
+    async def acquire(
+        self, chat_id: Union[int, str, None], priority: int, cost: int = 1, per_chat: bool = True,
+    ) -> None:
+        """Ждёт лимит чата, затем — свою очередь к глобальному лимиту.
+
+        per_chat=False — лимит чата не расходуется (правки сообщений), но пауза
+        чата после RetryAfter соблюдается.
+        """
+        started = time.monotonic()
+        if chat_id is not None and per_chat:
+            bucket = self._chat_bucket(chat_id)
+            for _ in range(cost):
+                await bucket.acquire()
+        elif chat_id is not None:
+            bucket = self._chats.get(chat_id)
+            if bucket is not None:
+                await bucket.wait_unpaused()
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, [priority, next(self._seq), cost, future])
+        self._update_depth()
+        self._ensure_pump()
+        self._wakeup.set()
+        try:
+            await future
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        finally:
+            self._update_depth()
+        self.stats['scheduled'] += 1
+        SEND_WAIT.labels(priority=SEND_CLASS_NAMES.get(priority, priority)).observe(time.monotonic() - started)
+
+    def back_off(self, chat_id: Union[int, str, None], seconds: float) -> None:
+        """RetryAfter: пауза для чата и для всех отправителей."""
+        if chat_id is not None:
+            self._chat_bucket(chat_id).pause(seconds)
+        self.global_bucket.pause(seconds)
+
+    def paused(self, chat_id: Union[int, str, None] = None) -> bool:
+        """Действует ли сейчас пауза RetryAfter (глобальная или для чата)."""
+        now = time.monotonic()
+        if now < self.global_bucket.paused_until:
+            return True
+        bucket = self._chats.get(chat_id) if chat_id is not None else None
+        return bucket is not None and now < bucket.paused_until
+
+    def _ensure_pump(self) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+
+    def _pop_waiter(self) -> Optional[list]:
+        while self._heap:
+            waiter = heapq.heappop(self._heap)
+            if not waiter[3].done():
+                return waiter
+        return None
+
+    async def _pump(self) -> None:
+        """Выдаёт глобальные токены ожидающим в порядке приоритета."""
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            await self.global_bucket.acquire()
+            # За время ожидания токена мог прийти более важный запрос — берём лучший сейчас
+            waiter = self._pop_waiter()
+            if waiter is None:
+                continue
+            for _ in range(waiter[2] - 1):
+                await self.global_bucket.acquire()
+            if not waiter[3].done():
+                waiter[3].set_result(None)
+            self._update_depth()
+
+    def _update_depth(self) -> None:
+        depth: Dict[int, int] = {priority: 0 for priority in SEND_CLASS_NAMES}
+        for waiter in self._heap:
+            if not waiter[3].done():
+                depth[waiter[0]] = depth.get(waiter[0], 0) + 1
+        for priority, count in depth.items():
+            SEND_QUEUE_DEPTH.labels(priority=SEND_CLASS_NAMES.get(priority, priority)).set(count)
+
+    async def stop(self) -> None:
+        if self._pump_task:
+            self._pump_task.cancel()
+
+
+class SendSchedulerMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: отправки сообщений идут через планировщик.
+
+    Использование:
+        bot.session.middleware(SendSchedulerMiddleware(send_scheduler))
+    """
+
+    def __init__(self, scheduler: SendScheduler):
+        self.scheduler = scheduler
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ):
+        if not isinstance(method, SCHEDULED_METHODS):
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, "chat_id", None)
+        priority = current_send_priority(chat_id)
+        cost = len(method.media) if isinstance(method, SendMediaGroup) else 1
+        per_chat = not isinstance(method, EDIT_METHODS)
+        retries = self.scheduler.config.max_retries
+        for attempt in range(retries + 1):
+            await self.scheduler.acquire(chat_id, priority, cost, per_chat)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.scheduler.stats['retry_after'] += 1
+                SEND_RETRY_AFTER.labels(priority=SEND_CLASS_NAMES.get(priority, priority)).inc()
+                logger.warning(
+                    f"Flood control on {type(method).__name__} to {chat_id}: "
+                    f"retry after {e.retry_after}s (attempt {attempt + 1})"
+                )
+                self.scheduler.back_off(chat_id, e.retry_after)
+                if attempt == retries:
+                    raise
+
+
+send_scheduler = SendScheduler()
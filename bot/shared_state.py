@@ -0,0 +1,338 @@
+"""
+Общее состояние для нескольких процессов бота (webhook за балансировщиком).
+
+Один процесс хранит всё в памяти, и этого достаточно. Когда webhook
+обслуживают N процессов, часть состояния должна быть видна им всем:
+блокировка ИИ ставится в процессе, куда пришёл ответ админа, а проверяется —
+в процессе, куда пишет пользователь; бан и глобальный лимит действуют на весь бот;
+состояние FSM не должно теряться при перезапуске одного из процессов.
+
+Бэкенд выбирается переменной окружения STATE_BACKEND_URL:
+- пусто или memory://        — в памяти процесса (один процесс, как раньше)
+- sqlite:///bot/data/state.db — файл SQLite: несколько процессов на одном хосте
+- redis://redis:6379/0       — Redis или совместимое хранилище (Valkey, KeyDB):
+                                процессы на разных хостах; нужен пакет redis
+
+Значения хранятся в JSON; ttl — в секундах.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional, Tuple
+
+from bot.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+STATE_BACKEND_ERRORS = registry.counter(
+    "shared_state_errors_total", "Ошибок обращения к бэкенду общего состояния", ["operation"]
+)
+
+# Сколько записей между удалениями просроченных ключей
+SWEEP_INTERVAL = 1000
+
+
+class StateBackend:
+    """Хранилище ключ-значение с TTL. Базовая реализация — в памяти процесса."""
+
+    name = "memory"
+    shared = False  # Видно ли состояние другим процессам
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[Any, Optional[float]]] = {}
+        self._writes = 0
+
+    def _alive(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        item = self._data.get(key)
+        if item is not None and item[1] is not None and item[1] <= time.time():
+            del self._data[key]
+            return None
+        return item
+
+    def _put(self, key: str, value: Any, ttl: Optional[float]) -> None:
+        self._data[key] = (value, time.time() + ttl if ttl else None)
+        self._writes += 1
+        if self._writes % SWEEP_INTERVAL == 0:
+            now = time.time()
+            for k in [k for k, (_, exp) in self._data.items() if exp is not None and exp <= now]:
+                del self._data[k]
+
+    async def get(self, key: str) -> Any:
+        item = self._alive(key)
+        return None if item is None else item[0]
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._put(key, value, ttl)
+
+    async def set_if_absent(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """Записывает значение, только если ключа нет. True — записано."""
+        if self._alive(key) is not None:
+            return False
+        self._put(key, value, ttl)
+        return True
+
+    async def pop(self, key: str) -> Any:
+        item = self._alive(key)
+        if item is None:
+            return None
+        del self._data[key]
+        return item[0]
+
+    async def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    async def incr(self, key: str, ttl: Optional[float] = None) -> int:
+        """Увеличивает счётчик на 1; ttl задаётся при создании ключа (окно счётчика)."""
+        item = self._alive(key)
+        if item is None:
+            self._put(key, 1, ttl)
+            return 1
+        self._data[key] = (item[0] + 1, item[1])
+        return item[0] + 1
+
+    async def close(self) -> None:
+        self._data.clear()
+
+
+class SQLiteStateBackend(StateBackend):
+    """
+    SQLite-файл, общий для процессов одного хоста (WAL, блокировки SQLite).
+    Запросы выполняются в отдельном потоке, чтобы не блокировать event loop.
+    """
+
+    name = "sqlite"
+    shared = True
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+        self._lock = threading.Lock()
+
+    def _run(self, sql: str, params: tuple) -> list:
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+            self._writes += 1
+            if self._writes % SWEEP_INTERVAL == 0:
+                self._conn.execute("DELETE FROM kv WHERE expires_at <= ?", (time.time(),))
+            return rows
+
+    async def _query(self, sql: str, *params) -> list:
+        return await asyncio.to_thread(self._run, sql, params)
+
+    @staticmethod
+    def _expires(ttl: Optional[float]) -> Optional[float]:
+        return time.time() + ttl if ttl else None
+
+    async def get(self, key: str) -> Any:
+        rows = await self._query(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", key, time.time()
+        )
+        return json.loads(rows[0][0]) if rows else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        await self._query(
+            "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+            key, json.dumps(value, ensure_ascii=False), self._expires(ttl),
+        )
+
+    async def set_if_absent(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        # Просроченная запись считается отсутствующей и перезаписывается
+        rows = await self._query(
+            "INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+            "WHERE kv.expires_at IS NOT NULL AND kv.expires_at <= ? RETURNING 1",
+            key, json.dumps(value, ensure_ascii=False), self._expires(ttl), time.time(),
+        )
+        return bool(rows)
+
+    async def pop(self, key: str) -> Any:
+        rows = await self._query("DELETE FROM kv WHERE key = ? RETURNING value, expires_at", key)
+        if not rows or (rows[0][1] is not None and rows[0][1] <= time.time()):
+            return None
+        return json.loads(rows[0][0])
+
+    async def delete(self, key: str) -> None:
+        await self._query("DELETE FROM kv WHERE key = ?", key)
+
+    async def incr(self, key: str, ttl: Optional[float] = None) -> int:
+        now = time.time()
+        rows = await self._query(
+            "INSERT INTO kv (key, value, expires_at) VALUES (?, '1', ?) "
+            "ON CONFLICT(key) DO UPDATE SET "
+            "value = CASE WHEN kv.expires_at <= ? THEN '1' ELSE CAST(kv.value AS INTEGER) + 1 END, "
+            "expires_at = CASE WHEN kv.expires_at <= ? THEN excluded.expires_at ELSE kv.expires_at END "
+            "RETURNING value",
+            key, self._expires(ttl), now, now,
+        )
+        return int(rows[0][0])
+
+    async def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# INCR и PEXPIRE одним атомарным шагом: иначе при сбое между командами
+# счётчик остаётся без TTL навсегда
+_REDIS_INCR = """
+local value = redis.call('INCR', KEYS[1])
+if value == 1 and tonumber(ARGV[1]) > 0 then
+    redis.call('PEXPIRE', KEYS[1], ARGV[1])
+end
+return value
+"""
+
+
+class RedisStateBackend(StateBackend):
+    """Redis или совместимое хранилище (Valkey, KeyDB, Dragonfly) — общее для хостов."""
+
+    name = "redis"
+    shared = True
+
+    def __init__(self, url: str, prefix: str = "apb:"):
+        super().__init__()
+        try:
+            import redis.asyncio as aioredis
+        except ImportError as e:
+            raise RuntimeError("STATE_BACKEND_URL=redis://... requires the 'redis' package") from e
+        self.prefix = prefix
+        self._redis = aioredis.from_url(url)
+        self._incr = self._redis.register_script(_REDIS_INCR)
+
+    @staticmethod
+    def _px(ttl: Optional[float]) -> Optional[int]:
+        return max(1, int(ttl * 1000)) if ttl else None
+
+    async def get(self, key: str) -> Any:
+        raw = await self._redis.get(self.prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        await self._redis.set(self.prefix + key, json.dumps(value, ensure_ascii=False), px=self._px(ttl))
+
+    async def set_if_absent(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        return bool(await self._redis.set(
+            self.prefix + key, json.dumps(value, ensure_ascii=False), px=self._px(ttl), nx=True
+        ))
+
+    async def pop(self, key: str) -> Any:
+        raw = await self._redis.getdel(self.prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    async def delete(self, key: str) -> None:
+        await self._redis.delete(self.prefix + key)
+
+    async def incr(self, key: str, ttl: Optional[float] = None) -> int:
+        return int(await self._incr(keys=[self.prefix + key], args=[self._px(ttl) or 0]))
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+def create_state_backend(url: str) -> StateBackend:
+    """Бэкенд по адресу из STATE_BACKEND_URL."""
+    url = (url or "").strip()
+    if not url or url == "memory://":
+        return StateBackend()
+    if url.startswith("sqlite:///"):
+        return SQLiteStateBackend(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStateBackend(url)
+    raise ValueError(f"Unsupported STATE_BACKEND_URL: {url}")
+
+
+class SharedState:
+    """
+    Точка доступа к бэкенду общего состояния.
+
+    Использование:
+        shared_state.configure(config.STATE_BACKEND_URL)  # при старте
+        await shared_state.backend.set("key", value, ttl=60)
+    """
+
+    def __init__(self):
+        self.backend: StateBackend = StateBackend()
+        # Владелец аренд: pid в контейнерах совпадает (часто 1), поэтому + хост и случайная часть
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    @property
+    def shared(self) -> bool:
+        return self.backend.shared
+
+    def configure(self, url: str) -> None:
+        self.backend = create_state_backend(url)
+        logger.info(f"Shared state backend: {self.backend.name}")
+
+    async def acquire_lease(self, name: str, ttl: float) -> bool:
+        """
+        Право одного процесса из нескольких на действие или задачу (установка
+        webhook, бэкап, рассылка) на ttl секунд. Своя аренда продлевается.
+        В одиночном режиме всегда True. Ошибка бэкенда — True: лучше повторить
+        действие, чем не выполнить его вовсе.
+        """
+        if not self.shared:
+            return True
+        key = f"lease:{name}"
+        try:
+            if await self.backend.set_if_absent(key, self.owner, ttl=ttl):
+                return True
+            if await self.backend.get(key) == self.owner:
+                await self.backend.set(key, self.owner, ttl=ttl)
+                return True
+            return False
+        except Exception as e:
+            STATE_BACKEND_ERRORS.labels(operation="lease").inc()
+            logger.error(f"Shared state error on lease '{name}': {e}")
+            return True
+
+    async def renew_lease(self, name: str, ttl: float) -> bool:
+        """
+        Продлевает аренду, пока задача выполняется (истёкшая берётся заново).
+        False — аренду успел взять другой процесс.
+        """
+        if not self.shared:
+            return True
+        key = f"lease:{name}"
+        try:
+            if await self.backend.get(key) not in (None, self.owner):
+                return False
+            await self.backend.set(key, self.owner, ttl=ttl)
+            return True
+        except Exception as e:
+            STATE_BACKEND_ERRORS.labels(operation="lease").inc()
+            logger.error(f"Shared state error on lease '{name}': {e}")
+            return True
+
+    async def release_lease(self, name: str) -> None:
+        """Освобождает аренду, если она принадлежит этому процессу."""
+        if not self.shared:
+            return
+        key = f"lease:{name}"
+        try:
+            if await self.backend.get(key) == self.owner:
+                await self.backend.delete(key)
+        except Exception as e:
+            STATE_BACKEND_ERRORS.labels(operation="lease").inc()
+            logger.error(f"Shared state error on lease '{name}': {e}")
+
+    def get_stats(self) -> dict:
+        return {'backend': self.backend.name, 'shared': self.shared}
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+
+shared_state = SharedState()
@@ -0,0 +1,152 @@
+"""
+Порядок обработки апдейтов: последовательно в пределах чата, параллельно между чатами.
+
+aiogram обрабатывает апдейты параллельно (отдельными задачами), поэтому два
+быстрых сообщения одного пользователя могут выполняться одновременно:
+отвечать не по порядку и перемешивать пересылки админу.
+
+UpdateExecutorMiddleware (outer middleware на dp.update) ставит апдейт
+в очередь его ключа и выполняет ключи параллельно:
+
+- ключ — чат (личка) или (чат, пользователь) в группе, чтобы активная
+  группа не выстраивала в одну очередь всех участников;
+- очередь ключа — asyncio.Lock (FIFO); запись удаляется, как только
+  у ключа не осталось ожидающих, — память ограничена числом активных ключей;
+- общий лимит одновременно обрабатываемых апдейтов (max_concurrency);
+  слот занимается только после того, как подошла очередь ключа;
+- в очереди одного ключа — не больше max_pending_per_key апдейтов, остальные
+  сбрасываются: флуд одного пользователя не копит задачи без предела;
+- апдейт, который ждёт очередь своего ключа, освобождает место в приёме
+  webhook (data["ingest_slot"], см. webhook_ingest) — ожидающие одного
+  пользователя не занимают все места приёма.
+
+Части альбома (media_group_id) в очередь чата не ставятся: их собирает
+AlbumMiddleware, а для этого они должны прийти в обработку одновременно.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import Chat, TelegramObject, Update, User
+
+from bot.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+UPDATES_IN_FLIGHT = registry.gauge("updates_in_flight", "Апдейтов обрабатывается сейчас")
+UPDATE_KEYS_ACTIVE = registry.gauge("update_keys_active", "Чатов/пользователей с апдейтами в обработке или очереди")
+UPDATES_DROPPED = registry.counter(
+    "updates_dropped_total", "Апдейтов, сброшенных из-за переполненной очереди чата"
+)
+UPDATE_QUEUE_WAIT = registry.histogram(
+    "update_queue_wait_seconds",
+    "Ожидание апдейта в очереди чата и общего лимита",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+
+@dataclass
+class UpdateExecutorConfig:
+    """Конфигурация порядка обработки апдейтов."""
+    max_concurrency: int = 64  # Одновременно обрабатываемых апдейтов
+    max_pending_per_key: int = 16  # Апдейтов одного чата в обработке и очереди
+
+
+class _KeyQueue:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0  # Выполняется + ждут
+
+
+class UpdateExecutorMiddleware(BaseMiddleware):
+    """
+    Последовательная обработка апдейтов одного чата, параллельная — разных.
+
+    Использование:
+        dp.update.outer_middleware(UpdateExecutorMiddleware(UpdateExecutorConfig()))
+    """
+
+    def __init__(self, config: Optional[UpdateExecutorConfig] = None):
+        self.config = config or UpdateExecutorConfig()
+        self._semaphore = asyncio.Semaphore(max(1, self.config.max_concurrency))
+        self._keys: Dict[Hashable, _KeyQueue] = {}
+        self._in_flight = 0
+        self._dropped = 0
+
+    @property
+    def active_keys(self) -> int:
+        return len(self._keys)
+
+    def get_stats(self) -> dict:
+        return {'in_flight': self._in_flight, 'active_keys': self.active_keys, 'dropped': self._dropped}
+
+    @staticmethod
+    def _key(event: Update, data: Dict[str, Any]) -> Optional[Hashable]:
+        message = event.message or event.edited_message
+        if message is not None and message.media_group_id:
+            return None
+        chat: Optional[Chat] = data.get("event_chat")
+        user: Optional[User] = data.get("event_from_user")
+        if chat is not None:
+            if chat.type == "private" or user is None:
+                return chat.id
+            return chat.id, user.id
+        if user is not None:
+            return "user", user.id
+        return None
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+
+        started = time.monotonic()
+        key = self._key(event, data)
+        if key is None:
+            async with self._semaphore:
+                return await self._run(handler, event, data, started)
+
+        queue = self._keys.get(key)
+        if queue is None:
+            queue = self._keys[key] = _KeyQueue()
+            UPDATE_KEYS_ACTIVE.set(len(self._keys))
+        if queue.users >= self.config.max_pending_per_key:
+            self._dropped += 1
+            UPDATES_DROPPED.inc()
+            logger.debug(f"Update queue for {key} is full, dropping update {event.update_id}")
+            return None
+        queue.users += 1
+        try:
+            if queue.lock.locked():
+                # Ждём свою очередь — место в приёме webhook отдаём другим чатам
+                slot = data.get("ingest_slot")
+                if slot is not None:
+                    slot.release()
+            async with queue.lock:
+                async with self._semaphore:
+                    return await self._run(handler, event, data, started)
+        finally:
+            queue.users -= 1
+            if not queue.users:
+                # Ключ простаивает — очередь больше не нужна
+                del self._keys[key]
+                UPDATE_KEYS_ACTIVE.set(len(self._keys))
+
+    async def _run(self, handler, event, data, started: float) -> Any:
+        UPDATE_QUEUE_WAIT.observe(time.monotonic() - started)
+        self._in_flight += 1
+        UPDATES_IN_FLIGHT.set(self._in_flight)
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight -= 1
+            UPDATES_IN_FLIGHT.set(self._in_flight)
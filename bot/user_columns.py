@@ -0,0 +1,165 @@
+"""
+Колоночный снимок пользователей для аналитики.
+
+Записи users.json — словари со строковыми датами; для аналитических вопросов
+(распределение активности, языки, перцентили сообщений, удержание когорт)
+разбирать их на каждый запрос дорого. Здесь те же данные хранятся по колонкам
+в массивах `array` (даты — unix-время), строка на пользователя.
+
+Если установлен NumPy, запросы выполняются векторно поверх тех же массивов
+(np.frombuffer, без копирования); без NumPy — простыми циклами по массивам.
+"""
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bot.user_index import normalize_language, parse_ts
+
+try:
+    import numpy as np
+except ImportError:  # NumPy необязателен
+    np = None
+
+DAY = 86400
+WEEK = 7 * DAY
+
+# Границы «давности» последней активности для распределения (в днях)
+ACTIVITY_BUCKETS = (1, 7, 30, 90)
+
+
+class UserColumns:
+    """Колонки: user_id, first_seen, last_seen, message_count, язык (код), blocked."""
+
+    def __init__(self):
+        self.user_id = array('q')
+        self.first_seen = array('q')  # 0 — неизвестно
+        self.last_seen = array('q')
+        self.message_count = array('q')
+        self.language = array('H')  # индекс в self.languages
+        self.blocked = array('B')
+        self.languages: List[str] = []
+        self._language_ids: Dict[str, int] = {}
+        self._rows: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.user_id)
+
+    def load(self, users: Iterable[dict]) -> None:
+        """Строит снимок целиком."""
+        self.__init__()
+        for user in users:
+            self.set_row(user)
+
+    def set_row(self, user: dict) -> None:
+        """Обновляет строку пользователя (или добавляет новую)."""
+        uid = user.get("user_id")
+        if uid is None:
+            return
+        values = (
+            parse_ts(user.get("first_seen")) or 0,
+            parse_ts(user.get("last_seen")) or 0,
+            user.get("message_count", 0),
+            self._language_id(user.get("language_code")),
+            1 if user.get("blocked") else 0,
+        )
+        row = self._rows.get(uid)
+        if row is None:
+            self._rows[uid] = len(self.user_id)
+            self.user_id.append(uid)
+            for column, value in zip(self._columns(), values):
+                column.append(value)
+        else:
+            for column, value in zip(self._columns(), values):
+                column[row] = value
+
+    def _columns(self) -> Tuple[array, ...]:
+        return self.first_seen, self.last_seen, self.message_count, self.language, self.blocked
+
+    def _language_id(self, language_code: Optional[str]) -> int:
+        lang = normalize_language(language_code)
+        code = self._language_ids.get(lang)
+        if code is None:
+            code = self._language_ids[lang] = len(self.languages)
+            self.languages.append(lang)
+        return code
+
+    # ------------------------------------------------------------------
+    # Запросы
+    # ------------------------------------------------------------------
+
+    def activity_distribution(self, now: int) -> List[Tuple[str, int]]:
+        """Пользователи по давности последней активности: ≤1 дн, ≤7 дн, ... , больше."""
+        edges = [now - days * DAY for days in ACTIVITY_BUCKETS]
+        labels = [f"≤{days} дн" for days in ACTIVITY_BUCKETS] + [f">{ACTIVITY_BUCKETS[-1]} дн"]
+        counts = [0] * len(labels)
+        if np is not None and len(self):
+            last = np.frombuffer(self.last_seen, dtype=np.int64)
+            # Сколько границ пользователь «не дотянул» = номер корзины
+            bucket = (last[:, None] < np.array(edges)[None, :]).sum(axis=1)
+            counts = np.bincount(bucket, minlength=len(labels)).tolist()
+        else:
+            for last in self.last_seen:
+                i = 0
+                while i < len(edges) and last < edges[i]:
+                    i += 1
+                counts[i] += 1
+        return list(zip(labels, counts))
+
+    def language_split(self) -> List[Tuple[str, int]]:
+        """Языки по убыванию числа пользователей."""
+        if np is not None and len(self):
+            counts = np.bincount(
+                np.frombuffer(self.language, dtype=np.uint16), minlength=len(self.languages)
+            ).tolist()
+        else:
+            counts = [0] * len(self.languages)
+            for code in self.language:
+                counts[code] += 1
+        return sorted(zip(self.languages, counts), key=lambda x: x[1], reverse=True)
+
+    def message_percentiles(self, percents: Iterable[int] = (50, 90, 99)) -> Dict[int, int]:
+        """Перцентили числа сообщений на пользователя (ближайший ранг)."""
+        percents = list(percents)
+        if not len(self):
+            return {p: 0 for p in percents}
+        if np is not None:
+            values = np.frombuffer(self.message_count, dtype=np.int64)
+            result = np.percentile(values, percents, method="inverted_cdf")
+            return {p: int(v) for p, v in zip(percents, result)}
+        values = sorted(self.message_count)
+        n = len(values)
+        return {p: values[min(n - 1, max(0, -(-p * n // 100) - 1))] for p in percents}
+
+    def cohort_retention(self, now: int, weeks: int = 8) -> List[Dict[str, int]]:
+        """
+        Недельные когорты по first_seen (последние `weeks` недель, от новых к старым).
+
+        returned — вернулись позже первой недели (last_seen ≥ first_seen + 7 дн),
+        active — были активны за последние 7 дней.
+        """
+        start = now - weeks * WEEK
+        total = [0] * weeks
+        returned = [0] * weeks
+        active = [0] * weeks
+        if np is not None and len(self):
+            first = np.frombuffer(self.first_seen, dtype=np.int64)
+            last = np.frombuffer(self.last_seen, dtype=np.int64)
+            mask = (first > start) & (first <= now)
+            first, last = first[mask], last[mask]
+            cohort = ((now - first) // WEEK).clip(0, weeks - 1)
+            total = np.bincount(cohort, minlength=weeks).tolist()
+            returned = np.bincount(cohort, weights=last >= first + WEEK, minlength=weeks).astype(int).tolist()
+            active = np.bincount(cohort, weights=last > now - WEEK, minlength=weeks).astype(int).tolist()
+        else:
+            for first, last in zip(self.first_seen, self.last_seen):
+                if not (start < first <= now):
+                    continue
+                week = min(weeks - 1, (now - first) // WEEK)
+                total[week] += 1
+                if last >= first + WEEK:
+                    returned[week] += 1
+                if last > now - WEEK:
+                    active[week] += 1
+        return [
+            {"weeks_ago": week, "users": total[week], "returned": returned[week], "active": active[week]}
+            for week in range(weeks)
+        ]
@@ -0,0 +1,146 @@
+"""
+Потоковая выгрузка пользователей в CSV.
+
+Строки пишутся пачками во временные файлы (в отдельном потоке — см.
+asyncio.to_thread в админ-панели), без сборки всего CSV или всей выборки в памяти.
+Когда часть приближается к лимиту загрузки Telegram, начинается следующий файл;
+каждая часть — самостоятельный CSV с заголовком. Опционально — gzip.
+"""
+import csv
+import gzip
+import io
+import logging
+import os
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Лимит загрузки документа ботом — 50 МБ; оставляем запас
+MAX_PART_BYTES = 45 * 1024 * 1024
+
+# Как часто (в строках) проверять размер части. Размер берётся без сброса
+# буферов (может отставать на десятки КБ) — это покрывает запас в MAX_PART_BYTES
+_CHECK_EVERY = 1000
+
+
+def _date(value) -> str:
+    return value[:19] if value else ''
+
+
+# Колонка → (заголовок, значение из записи пользователя)
+EXPORT_COLUMNS: Dict[str, Tuple[str, Callable[[dict], object]]] = {
+    "id": ('ID', lambda u: u.get('user_id', '')),
+    "name": ('Имя', lambda u: u.get('name', '')),
+    "username": ('Username', lambda u: u.get('username') or ''),
+    "first_seen": ('Первое сообщение', lambda u: _date(u.get('first_seen'))),
+    "last_seen": ('Последнее сообщение', lambda u: _date(u.get('last_seen'))),
+    "messages": ('Сообщений', lambda u: u.get('message_count', 0)),
+    "blocked": ('Заблокирован', lambda u: 'Да' if u.get('blocked') else 'Нет'),
+    "language": ('Язык', lambda u: u.get('language_code') or ''),
+    "origins": ('Источник', lambda u: ','.join(u.get('origins', []))),
+    "unreachable": ('Недоступен', lambda u: u.get('unreachable') or ''),
+    "subscription": ('Подписка до', lambda u: _date(u.get('subscription_expires_at'))),
+}
+
+# Наборы колонок для админ-панели
+COLUMN_PRESETS = {
+    "basic": ["id", "name", "username", "first_seen", "last_seen", "messages", "blocked"],
+    "full": list(EXPORT_COLUMNS),
+    "ids": ["id"],
+}
+
+
+@dataclass
+class ExportResult:
+    parts: List[str]  # Пути временных файлов (удаляет вызывающий код)
+    rows: int
+
+
+class UsersCsvWriter:
+    """
+    Пишет пользователей в один или несколько временных CSV-файлов по пачкам.
+
+    write() и close() вызываются в рабочем потоке (asyncio.to_thread) — по
+    одному вызову на пачку, поэтому вся выборка в памяти не собирается.
+    Файлы открываются при первой записи. При ошибке вызывающий код зовёт abort().
+    """
+
+    def __init__(self, columns: List[str], compress: bool = False, max_part_bytes: int = MAX_PART_BYTES):
+        self.compress = compress
+        self.max_part_bytes = max_part_bytes
+        self._header = [EXPORT_COLUMNS[key][0] for key in columns]
+        self._getters = [EXPORT_COLUMNS[key][1] for key in columns]
+        self.parts: List[str] = []
+        self.rows = 0
+        self._raw = self._text = self._writer = None
+        self._part_rows = 0
+        # abort() после отмены задачи может совпасть с ещё идущим write()
+        self._lock = threading.Lock()
+
+    def _open_part(self) -> None:
+        fd, path = tempfile.mkstemp(prefix="users_", suffix=".csv.gz" if self.compress else ".csv")
+        self.parts.append(path)
+        self._raw = os.fdopen(fd, 'wb')
+        stream = gzip.GzipFile(fileobj=self._raw, mode='wb', compresslevel=6) if self.compress else self._raw
+        # utf-8-sig — чтобы Excel корректно открыл кириллицу
+        self._text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+        self._writer = csv.writer(self._text)
+        self._writer.writerow(self._header)
+        self._part_rows = 0
+
+    def _close_part(self) -> None:
+        self._text.close()  # Закрывает и gzip-поток
+        if self.compress:
+            self._raw.close()
+        self._raw = self._text = self._writer = None
+
+    def write(self, users: Iterable[dict]) -> None:
+        """Дописывает пачку пользователей в текущую часть."""
+        with self._lock:
+            self._write(users)
+
+    def _write(self, users: Iterable[dict]) -> None:
+        if self._writer is None:
+            self._open_part()
+        for user in users:
+            if self._part_rows % _CHECK_EVERY == 0 and self._part_rows:
+                if self._raw.tell() >= self.max_part_bytes:
+                    self._close_part()
+                    self._open_part()
+            self._writer.writerow([get(user) for get in self._getters])
+            self.rows += 1
+            self._part_rows += 1
+
+    def close(self) -> ExportResult:
+        """Закрывает последнюю часть и возвращает список файлов."""
+        with self._lock:
+            if self._writer is None and not self.parts:
+                self._open_part()  # Пустая выгрузка — файл с одним заголовком
+            if self._writer is not None:
+                self._close_part()
+            return ExportResult(parts=self.parts, rows=self.rows)
+
+    def abort(self) -> None:
+        """Закрывает открытую часть и удаляет все файлы."""
+        with self._lock:
+            if self._text is not None:
+                try:
+                    self._text.close()
+                    self._raw.close()
+                except Exception:
+                    pass
+                self._raw = self._text = self._writer = None
+            cleanup(ExportResult(parts=self.parts, rows=self.rows))
+            self.parts = []
+
+
+def cleanup(result: ExportResult) -> None:
+    """Удаляет временные файлы выгрузки."""
+    for path in result.parts:
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.warning(f"Failed to remove export file {path}: {e}")
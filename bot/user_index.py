@@ -0,0 +1,664 @@
+"""
+Индексы пользователей в памяти.
+
+users.json хранит записи пользователей как есть; здесь поверх них
+поддерживаются индексы, чтобы не перебирать всех пользователей на каждый
+запрос админ-панели:
+- множества ID по языку, источнику (личка / группа), блокировке, недоступности
+- упорядоченные индексы (ключ, ID) по last_seen, числу сообщений и окончанию
+  подписки Remnawave — для выборок по диапазону через bisect и постраничного
+  вывода по курсору (keyset)
+- поисковый индекс админ-панели: точные ID и username, префиксы username,
+  триграммы имён (кириллица сводится к латинице транслитерацией)
+- счётчики для статистики: сообщения, новые пользователи по дням, и битовые
+  карты активных пользователей по дням (ActivityBitmaps) для DAU/WAU/MAU
+
+Индекс строится целиком при загрузке users.json и обновляется точечно
+в функциях user_manager (track_user, block_user, ...).
+"""
+import base64
+import bisect
+import heapq
+import itertools
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+ORIGIN_PRIVATE = "private"
+ORIGIN_GROUP = "group"
+
+UNKNOWN_LANGUAGE = "unknown"
+
+
+def parse_ts(value: Optional[str]) -> Optional[int]:
+    """ISO-время из users.json → unix-время (сек); None, если не разобрать."""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def normalize_language(language_code: Optional[str]) -> str:
+    """en-US → en; пустой — unknown."""
+    if not language_code:
+        return UNKNOWN_LANGUAGE
+    return language_code.split('-')[0].lower()
+
+
+class _SortedPairs:
+    """
+    Отсортированный список пар, разбитый на блоки (как в sortedcontainers):
+    вставка и удаление — O(log n + LOAD) вместо сдвига всего списка.
+    """
+
+    LOAD = 1000  # Размер блока; блок вдвое больше — делится пополам
+
+    def __init__(self, items: Optional[List[Tuple[int, int]]] = None):
+        items = items or []
+        self._lists: List[List[Tuple[int, int]]] = [
+            items[i:i + self.LOAD] for i in range(0, len(items), self.LOAD)
+        ]
+        self._maxes: List[Tuple[int, int]] = [lst[-1] for lst in self._lists]
+        self._len = len(items)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def add(self, item: Tuple[int, int]) -> None:
+        if not self._lists:
+            self._lists.append([item])
+            self._maxes.append(item)
+        else:
+            i = min(bisect.bisect_left(self._maxes, item), len(self._maxes) - 1)
+            lst = self._lists[i]
+            bisect.insort(lst, item)
+            self._maxes[i] = lst[-1]
+            if len(lst) > 2 * self.LOAD:
+                self._lists[i:i + 1] = [lst[:self.LOAD], lst[self.LOAD:]]
+                self._maxes[i:i + 1] = [lst[self.LOAD - 1], lst[-1]]
+        self._len += 1
+
+    def remove(self, item: Tuple[int, int]) -> None:
+        i = bisect.bisect_left(self._maxes, item)
+        if i == len(self._maxes):
+            return
+        lst = self._lists[i]
+        j = bisect.bisect_left(lst, item)
+        if j == len(lst) or lst[j] != item:
+            return
+        del lst[j]
+        self._len -= 1
+        if lst:
+            self._maxes[i] = lst[-1]
+        else:
+            del self._lists[i]
+            del self._maxes[i]
+
+    def left(self, item: Tuple[int, int]) -> Tuple[int, int]:
+        """Позиция (блок, смещение) первой пары >= item."""
+        i = bisect.bisect_left(self._maxes, item)
+        if i == len(self._maxes):
+            return i, 0
+        return i, bisect.bisect_left(self._lists[i], item)
+
+    def right(self, item: Tuple[int, int]) -> Tuple[int, int]:
+        """Позиция (блок, смещение) первой пары > item."""
+        i = bisect.bisect_right(self._maxes, item)
+        if i == len(self._maxes):
+            return i, 0
+        return i, bisect.bisect_right(self._lists[i], item)
+
+    def start(self) -> Tuple[int, int]:
+        return 0, 0
+
+    def end(self) -> Tuple[int, int]:
+        return len(self._lists), 0
+
+    def forward(self, pos: Tuple[int, int], stop: Optional[Tuple[int, int]] = None) -> Iterator[Tuple[int, int]]:
+        """Пары от pos (включительно) до stop (исключая) по возрастанию."""
+        i, j = pos
+        stop_i, stop_j = stop if stop is not None else self.end()
+        while (i, j) < (stop_i, stop_j) and i < len(self._lists):
+            lst = self._lists[i]
+            last = stop_j if i == stop_i else len(lst)
+            yield from lst[j:last]
+            i, j = i + 1, 0
+
+    def backward(self, pos: Tuple[int, int]) -> Iterator[Tuple[int, int]]:
+        """Пары строго перед pos по убыванию."""
+        i, j = pos
+        if i < len(self._lists):
+            yield from reversed(self._lists[i][:j])
+        for k in range(min(i, len(self._lists)) - 1, -1, -1):
+            yield from reversed(self._lists[k])
+
+    def index(self, pos: Tuple[int, int]) -> int:
+        """Порядковый номер позиции (O(число блоков))."""
+        i, j = pos
+        return sum(len(lst) for lst in self._lists[:i]) + j
+
+
+class SortedIndex:
+    """
+    Упорядоченный индекс пар (ключ, ID) с заменой ключа пользователя.
+
+    Поиск по диапазону — bisect, O(log n + k); замена ключа — O(log n + размер блока).
+    """
+
+    def __init__(self):
+        self._items = _SortedPairs()
+        self._keys: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, user_id: int) -> Optional[int]:
+        return self._keys.get(user_id)
+
+    def set(self, user_id: int, key: Optional[int]) -> None:
+        """Устанавливает ключ пользователя (None — удалить из индекса)."""
+        old = self._keys.get(user_id)
+        if old == key:
+            return
+        if old is not None:
+            self._items.remove((old, user_id))
+            del self._keys[user_id]
+        if key is not None:
+            self._items.add((key, user_id))
+            self._keys[user_id] = key
+
+    def bulk_load(self, pairs: List[Tuple[int, int]]) -> None:
+        """Заполняет индекс целиком (пары (ID, ключ)) — одна сортировка вместо n вставок."""
+        self._keys = {uid: key for uid, key in pairs if key is not None}
+        self._items = _SortedPairs(sorted((key, uid) for uid, key in self._keys.items()))
+
+    def _bounds(self, low: Optional[int], high: Optional[int]) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+        start = self._items.start() if low is None else self._items.left((low, -(1 << 63)))
+        end = self._items.end() if high is None else self._items.right((high, 1 << 63))
+        return start, end
+
+    def range(self, low: Optional[int] = None, high: Optional[int] = None) -> Iterator[int]:
+        """ID с ключом в [low, high] (None — без границы), по возрастанию ключа."""
+        start, end = self._bounds(low, high)
+        for _, uid in self._items.forward(start, end):
+            yield uid
+
+    def before(self, cursor: Optional[Tuple[int, int]], limit: int) -> List[Tuple[int, int]]:
+        """До limit пар строго меньше cursor, по убыванию (None — от самого большого ключа)."""
+        end = self._items.end() if cursor is None else self._items.left(cursor)
+        return list(itertools.islice(self._items.backward(end), limit))
+
+    def after(self, cursor: Tuple[int, int], limit: int) -> List[Tuple[int, int]]:
+        """До limit пар строго больше cursor, по возрастанию."""
+        return list(itertools.islice(self._items.forward(self._items.right(cursor)), limit))
+
+    def descending(self) -> Iterator[Tuple[int, int]]:
+        """Все пары по убыванию ключа."""
+        return self._items.backward(self._items.end())
+
+    def count(self, low: Optional[int] = None, high: Optional[int] = None) -> int:
+        start, end = self._bounds(low, high)
+        return max(0, self._items.index(end) - self._items.index(start))
+
+
+def recency_key(user: dict) -> int:
+    """Ключ индекса last_seen: без last_seen — first_seen, без обоих — 0 (в конце списка)."""
+    return parse_ts(user.get("last_seen")) or parse_ts(user.get("first_seen")) or 0
+
+
+_TRANSLIT = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh',
+    'з': 'z', 'и': 'i', 'й': 'i', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'h', 'ц': 'ts',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'sch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya', 'і': 'i', 'ї': 'i', 'є': 'e', 'ґ': 'g', '@': ' ',
+})
+
+
+def normalize_search(text: Optional[str]) -> str:
+    """Приводит строку к форме поиска: нижний регистр, латиница, одиночные пробелы."""
+    if not text:
+        return ""
+    return " ".join(text.lower().translate(_TRANSLIT).split())
+
+
+def _trigrams(text: str) -> Set[str]:
+    """Триграммы строки; слова дополняются пробелами, чтобы искать по началу слова."""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _query_trigrams(query: str) -> Set[str]:
+    """
+    Триграммы запроса для поиска подстроки.
+    Короткий запрос (1–2 символа) ищется как начало слова.
+    """
+    if len(query) < 3:
+        return {f"  {query}"[-3:]}
+    return {query[i:i + 3] for i in range(len(query) - 2)}
+
+
+# Ранги результатов поиска (меньше — выше в выдаче)
+RANK_ID = 0
+RANK_USERNAME = 1
+RANK_NAME = 2
+RANK_USERNAME_PREFIX = 3
+RANK_NAME_PREFIX = 4
+RANK_SUBSTRING = 5
+
+
+class SearchIndex:
+    """
+    Поиск пользователей по ID, username и имени без перебора всех записей.
+
+    - ID — точное совпадение;
+    - username — точное совпадение и префикс (bisect по отсортированному списку);
+    - имя — инвертированный индекс триграмм по различным нормализованным именам
+      (имена сильно повторяются, поэтому индекс и проверка подстроки работают
+      с тысячами имён, а не с миллионом пользователей).
+
+    Из большой группы совпадений лучшие по last_seen берутся проходом
+    по индексу last_seen от новых к старым, без сортировки всех совпадений.
+    """
+
+    # Группа совпадений больше этого размера выбирается проходом по last_seen
+    WALK_THRESHOLD = 2000
+
+    def __init__(self):
+        self._names: Dict[int, str] = {}
+        self._name_users: Dict[str, Set[int]] = {}
+        self._grams: Dict[str, Set[str]] = {}
+        self._usernames: Dict[int, str] = {}
+        self._by_username: Dict[str, int] = {}
+        self._username_list: List[Tuple[str, int]] = []
+
+    def bulk_load(self, users: List[Tuple[int, Optional[str], Optional[str]]]) -> None:
+        """Заполняет индекс целиком (тройки (ID, имя, username))."""
+        self.__init__()
+        for uid, name, username in users:
+            self._add_name(uid, normalize_search(name))
+            username = (username or "").lower()
+            if username:
+                self._usernames[uid] = username
+                self._by_username[username] = uid
+        self._username_list = sorted((u, uid) for uid, u in self._usernames.items())
+
+    def update(self, uid: int, name: Optional[str], username: Optional[str]) -> None:
+        """Точечное обновление; пересчитывает только изменившиеся поля."""
+        name = normalize_search(name)
+        old_name = self._names.get(uid)
+        if old_name != name:
+            if old_name is not None:
+                self._remove_name(uid, old_name)
+            self._add_name(uid, name)
+
+        username = (username or "").lower() or None
+        old_username = self._usernames.get(uid)
+        if old_username == username:
+            return
+        if old_username is not None:
+            i = bisect.bisect_left(self._username_list, (old_username, uid))
+            if i < len(self._username_list) and self._username_list[i] == (old_username, uid):
+                del self._username_list[i]
+            if self._by_username.get(old_username) == uid:
+                del self._by_username[old_username]
+            del self._usernames[uid]
+        if username:
+            self._usernames[uid] = username
+            self._by_username[username] = uid
+            bisect.insort(self._username_list, (username, uid))
+
+    def _add_name(self, uid: int, name: str) -> None:
+        self._names[uid] = name
+        users = self._name_users.get(name)
+        if users is None:
+            users = self._name_users[name] = set()
+            for gram in _trigrams(name):
+                self._grams.setdefault(gram, set()).add(name)
+        users.add(uid)
+
+    def _remove_name(self, uid: int, name: str) -> None:
+        users = self._name_users.get(name)
+        if users is None:
+            return
+        users.discard(uid)
+        if users:
+            return
+        del self._name_users[name]
+        for gram in _trigrams(name):
+            bucket = self._grams.get(gram)
+            if bucket is not None:
+                bucket.discard(name)
+                if not bucket:
+                    del self._grams[gram]
+
+    def _match_names(self, text: str) -> Dict[str, int]:
+        """Имена, содержащие text → ранг совпадения."""
+        postings = []
+        for gram in _query_trigrams(text):
+            bucket = self._grams.get(gram)
+            if not bucket:
+                return {}
+            postings.append(bucket)
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for bucket in postings[1:]:
+            candidates &= bucket
+
+        ranks = {}
+        for name in candidates:
+            if name == text:
+                ranks[name] = RANK_NAME
+            elif name.startswith(text) or f" {text}" in name:
+                ranks[name] = RANK_NAME_PREFIX
+            elif text in name:
+                ranks[name] = RANK_SUBSTRING
+        return ranks
+
+    def search(self, query: str, known_ids: Set[int], limit: int = 10,
+               last_seen: Optional["SortedIndex"] = None) -> Tuple[List[int], int]:
+        """
+        Ищет пользователей по запросу.
+
+        Returns:
+            (ID лучших результатов — не больше limit, общее число найденных).
+            Выше ранг совпадения (ID, username, имя целиком, начало, подстрока),
+            внутри ранга — кто был активен позже.
+        """
+        raw = query.strip().lower().lstrip("@")
+        if not raw:
+            return [], 0
+        text = normalize_search(raw)
+        name_ranks = self._match_names(text) if text else {}
+
+        lo = bisect.bisect_left(self._username_list, (raw, -(1 << 63)))
+        hi = bisect.bisect_left(self._username_list, (raw + "\uffff", -(1 << 63)))
+
+        # Группы по рангам: (ранг, размер, ID группы, проверка принадлежности)
+        groups = []
+        if raw.isdigit() and int(raw) in known_ids:
+            groups.append((RANK_ID, 1, lambda: [int(raw)], None))
+        if raw in self._by_username:
+            groups.append((RANK_USERNAME, 1, lambda: [self._by_username[raw]], None))
+        if hi > lo:
+            groups.append((
+                RANK_USERNAME_PREFIX, hi - lo,
+                lambda: (uid for _, uid in self._username_list[lo:hi]),
+                lambda uid: self._usernames.get(uid, "").startswith(raw),
+            ))
+        for rank in (RANK_NAME, RANK_NAME_PREFIX, RANK_SUBSTRING):
+            names = [name for name, r in name_ranks.items() if r == rank]
+            if names:
+                groups.append((
+                    rank, sum(len(self._name_users[name]) for name in names),
+                    lambda names=names: (uid for name in names for uid in self._name_users[name]),
+                    lambda uid, rank=rank: name_ranks.get(self._names.get(uid)) == rank,
+                ))
+
+        # Общее число: совпадения по имени не пересекаются между собой,
+        # совпадения по username дополняют их
+        total = sum(len(self._name_users[name]) for name in name_ranks)
+        extra = set()
+        for rank, _, members, _ in groups:
+            if rank in (RANK_ID, RANK_USERNAME, RANK_USERNAME_PREFIX):
+                extra.update(uid for uid in members() if self._names.get(uid) not in name_ranks)
+        total += len(extra)
+
+        def recency(uid: int) -> int:
+            return (last_seen.get(uid) if last_seen is not None else None) or 0
+
+        result: List[int] = []
+        picked: Set[int] = set()
+        for _, size, members, belongs in groups:
+            need = limit - len(result)
+            if need <= 0:
+                break
+            if size > self.WALK_THRESHOLD and belongs is not None and last_seen is not None:
+                chosen = []
+                for _, uid in last_seen.descending():
+                    if uid not in picked and belongs(uid):
+                        chosen.append(uid)
+                        if len(chosen) == need:
+                            break
+            else:
+                chosen = heapq.nlargest(need, (uid for uid in members() if uid not in picked), key=recency)
+            result.extend(chosen)
+            picked.update(chosen)
+        return result, total
+
+
+def day_number(ts: int) -> int:
+    """Unix-время → номер суток UTC (дней от 1970-01-01)."""
+    return ts // 86400
+
+
+class ActivityBitmaps:
+    """
+    Активные пользователи по суткам: на каждые сутки битовая карта,
+    бит N — пользователь с порядковым номером N (поле seq в users.json).
+
+    Миллион пользователей — 125 КБ на сутки; DAU — подсчёт битов,
+    WAU/MAU — объединение карт за период.
+    """
+
+    def __init__(self, keep_days: int = 62):
+        self.keep_days = keep_days
+        self.days: Dict[int, bytearray] = {}
+
+    def mark(self, seq: int, day: int) -> None:
+        bitmap = self.days.get(day)
+        if bitmap is None:
+            bitmap = self.days[day] = bytearray()
+        byte = seq >> 3
+        if byte >= len(bitmap):
+            bitmap.extend(bytes(byte - len(bitmap) + 1))
+        bitmap[byte] |= 1 << (seq & 7)
+
+    def count(self, first_day: int, last_day: int) -> int:
+        """Уникальные активные пользователи за сутки first_day..last_day включительно."""
+        union = 0
+        for day in range(first_day, last_day + 1):
+            bitmap = self.days.get(day)
+            if bitmap:
+                union |= int.from_bytes(bitmap, "little")
+        return union.bit_count()
+
+    def prune(self, today: int) -> None:
+        for day in [d for d in self.days if d <= today - self.keep_days]:
+            del self.days[day]
+
+    def to_dict(self) -> dict:
+        return {
+            str(day): base64.b64encode(zlib.compress(bytes(bitmap))).decode("ascii")
+            for day, bitmap in self.days.items()
+        }
+
+    def load(self, data: Optional[dict]) -> None:
+        """Объединяет сохранённые карты с уже отмеченной активностью."""
+        for day, encoded in (data or {}).items():
+            try:
+                saved = zlib.decompress(base64.b64decode(encoded))
+            except (ValueError, zlib.error):
+                continue
+            bitmap = self.days.setdefault(int(day), bytearray())
+            if len(bitmap) < len(saved):
+                bitmap.extend(bytes(len(saved) - len(bitmap)))
+            for i, value in enumerate(saved):
+                if value:
+                    bitmap[i] |= value
+
+
+@dataclass
+class Segment:
+    """
+    Аудитория рассылки. Незаданные поля не ограничивают выборку;
+    заблокированные и недоступные пользователи исключаются всегда.
+    """
+    languages: List[str] = field(default_factory=list)  # Любой из языков
+    seen_within_days: Optional[int] = None  # Активны за последние N дней
+    not_seen_days: Optional[int] = None  # Не появлялись N дней и дольше
+    min_messages: Optional[int] = None
+    max_messages: Optional[int] = None
+    origin: Optional[str] = None  # private | group
+    expiring_within_days: Optional[int] = None  # Подписка Remnawave истекает в ближайшие N дней
+
+    def is_empty(self) -> bool:
+        return self == Segment()
+
+    def to_dict(self) -> dict:
+        return {k: v for k, v in self.__dict__.items() if v not in (None, [])}
+
+    @classmethod
+    def from_dict(cls, data: Optional[dict]) -> "Segment":
+        return cls(**(data or {}))
+
+
+class UserIndex:
+    """Индексы по всем пользователям (ключи — int ID)."""
+
+    def __init__(self):
+        # Активность по дням хранится отдельно от users.json и переживает пересборку
+        self.activity = ActivityBitmaps()
+        self.clear()
+
+    def clear(self) -> None:
+        self.all: Set[int] = set()
+        self.blocked: Set[int] = set()
+        self.unreachable: Set[int] = set()
+        self.by_language: Dict[str, Set[int]] = {}
+        self.by_origin: Dict[str, Set[int]] = {ORIGIN_PRIVATE: set(), ORIGIN_GROUP: set()}
+        self.last_seen = SortedIndex()
+        self.message_count = SortedIndex()
+        self.subscription_expires = SortedIndex()
+        self.search = SearchIndex()
+        self.total_messages = 0
+        self.new_by_day: Dict[int, int] = {}
+        self._language: Dict[int, str] = {}
+
+    def rebuild(self, data: dict) -> None:
+        """Полная пересборка по содержимому users.json."""
+        self.clear()
+        last_seen, counts, expires, names = [], [], [], []
+        for uid_str, user in data.get("users", {}).items():
+            uid = int(uid_str)
+            self.all.add(uid)
+            if user.get("blocked"):
+                self.blocked.add(uid)
+            self._set_language(uid, user.get("language_code"))
+            for origin in user.get("origins", ()):
+                self.by_origin.setdefault(origin, set()).add(uid)
+            seen = parse_ts(user.get("last_seen"))
+            last_seen.append((uid, recency_key(user)))
+            counts.append((uid, user.get("message_count", 0)))
+            self.total_messages += user.get("message_count", 0)
+            self._count_new(user)
+            if seen is not None and user.get("seq") is not None:
+                self.activity.mark(user["seq"], day_number(seen))
+            expires.append((uid, parse_ts(user.get("subscription_expires_at"))))
+            names.append((uid, user.get("name"), user.get("username")))
+        self.unreachable = {int(uid) for uid in data.get("unreachable", {})}
+        self.last_seen.bulk_load(last_seen)
+        self.message_count.bulk_load(counts)
+        self.subscription_expires.bulk_load(expires)
+        self.search.bulk_load(names)
+
+    def _set_language(self, uid: int, language_code: Optional[str]) -> None:
+        lang = normalize_language(language_code)
+        old = self._language.get(uid)
+        if old == lang:
+            return
+        if old is not None:
+            bucket = self.by_language.get(old)
+            if bucket is not None:
+                bucket.discard(uid)
+                if not bucket:
+                    del self.by_language[old]
+        self.by_language.setdefault(lang, set()).add(uid)
+        self._language[uid] = lang
+
+    def _count_new(self, user: dict) -> None:
+        first = parse_ts(user.get("first_seen"))
+        if first is not None:
+            day = day_number(first)
+            self.new_by_day[day] = self.new_by_day.get(day, 0) + 1
+
+    def update_user(self, uid: int, user: dict) -> None:
+        """Точечное обновление после изменения записи пользователя."""
+        if uid not in self.all:
+            self._count_new(user)
+        self.total_messages += user.get("message_count", 0) - (self.message_count.get(uid) or 0)
+        self.all.add(uid)
+        if user.get("blocked"):
+            self.blocked.add(uid)
+        else:
+            self.blocked.discard(uid)
+        if user.get("unreachable"):
+            self.unreachable.add(uid)
+        else:
+            self.unreachable.discard(uid)
+        self._set_language(uid, user.get("language_code"))
+        for origin in user.get("origins", ()):
+            self.by_origin.setdefault(origin, set()).add(uid)
+        seen = parse_ts(user.get("last_seen"))
+        self.last_seen.set(uid, recency_key(user))
+        if seen is not None and user.get("seq") is not None:
+            self.activity.mark(user["seq"], day_number(seen))
+        self.message_count.set(uid, user.get("message_count", 0))
+        self.subscription_expires.set(uid, parse_ts(user.get("subscription_expires_at")))
+        self.search.update(uid, user.get("name"), user.get("username"))
+
+    def reachable(self) -> Set[int]:
+        """Пользователи, которым можно отправлять рассылку."""
+        return self.all - self.blocked - self.unreachable
+
+    def resolve(self, segment: Segment, now: Optional[float] = None) -> Set[int]:
+        """ID пользователей сегмента (пересечение индексов, без перебора записей)."""
+        now = int(now if now is not None else datetime.now(timezone.utc).timestamp())
+        filters: List[Set[int]] = []
+
+        if segment.languages:
+            langs: Set[int] = set()
+            for lang in segment.languages:
+                langs |= self.by_language.get(lang, set())
+            filters.append(langs)
+        if segment.origin:
+            filters.append(self.by_origin.get(segment.origin, set()))
+        if segment.seen_within_days is not None:
+            filters.append(set(self.last_seen.range(low=now - segment.seen_within_days * 86400)))
+        if segment.not_seen_days is not None:
+            filters.append(set(self.last_seen.range(high=now - segment.not_seen_days * 86400)))
+        if segment.min_messages is not None or segment.max_messages is not None:
+            filters.append(set(self.message_count.range(segment.min_messages, segment.max_messages)))
+        if segment.expiring_within_days is not None:
+            filters.append(set(
+                self.subscription_expires.range(now, now + segment.expiring_within_days * 86400)
+            ))
+
+        if not filters:
+            return self.reachable()
+        # Пересекаем начиная с самого маленького множества
+        filters.sort(key=len)
+        result = set(filters[0])
+        for other in filters[1:]:
+            result &= other
+        return result - self.blocked - self.unreachable
+
+    def find(self, query: str, limit: int = 10) -> Tuple[List[int], int]:
+        """Поиск пользователей по ID, username или имени (см. SearchIndex)."""
+        return self.search.search(query, self.all, limit, self.last_seen)
+
+    def language_counts(self) -> Dict[str, int]:
+        return {lang: len(uids) for lang, uids in self.by_language.items()}
+
+    def reachable_count(self) -> int:
+        """Размер reachable() без построения множества."""
+        return len(self.all) - len(self.blocked) - len(self.unreachable - self.blocked)
+
+    def new_users(self, first_day: int, last_day: int) -> int:
+        return sum(self.new_by_day.get(day, 0) for day in range(first_day, last_day + 1))
@@ -1,28 +1,233 @@
 """
 Модуль управления пользователями.
 Хранит статистику, историю сообщений, блокировки.
+
+users.json держится в памяти и перечитывается, только если файл изменился
+извне (например, восстановлен бэкап). Поверх данных поддерживаются индексы
+(bot/user_index.py) для сегментов рассылки и статистики.
+
+Статистика (итоги, языки, DAU/WAU/MAU) считается по индексам без прохода
+по пользователям. Карты активности по дням хранятся в activity.json
+и сохраняются не чаще раза в ACTIVITY_SAVE_INTERVAL секунд.
+
+Файл может быть общим для нескольких процессов бота: изменения выполняются
+под межпроцессной блокировкой (чтение-изменение-запись), запись атомарная.
+Функции изменения — корутины: блокировку, занятую другим процессом, они ждут
+опросом, не останавливая event loop.
+
+Ограничение нескольких процессов: синхронизация между ними — целым файлом.
+Запись другого процесса (каждое сообщение в личке) заставляет этот процесс
+при следующем обращении перечитать users.json и пересобрать индексы — O(n).
+Для баз в десятки тысяч пользователей и экранов админки на индексах
+(сегменты, поиск, статистика) нужен один пишущий процесс.
 """
+import asyncio
 import json
 import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from functools import wraps
 from pathlib import Path
 from datetime import datetime, timezone
-from typing import Optional
+from typing import AsyncIterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка между процессами недоступна
+    fcntl = None
+
+from bot.user_columns import UserColumns
+from bot.user_index import UserIndex, Segment, day_number
 
 logger = logging.getLogger(__name__)
 
 USERS_FILE = "bot/data/users.json"
+ACTIVITY_FILE = "bot/data/activity.json"
+ACTIVITY_SAVE_INTERVAL = 60
+
+# Причины недоступности пользователя (по результатам рассылки)
+UNREACHABLE_BLOCKED_BOT = "blocked_bot"  # 403: пользователь заблокировал бота
+UNREACHABLE_DEACTIVATED = "deactivated"  # 403: аккаунт удалён
+UNREACHABLE_CHAT_NOT_FOUND = "chat_not_found"  # 400: чат не найден
+
+
+# Кэш users.json: (файл, mtime) → данные; индекс соответствует кэшу
+_cache = {"key": None, "data": None}
+_index = UserIndex()
+_activity = {"loaded": False, "saved_at": 0.0, "dirty": False}
+
+# Колоночный снимок для аналитики: строится по запросу, изменения применяются пачкой
+_columns = UserColumns()
+_columns_state = {"data": None, "pending": set()}
+
+
+# Интервал опроса блокировки users.json, занятой другим процессом (сек)
+LOCK_RETRY_DELAY = 0.01
+
+_lock_state = {"lock": None}
+
+
+@asynccontextmanager
+async def _users_file_lock():
+    """
+    Межпроцессная блокировка users.json. Задачи процесса ждут друг друга
+    в asyncio.Lock, другой процесс — опросом flock(LOCK_NB).
+    """
+    if _lock_state["lock"] is None:
+        _lock_state["lock"] = asyncio.Lock()
+    async with _lock_state["lock"]:
+        if fcntl is None:
+            yield
+            return
+        path = Path(USERS_FILE + ".lock")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'a') as f:
+            while True:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    await asyncio.sleep(LOCK_RETRY_DELAY)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _exclusive(func):
+    """
+    Изменение users.json: чтение свежих данных и запись под блокировкой.
+    Обёрнутая функция — корутина; сама функция выполняется без await,
+    целиком под блокировкой.
+    """
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        async with _users_file_lock():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def _file_key() -> Optional[tuple]:
+    try:
+        st = os.stat(USERS_FILE)
+        # Запись идёт через rename — новый inode даже при грубом mtime
+        return (USERS_FILE, st.st_mtime_ns, st.st_ino)
+    except OSError:
+        return (USERS_FILE, None)
 
 
 def _load_users() -> dict:
-    """Загружает данные пользователей."""
+    """
+    Загружает данные пользователей.
+    Возвращает закэшированный словарь, если файл не менялся с последнего чтения/записи.
+    """
+    key = _file_key()
+    if _cache["data"] is not None and _cache["key"] == key:
+        return _cache["data"]
+
+    data = None
     try:
         path = Path(USERS_FILE)
         if path.exists():
             with open(path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+                data = json.load(f)
     except Exception as e:
         logger.error(f"Error loading users: {e}")
-    return {"users": {}, "blocked": [], "broadcasts": []}
+    if data is None:
+        data = {"users": {}, "blocked": [], "broadcasts": [], "unreachable": {}}
+
+    if not _activity["loaded"]:
+        _activity["loaded"] = True
+        try:
+            with open(ACTIVITY_FILE, 'r', encoding='utf-8') as f:
+                _index.activity.load(json.load(f).get("days"))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Error loading activity: {e}")
+
+    _cache["key"] = key
+    _cache["data"] = data
+    _index.rebuild(data)
+    return data
+
+
+def _assign_seq(data: dict) -> int:
+    """
+    Выдаёт порядковые номера (seq) пользователям без них — номер бита
+    в картах активности. Старые записи нумеруются по first_seen.
+    """
+    missing = [u for u in data["users"].values() if u.get("seq") is None]
+    if not missing:
+        return 0
+    next_seq = data.get("next_seq")
+    if next_seq is None:
+        next_seq = max((u["seq"] for u in data["users"].values() if u.get("seq") is not None), default=-1) + 1
+    missing.sort(key=lambda u: (u.get("first_seen") or "", u.get("user_id", 0)))
+    for user in missing:
+        user["seq"] = next_seq
+        next_seq += 1
+    data["next_seq"] = next_seq
+    return len(missing)
+
+
+@_exclusive
+def assign_missing_seq() -> int:
+    """
+    Нумерует записи без seq (users.json старых версий) и сохраняет файл.
+    Вызывается при запуске; до этого такие пользователи не попадают в карты активности.
+    """
+    data = _load_users()
+    assigned = _assign_seq(data)
+    if assigned:
+        _save_users(data)
+        _index.rebuild(data)
+        logger.info(f"Assigned seq to {assigned} users")
+    return assigned
+
+
+@_exclusive
+def save_activity(force: bool = False) -> None:
+    """
+    Сохраняет карты активности по дням (не чаще ACTIVITY_SAVE_INTERVAL секунд).
+    force=True — при остановке бота.
+    """
+    _save_activity(force)
+
+
+def _save_activity(force: bool = False) -> None:
+    """
+    save_activity под уже взятой блокировкой users.json.
+
+    Файл общий для процессов бота: отметки из файла объединяются с отметками
+    этого процесса (OR карт), и только потом файл перезаписывается —
+    чужая активность не теряется.
+    """
+    if not _activity["dirty"]:
+        return
+    if not force and time.monotonic() - _activity["saved_at"] < ACTIVITY_SAVE_INTERVAL:
+        return
+    path = Path(ACTIVITY_FILE)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            _index.activity.load(json.load(f).get("days"))
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.error(f"Error merging activity from disk: {e}")
+    _index.activity.prune(day_number(int(time.time())))
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({"days": _index.activity.to_dict()}, f)
+        os.replace(tmp, path)
+    except Exception as e:
+        logger.error(f"Error saving activity: {e}")
+        return
+    _activity["saved_at"] = time.monotonic()
+    _activity["dirty"] = False
 
 
 def _save_users(data: dict):
@@ -30,32 +235,102 @@ def _save_users(data: dict):
     try:
         path = Path(USERS_FILE)
         path.parent.mkdir(parents=True, exist_ok=True)
-        with open(path, 'w', encoding='utf-8') as f:
+        # Через временный файл: другой процесс не прочитает файл наполовину
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
     except Exception as e:
         logger.error(f"Error saving users: {e}")
+        return
+    # Своя запись не требует перечитывания файла
+    _cache["key"] = _file_key()
+    _cache["data"] = data
+
+
+def _update_indexes(user_id: int, user: dict) -> None:
+    """Обновляет индексы после изменения записи; снимок аналитики — отложенно."""
+    _index.update_user(user_id, user)
+    _columns_state["pending"].add(user_id)
 
 
-def track_user(user_id: int, full_name: str, username: Optional[str] = None, language_code: Optional[str] = None) -> bool:
+def get_user_columns() -> UserColumns:
+    """
+    Колоночный снимок пользователей для аналитики (bot/user_columns.py).
+
+    Строится целиком при первом обращении и после перечитывания users.json;
+    изменённые с прошлого обращения пользователи применяются одной пачкой.
+    """
+    data = _load_users()
+    pending = _columns_state["pending"]
+    if _columns_state["data"] is not data:
+        _columns.load(data["users"].values())
+        _columns_state["data"] = data
+    elif pending:
+        for user_id in pending:
+            user = data["users"].get(str(user_id))
+            if user is not None:
+                _columns.set_row(user)
+    pending.clear()
+    return _columns
+
+
+def get_user_index() -> UserIndex:
+    """Индексы пользователей (актуальные для текущего users.json)."""
+    _load_users()
+    return _index
+
+
+@_exclusive
+def track_user(
+    user_id: int,
+    full_name: str,
+    username: Optional[str] = None,
+    language_code: Optional[str] = None,
+    origin: Optional[str] = None,
+) -> bool:
     """
     Регистрирует пользователя или обновляет его данные.
     Вызывается при каждом сообщении.
+
+    Args:
+        origin: Откуда пишет пользователь — ORIGIN_PRIVATE или ORIGIN_GROUP
     
     Returns:
         True если это новый пользователь, False если существующий
     """
     data = _load_users()
+    is_new = _apply_activity(data, user_id, full_name, username, language_code, origin)
+    _save_users(data)
+    _activity["dirty"] = True
+    _save_activity()
+    return is_new
+
+
+def _apply_activity(
+    data: dict,
+    user_id: int,
+    full_name: str,
+    username: Optional[str],
+    language_code: Optional[str],
+    origin: Optional[str],
+    messages: int = 1,
+    seen_at: Optional[str] = None,
+) -> bool:
+    """Обновляет запись пользователя в data (без сохранения). True — новый пользователь."""
     uid_str = str(user_id)
     is_new = uid_str not in data["users"]
+    seen_at = seen_at or datetime.now(timezone.utc).isoformat()
 
     if is_new:
         data["users"][uid_str] = {
             "user_id": user_id,
+            "seq": _next_seq(data),
             "name": full_name,
             "username": username,
             "language_code": language_code,
-            "first_seen": datetime.now(timezone.utc).isoformat(),
-            "last_seen": datetime.now(timezone.utc).isoformat(),
+            "first_seen": seen_at,
+            "last_seen": seen_at,
             "message_count": 0,
             "blocked": False,
         }
@@ -65,13 +340,101 @@ def track_user(user_id: int, full_name: str, username: Optional[str] = None, lan
     user["username"] = username
     if language_code:
         user["language_code"] = language_code
-    user["last_seen"] = datetime.now(timezone.utc).isoformat()
-    user["message_count"] = user.get("message_count", 0) + 1
+    user["last_seen"] = seen_at
+    user["message_count"] = user.get("message_count", 0) + messages
+    if origin and origin not in user.get("origins", []):
+        user.setdefault("origins", []).append(origin)
 
-    _save_users(data)
+    # Написал боту — значит снова доступен для рассылок
+    if user.pop("unreachable", None):
+        user.pop("unreachable_at", None)
+        data.get("unreachable", {}).pop(uid_str, None)
+
+    _update_indexes(user_id, user)
     return is_new
 
 
+# Накопленная активность (в группах): user_id → данные последнего сообщения и счётчик
+_pending_activity: dict = {}
+_pending_state = {"wakeup": None}
+ACTIVITY_FLUSH_INTERVAL = 30
+ACTIVITY_FLUSH_SIZE = 500
+
+
+def record_user_activity(
+    user_id: int,
+    full_name: str,
+    username: Optional[str] = None,
+    language_code: Optional[str] = None,
+    origin: Optional[str] = None,
+) -> None:
+    """
+    Дешёвый учёт активности для потоков сообщений (группы): изменения копятся
+    в памяти, и run_activity_flush_loop записывает их в users.json одной пачкой —
+    раз в ACTIVITY_FLUSH_INTERVAL секунд или по ACTIVITY_FLUSH_SIZE пользователей.
+    """
+    entry = _pending_activity.get(user_id)
+    if entry is None:
+        entry = _pending_activity[user_id] = {"messages": 0}
+    entry.update(
+        full_name=full_name,
+        username=username,
+        language_code=language_code or entry.get("language_code"),
+        origin=origin,
+        seen_at=datetime.now(timezone.utc).isoformat(),
+    )
+    entry["messages"] += 1
+    if len(_pending_activity) >= ACTIVITY_FLUSH_SIZE and _pending_state["wakeup"] is not None:
+        _pending_state["wakeup"].set()
+
+
+@_exclusive
+def flush_user_activity() -> int:
+    """Записывает накопленную активность. Возвращает число обновлённых пользователей."""
+    if not _pending_activity:
+        return 0
+    pending = dict(_pending_activity)
+    _pending_activity.clear()
+    data = _load_users()
+    for user_id, entry in pending.items():
+        _apply_activity(
+            data, user_id, entry["full_name"], entry["username"], entry["language_code"],
+            entry["origin"], messages=entry["messages"], seen_at=entry["seen_at"],
+        )
+    _save_users(data)
+    _activity["dirty"] = True
+    _save_activity()
+    return len(pending)
+
+
+async def run_activity_flush_loop() -> None:
+    """
+    Фоновая запись накопленной активности (record_user_activity): раз в
+    ACTIVITY_FLUSH_INTERVAL секунд или сразу, когда накопилось ACTIVITY_FLUSH_SIZE.
+    """
+    wakeup = _pending_state["wakeup"] = asyncio.Event()
+    while True:
+        try:
+            await asyncio.wait_for(wakeup.wait(), timeout=ACTIVITY_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        wakeup.clear()
+        try:
+            if _pending_activity:
+                await flush_user_activity()
+            await save_activity()
+        except Exception as e:
+            logger.error(f"Error flushing user activity: {e}")
+
+
+def _next_seq(data: dict) -> int:
+    seq = data.get("next_seq")
+    if seq is None:
+        seq = max((u.get("seq", -1) for u in data["users"].values()), default=-1) + 1
+    data["next_seq"] = seq + 1
+    return seq
+
+
 def get_user(user_id: int) -> Optional[dict]:
     """Получает данные пользователя."""
     data = _load_users()
@@ -87,21 +450,154 @@ def get_all_users() -> list:
     return users
 
 
-def get_users_stats() -> dict:
-    """Возвращает статистику пользователей."""
+def get_user_ids_by_recency(only: Optional[set] = None) -> list[int]:
+    """
+    ID пользователей по убыванию last_seen (по индексу, без сортировки записей).
+
+    Args:
+        only: Оставить только эти ID (например, сегмент)
+    """
+    _load_users()
+    # Пользователи без last_seen — по first_seen или в конце (recency_key)
+    return [uid for _, uid in _index.last_seen.descending() if only is None or uid in only]
+
+
+# Сколько записей копируется за один шаг event loop
+SNAPSHOT_CHUNK = 2000
+
+
+async def iter_user_snapshots(user_ids: list[int]) -> AsyncIterator[list[dict]]:
+    """
+    Копии записей пользователей по списку ID — пачками по SNAPSHOT_CHUNK, для
+    обработки в рабочем потоке. Записи в кэше меняются в event loop (активность,
+    блокировки, рассылки), поэтому копии снимаются здесь же; следующая пачка
+    копируется, только когда вызывающий код обработал предыдущую.
+    """
+    for start in range(0, len(user_ids), SNAPSHOT_CHUNK):
+        users = _load_users()["users"]
+        chunk = []
+        for uid in user_ids[start:start + SNAPSHOT_CHUNK]:
+            user = users.get(str(uid))
+            if user is not None:
+                # Вложенные списки (origins) тоже копируются
+                chunk.append({k: list(v) if isinstance(v, list) else v for k, v in user.items()})
+        if chunk:
+            yield chunk
+
+
+def encode_cursor(pair: tuple) -> str:
+    """Курсор страницы (last_seen, user_id) → строка для callback_data."""
+    return f"{pair[0]}_{pair[1]}"
+
+
+def decode_cursor(value: str) -> tuple:
+    key, uid = value.split("_")
+    return int(key), int(uid)
+
+
+def get_users_page(cursor: Optional[str] = None, backward: bool = False, per_page: int = 10) -> dict:
+    """
+    Страница списка пользователей по убыванию last_seen (keyset-пагинация).
+
+    Курсор — позиция (last_seen, user_id) крайнего пользователя соседней страницы,
+    поэтому страница стоит O(per_page), а новая активность пользователей
+    не сдвигает уже открытые страницы.
+
+    Args:
+        cursor: Курсор из callback_data (None — первая страница)
+        backward: False — страница после курсора (старее), True — перед курсором (новее)
+
+    Returns:
+        {'users': [...], 'prev': курсор | None, 'next': курсор | None, 'total': int}
+    """
+    data = _load_users()
+    index = _index.last_seen
+    position = decode_cursor(cursor) if cursor else None
+
+    if backward and position is not None:
+        pairs = index.after(position, per_page + 1)
+        has_newer = len(pairs) > per_page
+        pairs = pairs[:per_page][::-1]
+        has_older = bool(index.before(pairs[-1], 1)) if pairs else False
+    else:
+        pairs = index.before(position, per_page + 1)
+        has_older = len(pairs) > per_page
+        pairs = pairs[:per_page]
+        has_newer = bool(index.after(pairs[0], 1)) if pairs else False
+
+    users = [data["users"][str(uid)] for _, uid in pairs if str(uid) in data["users"]]
+    return {
+        "users": users,
+        "prev": encode_cursor(pairs[0]) if pairs and has_newer else None,
+        "next": encode_cursor(pairs[-1]) if pairs and has_older else None,
+        "total": len(data["users"]),
+    }
+
+
+def search_users(query: str, limit: int = 10) -> tuple[list, int]:
+    """
+    Поиск пользователей по ID, username или имени (поисковый индекс, без перебора).
+    Имена ищутся и по-русски, и транслитом: «иван» найдёт «Ivan».
+
+    Returns:
+        (лучшие результаты — не больше limit, общее число найденных)
+    """
     data = _load_users()
-    users = data["users"].values()
-    total = len(users)
-    blocked = sum(1 for u in users if u.get("blocked"))
-    total_messages = sum(u.get("message_count", 0) for u in users)
+    ids, total = _index.find(query, limit)
+    return [data["users"][str(uid)] for uid in ids if str(uid) in data["users"]], total
+
 
+def get_users_stats() -> dict:
+    """Возвращает статистику пользователей (по индексам, без прохода по записям)."""
+    _load_users()
     return {
-        "total": total,
-        "blocked": blocked,
-        "total_messages": total_messages,
+        "total": len(_index.all),
+        "blocked": len(_index.blocked),
+        "total_messages": _index.total_messages,
+        "unreachable": len(_index.unreachable),
+        "reachable": _index.reachable_count(),
     }
 
 
+def get_activity_stats() -> dict:
+    """
+    Активность по суткам UTC.
+
+    Returns:
+        dau/wau/mau — уникальные активные за сегодня / 7 / 30 суток,
+        *_prev — то же за предыдущий период (для тренда),
+        new_today/new_week/new_month — новые пользователи,
+        daily — DAU за последние 7 суток (от старых к новым)
+    """
+    _load_users()
+    today = day_number(int(time.time()))
+    activity = _index.activity
+
+    def window(days: int, shift: int = 0) -> int:
+        last = today - shift
+        return activity.count(last - days + 1, last)
+
+    return {
+        "dau": window(1),
+        "dau_prev": window(1, 1),
+        "wau": window(7),
+        "wau_prev": window(7, 7),
+        "mau": window(30),
+        "mau_prev": window(30, 30),
+        "new_today": _index.new_users(today, today),
+        "new_week": _index.new_users(today - 6, today),
+        "new_month": _index.new_users(today - 29, today),
+        "daily": [window(1, shift) for shift in range(6, -1, -1)],
+    }
+
+
+def get_language_stats() -> dict[str, int]:
+    """Количество пользователей по языкам (en-US → en)."""
+    _load_users()
+    return _index.language_counts()
+
+
+@_exclusive
 def block_user(user_id: int) -> bool:
     """Блокирует пользователя."""
     data = _load_users()
@@ -109,6 +605,7 @@ def block_user(user_id: int) -> bool:
 
     if uid_str in data["users"]:
         data["users"][uid_str]["blocked"] = True
+        _update_indexes(user_id, data["users"][uid_str])
         _save_users(data)
         logger.info(f"User {user_id} blocked")
         return True
@@ -116,17 +613,20 @@ def block_user(user_id: int) -> bool:
     # Если пользователя нет, создаём запись
     data["users"][uid_str] = {
         "user_id": user_id,
+        "seq": _next_seq(data),
         "name": "Unknown",
         "blocked": True,
         "first_seen": datetime.now(timezone.utc).isoformat(),
         "last_seen": datetime.now(timezone.utc).isoformat(),
         "message_count": 0,
     }
+    _update_indexes(user_id, data["users"][uid_str])
     _save_users(data)
     logger.info(f"User {user_id} blocked (new record)")
     return True
 
 
+@_exclusive
 def unblock_user(user_id: int) -> bool:
     """Разблокирует пользователя."""
     data = _load_users()
@@ -134,6 +634,7 @@ def unblock_user(user_id: int) -> bool:
 
     if uid_str in data["users"]:
         data["users"][uid_str]["blocked"] = False
+        _update_indexes(user_id, data["users"][uid_str])
         _save_users(data)
         logger.info(f"User {user_id} unblocked")
         return True
@@ -150,26 +651,132 @@ def is_user_blocked(user_id: int) -> bool:
 
 
 def get_active_user_ids() -> list[int]:
-    """Возвращает список ID незаблокированных пользователей."""
+    """
+    Возвращает список ID пользователей для рассылки:
+    незаблокированных и не помеченных недоступными.
+    """
+    _load_users()
+    return list(_index.reachable())
+
+
+def resolve_segment(segment: Segment) -> list[int]:
+    """ID пользователей сегмента рассылки (по индексам, без перебора записей)."""
+    _load_users()
+    return list(_index.resolve(segment))
+
+
+def count_segment(segment: Segment) -> int:
+    """Размер сегмента рассылки."""
+    _load_users()
+    return len(_index.resolve(segment))
+
+
+@_exclusive
+def set_subscription_expiry(expiries: dict[int, Optional[str]]) -> int:
+    """
+    Сохраняет даты окончания подписки Remnawave (ISO) для известных пользователей.
+    Используется сегментом «подписка истекает в ближайшие N дней».
+
+    Returns:
+        Сколько пользователей обновлено
+    """
     data = _load_users()
-    return [
-        int(uid) for uid, u in data["users"].items()
-        if not u.get("blocked", False)
-    ]
+    updated = 0
+    for user_id, expires_at in expiries.items():
+        user = data["users"].get(str(user_id))
+        if user is None or user.get("subscription_expires_at") == expires_at:
+            continue
+        user["subscription_expires_at"] = expires_at
+        _update_indexes(user_id, user)
+        updated += 1
+    if updated:
+        _save_users(data)
+    return updated
 
 
-def add_broadcast_record(message_text: str, sent_count: int, failed_count: int):
-    """Записывает историю рассылки."""
+@_exclusive
+def mark_unreachable(reasons: dict[int, str]) -> int:
+    """
+    Помечает пользователей недоступными (одной записью файла на всю пачку).
+    Такие пользователи исключаются из рассылок, пока снова не напишут боту.
+
+    Args:
+        reasons: {user_id: причина} — UNREACHABLE_*
+
+    Returns:
+        Сколько пользователей помечено
+    """
+    if not reasons:
+        return 0
+    data = _load_users()
+    index = data.setdefault("unreachable", {})
+    now = datetime.now(timezone.utc).isoformat()
+    marked = 0
+    for user_id, reason in reasons.items():
+        uid_str = str(user_id)
+        user = data["users"].get(uid_str)
+        if user is None:
+            continue
+        user["unreachable"] = reason
+        user["unreachable_at"] = now
+        index[uid_str] = reason
+        _update_indexes(user_id, user)
+        marked += 1
+    _save_users(data)
+    logger.info(f"Marked {marked} users as unreachable")
+    return marked
+
+
+def get_unreachable_stats() -> dict:
+    """Количество недоступных пользователей по причинам."""
+    data = _load_users()
+    stats: dict = {}
+    for reason in data.get("unreachable", {}).values():
+        stats[reason] = stats.get(reason, 0) + 1
+    return stats
+
+
+@_exclusive
+def add_broadcast_record(
+    message_text: str,
+    sent_count: int,
+    failed_count: int,
+    total: Optional[int] = None,
+    unknown: int = 0,
+    duration: Optional[float] = None,
+    status: str = "done",
+    unreachable: int = 0,
+):
+    """
+    Записывает историю рассылки.
+
+    Args:
+        total: Получателей в задании
+        unknown: Получателей с неизвестным результатом (сбой бота во время отправки)
+        duration: Длительность отправки в секундах (без пауз)
+        status: done | cancelled
+        unreachable: Получателей, помеченных недоступными по итогам рассылки
+    """
     data = _load_users()
     if "broadcasts" not in data:
         data["broadcasts"] = []
 
-    data["broadcasts"].append({
+    record = {
         "timestamp": datetime.now(timezone.utc).isoformat(),
         "message_preview": message_text[:100],
         "sent": sent_count,
         "failed": failed_count,
-    })
+        "status": status,
+    }
+    if total is not None:
+        record["total"] = total
+    if unknown:
+        record["unknown"] = unknown
+    if unreachable:
+        record["unreachable"] = unreachable
+    if duration is not None:
+        record["duration"] = round(duration, 1)
+    data["broadcasts"].append(record)
 
     # Храним только последние 20 рассылок
     data["broadcasts"] = data["broadcasts"][-20:]
@@ -0,0 +1,273 @@
+"""
+Приём апдейтов в режиме webhook: дедупликация и ограниченная очередь.
+
+SimpleRequestHandler из aiogram запускает обработку каждого запроса отдельной
+задачей без ограничений. Если бот отвечает медленно, Telegram повторяет запрос,
+и тот же update_id обрабатывается дважды (два вызова ИИ, две пересылки админу);
+всплеск апдейтов порождает неограниченное число задач.
+
+WebhookIngestHandler:
+1. Проверяет secret token и отбрасывает повторы по update_id
+   (кольцевой буфер последних dedup_size идентификаторов)
+2. Сразу отвечает Telegram 200 и кладёт апдейт в ограниченную очередь;
+   воркер-цикл выбирает из неё апдейты и запускает обработку,
+   не больше max_in_flight одновременно. Апдейт, который ждёт очередь
+   своего чата (UpdateExecutorMiddleware), место освобождает
+3. При заполненной очереди:
+   - второстепенный апдейт (сообщение в группе без обращения к боту)
+     сбрасывается — или вытесняется из очереди ради важного;
+   - важный апдейт при отсутствии второстепенных получает 429,
+     и Telegram доставит его позже
+"""
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Optional, Set, Tuple
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+
+from bot.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_HIGH = 0
+PRIORITY_LOW = 1
+
+WEBHOOK_UPDATES = registry.counter(
+    "webhook_updates_total", "Входящих апдейтов webhook по результату", ["result"]
+)
+WEBHOOK_QUEUE_DEPTH = registry.gauge("webhook_queue_depth", "Апдейтов webhook в очереди")
+WEBHOOK_IN_FLIGHT = registry.gauge("webhook_in_flight", "Апдейтов webhook в обработке")
+
+
+@dataclass
+class WebhookIngestConfig:
+    """Конфигурация приёма апдейтов webhook."""
+    queue_size: int = 1000  # Апдейтов в очереди (всего)
+    max_in_flight: int = 128  # Одновременно обрабатываемых
+    dedup_size: int = 10000  # Сколько последних update_id помнить
+    retry_after: int = 1  # Заголовок Retry-After для ответа 429 (сек)
+    drain_timeout: float = 10.0  # Дообработка очереди при остановке (сек)
+
+
+class UpdateIdRing:
+    """Множество последних capacity идентификаторов (старые вытесняются по кругу)."""
+
+    def __init__(self, capacity: int):
+        self._order: Deque[int] = deque(maxlen=max(1, capacity))
+        self._ids: Set[int] = set()
+
+    def __contains__(self, update_id: int) -> bool:
+        return update_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, update_id: int) -> None:
+        if update_id in self._ids:
+            return
+        if len(self._order) == self._order.maxlen:
+            self._ids.discard(self._order[0])
+        self._order.append(update_id)
+        self._ids.add(update_id)
+
+
+class IngestSlot:
+    """Место апдейта в лимите max_in_flight; release() срабатывает один раз."""
+
+    __slots__ = ("_release",)
+
+    def __init__(self, release):
+        self._release = release
+
+    def release(self) -> None:
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+
+
+def update_priority(update: Dict[str, Any]) -> int:
+    """
+    Второстепенные апдейты — сообщения в группах, не обращённые к боту
+    (нет упоминаний и это не ответ); их можно сбросить под нагрузкой.
+    """
+    message = update.get("message")
+    if not message:
+        return PRIORITY_HIGH
+    if message.get("chat", {}).get("type") == "private":
+        return PRIORITY_HIGH
+    if message.get("reply_to_message"):
+        return PRIORITY_HIGH
+    for entity in message.get("entities") or message.get("caption_entities") or ():
+        if entity.get("type") in ("mention", "text_mention", "bot_command"):
+            return PRIORITY_HIGH
+    return PRIORITY_LOW
+
+
+class WebhookIngestHandler(SimpleRequestHandler):
+    """
+    SimpleRequestHandler с дедупликацией и ограниченной очередью.
+
+    Использование:
+        handler = WebhookIngestHandler(dispatcher=dp, bot=bot, secret_token=..., config=WebhookIngestConfig())
+        handler.register(app, path=WEBHOOK_PATH)
+    """
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        secret_token: Optional[str] = None,
+        config: Optional[WebhookIngestConfig] = None,
+        **data: Any,
+    ):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, secret_token=secret_token, **data)
+        self.config = config or WebhookIngestConfig()
+        self._seen = UpdateIdRing(self.config.dedup_size)
+        # Очереди по приоритетам: воркер берёт важные первыми
+        self._queues: Tuple[Deque[Tuple[Bot, dict]], Deque[Tuple[Bot, dict]]] = (deque(), deque())
+        self._ready = asyncio.Event()
+        self._slots = asyncio.Semaphore(max(1, self.config.max_in_flight))
+        self._in_flight = 0
+        self._worker: Optional[asyncio.Task] = None
+
+        self.stats = {
+            'accepted': 0,
+            'duplicate': 0,
+            'shed': 0,
+            'rejected': 0,
+        }
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queues[PRIORITY_HIGH]) + len(self._queues[PRIORITY_LOW])
+
+    @property
+    def processing(self) -> int:
+        """Апдейты в обработке, включая ждущие очередь своего чата."""
+        return len(self._background_feed_update_tasks)
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            'queue_depth': self.queue_depth,
+            'in_flight': self._in_flight,
+            'waiting_on_chat': self.processing - self._in_flight,
+        }
+
+    def _count(self, result: str) -> None:
+        self.stats[result] += 1
+        WEBHOOK_UPDATES.labels(result=result).inc()
+
+    # ------------------------------------------------------------------
+    # Приём
+    # ------------------------------------------------------------------
+
+    async def handle(self, request: web.Request) -> web.Response:
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), bot):
+            return web.Response(body="Unauthorized", status=401)
+        try:
+            update = await request.json(loads=bot.session.json_loads)
+        except ValueError:
+            return web.Response(body="Bad Request", status=400)
+
+        update_id = update.get("update_id")
+        if update_id is not None and update_id in self._seen:
+            self._count('duplicate')
+            return web.json_response({})
+
+        if not self._enqueue(bot, update):
+            # Telegram повторит доставку позже; update_id не запоминаем
+            self._count('rejected')
+            return web.Response(
+                status=429, text="Too Many Requests", headers={"Retry-After": str(self.config.retry_after)}
+            )
+        if update_id is not None:
+            self._seen.add(update_id)
+        return web.json_response({})
+
+    __call__ = handle
+
+    def _enqueue(self, bot: Bot, update: dict) -> bool:
+        """Кладёт апдейт в очередь; False — очередь заполнена важными апдейтами."""
+        priority = update_priority(update)
+        if self.queue_depth >= self.config.queue_size:
+            if priority == PRIORITY_LOW:
+                self._count('shed')
+                return True  # Сброшен намеренно — повтор от Telegram не нужен
+            if not self._queues[PRIORITY_LOW]:
+                return False
+            # Вытесняем самый старый второстепенный апдейт
+            self._queues[PRIORITY_LOW].popleft()
+            self._count('shed')
+        self._queues[priority].append((bot, update))
+        self._count('accepted')
+        WEBHOOK_QUEUE_DEPTH.set(self.queue_depth)
+        self._ensure_worker()
+        self._ready.set()
+        return True
+
+    # ------------------------------------------------------------------
+    # Обработка
+    # ------------------------------------------------------------------
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._drain())
+
+    def _next(self) -> Optional[Tuple[Bot, dict]]:
+        for queue in self._queues:
+            if queue:
+                return queue.popleft()
+        return None
+
+    async def _drain(self) -> None:
+        while True:
+            await self._slots.acquire()
+            item = self._next()
+            while item is None:
+                self._ready.clear()
+                await self._ready.wait()
+                item = self._next()
+            WEBHOOK_QUEUE_DEPTH.set(self.queue_depth)
+            bot, update = item
+            self._in_flight += 1
+            WEBHOOK_IN_FLIGHT.set(self._in_flight)
+            task = asyncio.create_task(self._process(bot, update))
+            self._background_feed_update_tasks.add(task)
+            task.add_done_callback(self._background_feed_update_tasks.discard)
+
+    async def _process(self, bot: Bot, update: dict) -> None:
+        # Место освобождается по завершении или раньше — пока апдейт ждёт очередь чата
+        slot = IngestSlot(self._release_slot)
+        try:
+            result = await self.dispatcher.feed_raw_update(bot=bot, update=update, ingest_slot=slot, **self.data)
+            if isinstance(result, TelegramMethod):
+                await self.dispatcher.silent_call_request(bot=bot, result=result)
+        except Exception as e:
+            logger.error(f"Error processing webhook update {update.get('update_id')}: {e}", exc_info=True)
+        finally:
+            slot.release()
+
+    def _release_slot(self) -> None:
+        self._in_flight -= 1
+        WEBHOOK_IN_FLIGHT.set(self._in_flight)
+        self._slots.release()
+
+    async def close(self) -> None:
+        """Дообрабатывает очередь (не дольше drain_timeout), затем закрывает сессию бота."""
+        deadline = asyncio.get_running_loop().time() + self.config.drain_timeout
+        while (self.queue_depth or self.processing) and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.1)
+        if self.queue_depth or self.processing:
+            logger.warning(
+                f"Webhook shutdown: {self.queue_depth} queued and {self.processing} running updates dropped"
+            )
+        if self._worker:
+            self._worker.cancel()
+        await super().close()
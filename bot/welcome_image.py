@@ -0,0 +1,104 @@
+"""
+Кэш file_id картинки приветствия.
+
+Первая отправка загружает файл в Telegram; file_id из ответа сохраняется
+в settings.json (welcome_image_file_id) вместе с SHA-256 содержимого файла,
+и дальше /start отправляет картинку по file_id — без повторной загрузки.
+Если содержимое файла изменилось (новая картинка, восстановлен бэкап),
+хэш не совпадёт и картинка будет загружена заново.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Awaitable, Callable, Optional, Union
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, InputFile, Message
+
+from bot.config import SETTINGS_FILE, load_json, save_json
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WELCOME_IMAGE_PATH = "bot/assets/welcome.jpg"
+SETTINGS_KEY = "welcome_image_file_id"
+
+# (путь, mtime, размер) → хэш; чтобы не читать файл на каждый /start
+_digests: dict = {}
+# Последний известный {"sha256", "file_id"} (копия из settings.json)
+_cached: dict = {}
+# Пока идёт первая загрузка, остальные /start ждут её file_id
+_upload_lock = asyncio.Lock()
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 содержимого файла (с кэшем по mtime и размеру)."""
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    digest = _digests.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+        _digests.clear()
+        _digests[key] = digest
+    return digest
+
+
+def _cached_file_id(digest: str) -> Optional[str]:
+    if not _cached:
+        _cached.update(load_json(SETTINGS_FILE, default_data={}).get(SETTINGS_KEY) or {})
+    if _cached.get("sha256") == digest:
+        return _cached.get("file_id")
+    return None
+
+
+def remember_file_id(digest: str, file_id: str) -> None:
+    """Сохраняет file_id картинки с данным хэшем."""
+    _cached.clear()
+    _cached.update({"sha256": digest, "file_id": file_id})
+    settings = load_json(SETTINGS_FILE, default_data={})
+    if settings.get(SETTINGS_KEY) != _cached:
+        settings[SETTINGS_KEY] = dict(_cached)
+        save_json(SETTINGS_FILE, settings)
+
+
+def forget_file_id() -> None:
+    """Сбрасывает кэш (картинка заменена)."""
+    _cached.clear()
+    _digests.clear()
+    settings = load_json(SETTINGS_FILE, default_data={})
+    if settings.pop(SETTINGS_KEY, None) is not None:
+        save_json(SETTINGS_FILE, settings)
+
+
+async def send_welcome_photo(
+    send: Callable[[Union[str, InputFile]], Awaitable[Message]],
+    image_path: str,
+) -> Message:
+    """
+    Отправляет картинку приветствия через send(photo): по file_id, если он есть,
+    иначе загружает файл и запоминает file_id.
+
+    Исключения отправки (и отсутствие файла — OSError) пробрасываются.
+    """
+    digest = file_digest(image_path)
+    file_id = _cached_file_id(digest)
+    if file_id:
+        try:
+            return await send(file_id)
+        except TelegramBadRequest as e:
+            # file_id мог стать недействительным (например, другой токен бота)
+            logger.warning(f"Cached welcome image file_id rejected, re-uploading: {e}")
+            forget_file_id()
+
+    async with _upload_lock:
+        file_id = _cached_file_id(digest)
+        if file_id:
+            return await send(file_id)
+        message = await send(FSInputFile(image_path))
+        if message.photo:
+            remember_file_id(digest, message.photo[-1].file_id)
+        return message
@@ -10,17 +10,31 @@ Aunt Polly Bot - Telegram бот с улучшенной защитой.
 """
 import asyncio
 import logging
+import signal
 import sys
 from aiohttp import web
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
-from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiogram.webhook.aiohttp_server import setup_application
 
 from bot import config
 from bot.handlers import start, user_messages, admin_reply, faq, admin_panel, group_messages
+from bot.handlers.group_messages import BotIdentity
 from bot.backup_manager import run_daily_backup_loop
 from bot.rate_limiter import RateLimiter, RateLimitMiddleware, RateLimitConfig
+from bot.album import AlbumMiddleware, AlbumConfig
+from bot.update_executor import UpdateExecutorMiddleware, UpdateExecutorConfig
+from bot.webhook_ingest import WebhookIngestHandler, WebhookIngestConfig
+from bot.ai_dispatcher import ai_dispatcher, AIDispatcherConfig
+from bot.ai_memory import conversation_memory, ConversationMemoryConfig
+from bot.broadcast import broadcast_engine, BroadcastConfig
+from bot.admin_notifier import admin_notifier, AdminNotifierConfig
+from bot.send_scheduler import send_scheduler, SendSchedulerConfig, SendSchedulerMiddleware
+from bot.shared_state import shared_state
+from bot.fsm.storage import SharedStateStorage
+from bot.user_manager import assign_missing_seq, flush_user_activity, run_activity_flush_loop, save_activity
+from bot.metrics import registry as metrics_registry
 
 # Логгер
 logger = logging.getLogger(__name__)
@@ -42,13 +56,117 @@ def setup_rate_limiter() -> RateLimiter:
         auto_ban_duration=int(config.load_json(config.SETTINGS_FILE, {}).get('auto_ban_duration', 3600)),
     )
     
-    limiter = RateLimiter(rate_config)
+    # Баны и глобальный лимит — общие для всех процессов бота (если настроен STATE_BACKEND_URL)
+    limiter = RateLimiter(rate_config, state=shared_state)
     logger.info(f"Rate limiter configured: {rate_config.user_rate} req/sec per user, {rate_config.global_rate} req/sec global")
     return limiter
 
 
-async def on_startup(bot: Bot) -> None:
+def setup_update_executor() -> UpdateExecutorMiddleware:
+    """Порядок обработки: апдейты одного чата — по очереди, разных чатов — параллельно."""
+    settings = config.load_json(config.SETTINGS_FILE, {})
+    return UpdateExecutorMiddleware(UpdateExecutorConfig(
+        # Общий лимит одновременно обрабатываемых апдейтов
+        max_concurrency=int(settings.get('update_max_concurrency', 64)),
+        # Очередь одного чата: дальше апдейты (флуд) сбрасываются
+        max_pending_per_key=int(settings.get('update_max_pending_per_chat', 16)),
+    ))
+
+
+def setup_webhook_ingest() -> WebhookIngestConfig:
+    """Приём апдейтов webhook: дедупликация по update_id и ограниченная очередь."""
+    settings = config.load_json(config.SETTINGS_FILE, {})
+    return WebhookIngestConfig(
+        # Сверх этого второстепенные апдейты сбрасываются, важные получают 429
+        queue_size=int(settings.get('webhook_queue_size', 1000)),
+        max_in_flight=int(settings.get('webhook_max_in_flight', 128)),
+    )
+
+
+def setup_album_middleware() -> AlbumMiddleware:
+    """Сборка альбомов в личных сообщениях: одна обработка на альбом."""
+    settings = config.load_json(config.SETTINGS_FILE, {})
+    return AlbumMiddleware(AlbumConfig(
+        # Ждём следующую часть альбома не дольше этого
+        latency=float(settings.get('album_latency', 0.6)),
+        max_wait=float(settings.get('album_max_wait', 3.0)),
+    ))
+
+
+def setup_ai_dispatcher() -> None:
+    """Настройка диспетчера ИИ (лимит параллельных запросов и очередь)."""
+    settings = config.load_json(config.SETTINGS_FILE, {})
+    ai_dispatcher.configure(AIDispatcherConfig(
+        # Одновременных запросов к провайдеру ИИ
+        max_concurrency=int(settings.get('ai_max_concurrency', 4)),
+        # После этого ожидания пользователь получает резервный ответ
+        max_queue_wait=float(settings.get('ai_max_queue_wait', 20)),
+        max_queue_size=int(settings.get('ai_max_queue_size', 200)),
+    ))
+    logger.info(
+        f"AI dispatcher configured: {ai_dispatcher.config.max_concurrency} concurrent, "
+        f"max wait {ai_dispatcher.config.max_queue_wait}s"
+    )
+
+
+def setup_conversation_memory() -> None:
+    """Настройка памяти диалогов ИИ."""
+    settings = config.load_json(config.SETTINGS_FILE, {})
+    conversation_memory.configure(ConversationMemoryConfig(
+        # Реплик (вопрос + ответ), которые помнит ИИ
+        max_turns=int(settings.get('ai_memory_turns', 6)),
+        # Бюджет токенов истории в одном запросе
+        token_budget=int(settings.get('ai_memory_token_budget', 1500)),
+        # Забываем диалог после 30 минут простоя
+        idle_ttl=float(settings.get('ai_memory_idle_ttl', 1800)),
+        # Общий лимит памяти (токенов), дальше — LRU-вытеснение
+        global_token_cap=int(settings.get('ai_memory_global_cap', 2_000_000)),
+    ))
+
+
+def setup_broadcast() -> None:
+    """Настройка движка рассылки (темп задаёт планировщик отправки)."""
+    settings = config.load_json(config.SETTINGS_FILE, {})
+    broadcast_engine.configure(BroadcastConfig(
+        workers=int(settings.get('broadcast_workers', 8)),
+        progress_interval=float(settings.get('broadcast_progress_interval', 5)),
+    ))
+
+
+def setup_send_scheduler() -> None:
+    """Настройка общего планировщика отправки (глобальный лимит и лимиты чатов)."""
+    settings = config.load_json(config.SETTINGS_FILE, {})
+    send_scheduler.configure(SendSchedulerConfig(
+        # Глобальный лимит Telegram ~30 сообщений/сек — держим запас
+        global_rate=float(settings.get('send_global_rate', 28)),
+        # В один личный чат ~1 сообщение/сек, в группу ~20 в минуту
+        chat_rate=float(settings.get('send_chat_rate', 1.0)),
+        group_rate=float(settings.get('send_group_rate_per_minute', 20)) / 60,
+    ))
+
+
+def setup_admin_notifier() -> None:
+    """Настройка очереди уведомлений админу (темп чата задаёт планировщик отправки)."""
+    settings = config.load_json(config.SETTINGS_FILE, {})
+    admin_notifier.configure(AdminNotifierConfig(
+        # Сколько секунд после отправки уведомление можно дополнять правкой
+        coalesce_window=float(settings.get('admin_notify_coalesce_window', 60)),
+    ))
+
+
+async def on_startup(bot: Bot, dispatcher: Dispatcher) -> None:
     """Действия при запуске: установка вебхука, если нужно."""
+    # Данные бота (id, username) — один раз, для распознавания обращений в группе
+    dispatcher["bot_identity"] = BotIdentity.from_user(await bot.me())
+    logger.info(f"Bot identity: @{dispatcher['bot_identity'].username} ({dispatcher['bot_identity'].id})")
+
+    # Порядковые номера для карт активности у записей из старых версий
+    await assign_missing_seq()
+
+    # Восстанавливаем память диалогов ИИ (если включено сохранение)
+    if config.load_json(config.SETTINGS_FILE, {}).get('ai_memory_persist', False):
+        conversation_memory.load()
+
     if config.BOT_MODE == "webhook":
         if not config.WEBHOOK_HOST:
             logger.critical("Webhook mode is enabled, but WEBHOOK_HOST is not set in .env")
@@ -57,7 +175,8 @@ async def on_startup(bot: Bot) -> None:
         # Параметры для set_webhook
         webhook_params = {
             "url": f"{config.WEBHOOK_HOST}{config.WEBHOOK_PATH}",
-            "drop_pending_updates": True,
+            # С несколькими процессами накопившиеся апдейты ждут остальные процессы
+            "drop_pending_updates": not shared_state.shared,
             # Разрешённые типы обновлений (оптимизация)
             "allowed_updates": ["message", "callback_query"],
         }
@@ -69,8 +188,18 @@ async def on_startup(bot: Bot) -> None:
         else:
             logger.warning("⚠️ WEBHOOK_SECRET_TOKEN не задан — рекомендуется установить!")
         
-        await bot.set_webhook(**webhook_params)
-        logger.info(f"Webhook set to {config.WEBHOOK_HOST}{config.WEBHOOK_PATH}")
+        # При одновременном старте нескольких процессов webhook устанавливает один
+        if await shared_state.acquire_lease("set_webhook", ttl=60):
+            await bot.set_webhook(**webhook_params)
+            logger.info(f"Webhook set to {config.WEBHOOK_HOST}{config.WEBHOOK_PATH}")
+        else:
+            logger.info("Webhook is being set by another bot process")
+
+    # Продолжаем рассылку, прерванную перезапуском
+    await broadcast_engine.restore(bot)
+
+    # Активность из групп пишется в users.json раз в ACTIVITY_FLUSH_INTERVAL
+    bot._activity_flush_task = asyncio.create_task(run_activity_flush_loop())
 
     # Ежедневный бэкап
     if config.ADMIN_ID:
@@ -83,13 +212,35 @@ async def on_startup(bot: Bot) -> None:
 async def on_shutdown(bot: Bot) -> None:
     """Действия при остановке."""
     if config.BOT_MODE == "webhook":
-        logger.info("Shutting down... Deleting webhook.")
-        await bot.delete_webhook()
+        if shared_state.shared:
+            # Остальные процессы продолжают принимать апдейты
+            logger.info("Shutting down... Webhook kept for other bot processes.")
+        else:
+            logger.info("Shutting down... Deleting webhook.")
+            await bot.delete_webhook()
+
+    # Останавливаем фоновые задачи бэкапа и записи активности
+    for name in ("_daily_backup_task", "_activity_flush_task"):
+        task = getattr(bot, name, None)
+        if task:
+            task.cancel()
+
+    # Останавливаем рассылку (продолжится после запуска)
+    await broadcast_engine.stop()
 
-    # Останавливаем фоновую задачу бэкапа
-    task = getattr(bot, "_daily_backup_task", None)
-    if task:
-        task.cancel()
+    # Досылаем уведомления админу
+    await admin_notifier.stop()
+    await send_scheduler.stop()
+
+    # Сохраняем накопленную активность и карты активности пользователей
+    await flush_user_activity()
+    await save_activity(force=True)
+
+    # Сохраняем память диалогов ИИ (если включено)
+    if config.load_json(config.SETTINGS_FILE, {}).get('ai_memory_persist', False):
+        conversation_memory.save()
+
+    await shared_state.close()
 
 
 async def main() -> None:
@@ -99,7 +250,18 @@ async def main() -> None:
         token=config.BOT_TOKEN,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
-    dp = Dispatcher()
+    # Общее состояние процессов: FSM, баны, блокировки ИИ
+    shared_state.configure(config.STATE_BACKEND_URL)
+    dp = Dispatcher(storage=SharedStateStorage(shared_state) if shared_state.shared else None)
+
+    # Все отправки сообщений — через общий планировщик с приоритетами
+    setup_send_scheduler()
+    bot.session.middleware(SendSchedulerMiddleware(send_scheduler))
+
+    # Апдейты одного чата обрабатываются по очереди, разных — параллельно
+    update_executor = setup_update_executor()
+    dp.update.outer_middleware(update_executor)
+    dp["update_executor"] = update_executor
 
     # =========================================================================
     # ЗАЩИТА: Rate Limiting Middleware
@@ -115,6 +277,12 @@ async def main() -> None:
     
     logger.info("🛡️ Rate limiting middleware enabled")
 
+    # Лимит параллельных запросов к ИИ и память диалогов
+    setup_ai_dispatcher()
+    setup_conversation_memory()
+    setup_broadcast()
+    setup_admin_notifier()
+
     # =========================================================================
     # РОУТЕРЫ
     # =========================================================================
@@ -126,6 +294,9 @@ async def main() -> None:
     dp.include_router(group_messages.router)  # Группы
     dp.include_router(user_messages.router)   # Личные сообщения (последний!)
 
+    # Альбом пользователя — один вызов хэндлера (до rate limit и хэндлера)
+    user_messages.router.message.outer_middleware(setup_album_middleware())
+
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
 
@@ -140,12 +311,28 @@ async def main() -> None:
             stats = rate_limiter.get_stats()
             return web.json_response({
                 "status": "ok",
-                "rate_limiter": stats
+                "rate_limiter": stats,
+                "ai_dispatcher": ai_dispatcher.get_stats(),
+                "admin_notifier": admin_notifier.get_stats(),
+                "send_scheduler": send_scheduler.get_stats(),
+                "updates": update_executor.get_stats(),
+                "webhook": webhook_requests_handler.get_stats(),
+                "shared_state": shared_state.get_stats(),
             })
         
+        # Метрики в формате Prometheus
+        async def metrics(request):
+            return web.Response(text=metrics_registry.render(), content_type="text/plain")
+        
         app.router.add_get("/health", health_check)
+        app.router.add_get("/metrics", metrics)
         
-        webhook_requests_handler = SimpleRequestHandler(dispatcher=dp, bot=bot)
+        webhook_requests_handler = WebhookIngestHandler(
+            dispatcher=dp,
+            bot=bot,
+            secret_token=config.WEBHOOK_SECRET_TOKEN or None,
+            config=setup_webhook_ingest(),
+        )
         webhook_requests_handler.register(app, path=config.WEBHOOK_PATH)
         setup_application(app, dp, bot=bot)
         
@@ -153,9 +340,23 @@ async def main() -> None:
         await runner.setup()
         site = web.TCPSite(runner, host=config.WEB_SERVER_HOST, port=config.WEB_SERVER_PORT)
         
+        # SIGTERM (docker stop) и Ctrl+C: штатная остановка через runner.cleanup() —
+        # апдейты уже получили ответ 200, их нужно дообработать (on_shutdown)
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                pass  # Windows: остаётся KeyboardInterrupt
+
         logger.info(f"🌐 Bot starting in webhook mode on {config.WEB_SERVER_HOST}:{config.WEB_SERVER_PORT}")
         await site.start()
-        await asyncio.Event().wait()
+        try:
+            await stop_event.wait()
+        finally:
+            logger.info("🛑 Stopping webhook server...")
+            await runner.cleanup()
         
     elif config.BOT_MODE == "polling":
         await bot.delete_webhook(drop_pending_updates=True)